@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Кеш на резултатите от аудио анализа
+Речниците от analyze_vocal_activity / analyze_audio_structure се пазят като компресирани .npz файлове.
+Ключът е хешът на аудио файла плюс параметрите на анализа, така че при промяна само на текста
+синхронизацията тръгва директно от кеша, без да се изчисляват характеристиките наново.
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+from audio_cache import file_hash
+from profiling import profiled
+
+CACHE_DIR = '.analysis_cache'
+
+def cache_path(audio_file, params, cache_dir=CACHE_DIR):
+    """Връща пътя до .npz файла за даден аудио файл и параметри"""
+    params_key = hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{file_hash(audio_file)[:32]}_{params_key}.npz")
+
+@profiled('analysis_cache.load')
+def load_analysis(audio_file, params, cache_dir=CACHE_DIR):
+    """Зарежда кеширан анализ или връща None"""
+    path = cache_path(audio_file, params, cache_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            analysis = {}
+            for key in data.files:
+                value = data[key]
+                # Скаларите се записват като 0-мерни масиви
+                analysis[key] = value.item() if value.ndim == 0 else value
+            return analysis
+    except (OSError, ValueError):
+        return None
+
+@profiled('analysis_cache.save')
+def save_analysis(audio_file, params, analysis, cache_dir=CACHE_DIR):
+    """Записва анализа като компресиран .npz файл"""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(audio_file, params, cache_dir)
+    arrays = {key: np.asarray(value) for key, value in analysis.items() if value is not None}
+    tmp_path = path + f'.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+    return path
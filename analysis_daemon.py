@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Резидентен сървър за анализ (localhost HTTP, JSON)
+Държи в паметта импортираните librosa/moviepy, декодираното аудио, характеристиките,
+вокалния и структурния анализ, индекса на cue точките и мрежата от удари. Повторна
+синхронизация с други параметри отнема милисекунди, а рендирането на отрязък не плаща
+импорта на moviepy. Скриптовете имат режим --daemon, в който само изпращат заявка.
+
+Стартиране: python analysis_daemon.py [--port 8765] [--preload FakeNews.wav]
+
+Заявки (POST, JSON тяло, JSON отговор):
+    /analyze  {"audio", "profile", "stream"}
+    /sync     {"audio", "lyrics", "output", "profile", "stream", "beat_snap", "boundaries", "overwrite_edits",
+               "repair", "min_duration"}
+    /render   {"audio", "timeline", "output", "start", "end", "validate", "strict", "cache", "backend", "vfr",
+               "jobs", "chunk", "incremental", "render_profile"}
+    /status   (GET)
+    /shutdown
+
+Приемат се само заявки с Host 127.0.0.1:<port> или localhost:<port> (защита от DNS rebinding),
+POST заявките трябва да са с Content-Type: application/json (уеб страница не може да изпрати
+такава заявка към друг адрес без CORS), а output и timeline трябва да са в работната директория
+на сървъра.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_URL = f'http://{DEFAULT_HOST}:{DEFAULT_PORT}'
+
+class DaemonError(Exception):
+    """Грешка, върната от сървъра (или липсващ сървър)"""
+
+class ForbiddenPath(ValueError):
+    """Път извън работната директория на сървъра"""
+
+def confine(path, root=None):
+    """Абсолютният път, ако е в root (работната директория); иначе ForbiddenPath"""
+    root = os.path.realpath(root or os.getcwd())
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ForbiddenPath(f"Пътят е извън работната директория на сървъра ({root}): {path}")
+    return resolved
+
+class AnalysisState:
+    """Анализите в паметта, по (файл, хеш, профил, поточен режим)"""
+    
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+    
+    def key(self, audio_file, profile, streaming):
+        from audio_cache import file_hash
+        return (os.path.abspath(audio_file), file_hash(audio_file), profile, bool(streaming))
+    
+    def get(self, audio_file, profile, streaming):
+        """Връща (и при нужда изчислява) вокалния и структурния анализ за файла"""
+        key = self.key(audio_file, profile, streaming)
+        if key not in self.entries:
+            from analyze_audio import analyze_audio_structure
+            from beat_grid import load_beat_grid
+            from cue_index import CueIndex
+            from sync_lyrics import analyze_vocal_activity
+            vocal = analyze_vocal_activity(audio_file, streaming=streaming, profile=profile)
+            structure = analyze_audio_structure(audio_file, streaming=streaming, profile=profile)
+            self.entries[key] = {
+                'vocal': vocal,
+                'structure': structure,
+                'cue_index': CueIndex.from_analysis(vocal),
+                'beat_grid': load_beat_grid(audio_file, profile)
+            }
+        return self.entries[key]
+
+def handle_analyze(state, payload):
+    """Анализ (или само затопляне на кеша в паметта) на аудио файл"""
+    from analysis_profiles import DEFAULT_PROFILE
+    entry = state.get(payload['audio'], payload.get('profile', DEFAULT_PROFILE), payload.get('stream', False))
+    vocal = entry['vocal']
+    return {
+        'duration': float(vocal['duration']),
+        'tempo': float(entry['structure']['tempo']),
+        'onsets': int(len(vocal['onset_times'])),
+        'vocal_peaks': int(len(vocal['vocal_peaks'])),
+        'beats': int(len(entry['structure']['beat_times']))
+    }
+
+def handle_sync(state, payload):
+    """Синхронизация на текста с анализа от паметта и записване на таймлайна"""
+    from analysis_profiles import DEFAULT_PROFILE
+    from sync_lyrics import (assign_sections, lyrics_file_structure, lyrics_section_boundaries, sync_lyrics_with_audio,
+                             write_timeline)
+    output_file = payload.get('output')
+    if output_file:
+        output_file = confine(output_file)
+    entry = state.get(payload['audio'], payload.get('profile', DEFAULT_PROFILE), payload.get('stream', False))
+    lyrics_file = payload.get('lyrics', 'Lyrics.md')
+    boundaries = payload.get('boundaries')
+    if boundaries is None:
+        boundaries = lyrics_section_boundaries(entry['structure'], lyrics_file)
+    
+    timeline = sync_lyrics_with_audio(entry['vocal'], lyrics_file, boundaries,
+                                      entry['beat_grid'], float(payload.get('beat_snap', 0.1)))
+    assign_sections(timeline, lyrics_file_structure(lyrics_file))
+    
+    from timeline_validation import VALIDATION_PARAMS, errors, print_issues, repair_timeline, validate_timeline
+    duration = entry['vocal']['duration']
+    params = {'min_duration': float(payload.get('min_duration', VALIDATION_PARAMS['min_duration']))}
+    issues = validate_timeline(timeline, duration, params)
+    if payload.get('repair') and errors(issues):
+        timeline, _ = repair_timeline(timeline, duration, entry['cue_index'], params)
+        issues = validate_timeline(timeline, duration, params)
+    print_issues(issues)
+    if output_file:
+        changes = write_timeline(timeline, output_file, entry['vocal']['duration'],
+                                 overwrite_edits=bool(payload.get('overwrite_edits', False)))
+        # Отговорът описва записания таймлайн (със запазените ръчни редакции)
+        timeline = changes.pop('timeline')
+        if changes['edited']:
+            issues = validate_timeline(timeline, duration, params)
+    else:
+        changes = None
+    return {
+        'output': output_file,
+        'changes': changes,
+        'issues': issues,
+        'timeline': [{'line': e['line'], 'start': e['start'], 'end': e['end'], 'section': e.get('section_id', e.get('section'))}
+                     for e in timeline]
+    }
+
+def handle_render(state, payload):
+    """Рендиране на видеоклип или на отрязък от него (start/end в секунди)"""
+    from create_video_simple import create_sample_video
+    from render_profiles import DEFAULT_RENDER_PROFILE
+    segment = None
+    if payload.get('start') is not None or payload.get('end') is not None:
+        segment = (float(payload.get('start') or 0.0), payload.get('end'))
+    output_file = confine(payload.get('output', 'FakeNews_Sample.mp4'))
+    timeline_file = confine(payload.get('timeline', 'Timeline.md'))
+    create_sample_video(payload['audio'], timeline_file, output_file, segment=segment,
+                        validate=payload.get('validate', True), use_cache=payload.get('cache', True),
+                        backend=payload.get('backend', 'moviepy'), vfr=payload.get('vfr', False),
+                        jobs=int(payload.get('jobs', 1)), chunk=payload.get('chunk'),
+                        incremental=payload.get('incremental', False),
+                        render_profile=payload.get('render_profile', DEFAULT_RENDER_PROFILE),
+                        strict=payload.get('strict', False))
+    return {'output': output_file}
+
+def handle_status(state, payload):
+    """Какво е заредено в паметта"""
+    return {
+        'uptime': time.time() - state.started,
+        'requests': state.requests,
+        'loaded': [{'audio': key[0], 'profile': key[2], 'stream': key[3]} for key in state.entries]
+    }
+
+HANDLERS = {
+    '/analyze': handle_analyze,
+    '/sync': handle_sync,
+    '/render': handle_render,
+    '/status': handle_status
+}
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    """JSON заявки към AnalysisState (изпълняват се една по една)"""
+    
+    def send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def allowed(self, post=False):
+        """Проверява Host, Origin и (за POST) Content-Type; при отказ изпраща 403/415"""
+        port = self.server.server_address[1]
+        hosts = {f'127.0.0.1:{port}', f'localhost:{port}'}
+        if self.headers.get('Host', '') not in hosts:
+            self.send_json(403, {'error': f"Непозволен Host: {self.headers.get('Host')}"})
+            return False
+        origin = self.headers.get('Origin')
+        if origin is not None and origin not in {f'http://{host}' for host in hosts}:
+            self.send_json(403, {'error': f'Непозволен Origin: {origin}'})
+            return False
+        if post and self.headers.get_content_type() != 'application/json':
+            self.send_json(415, {'error': 'Очаква се Content-Type: application/json'})
+            return False
+        return True
+    
+    def do_GET(self):
+        if not self.allowed():
+            return
+        if self.path == '/status':
+            self.send_json(200, handle_status(self.server.state, {}))
+        else:
+            self.send_json(404, {'error': f'Непознат адрес: {self.path}'})
+    
+    def do_POST(self):
+        if not self.allowed(post=True):
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as e:
+            self.send_json(400, {'error': f'Невалиден JSON: {e}'})
+            return
+        
+        if self.path == '/shutdown':
+            self.send_json(200, {'ok': True})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return
+        handler = HANDLERS.get(self.path)
+        if handler is None:
+            self.send_json(404, {'error': f'Непознат адрес: {self.path}'})
+            return
+        
+        state = self.server.state
+        t0 = time.perf_counter()
+        try:
+            # Анализите споделят кешовете в паметта, затова заявките се изпълняват последователно
+            with state.lock:
+                state.requests += 1
+                result = handler(state, payload)
+        except ForbiddenPath as e:
+            self.send_json(403, {'error': str(e)})
+            return
+        except Exception as e:
+            traceback.print_exc()
+            self.send_json(500, {'error': f"{type(e).__name__}: {e}"})
+            return
+        result['seconds'] = time.perf_counter() - t0
+        self.send_json(200, result)
+    
+    def log_message(self, format, *args):
+        print(f"[{self.log_date_time_string()}] {format % args}")
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, preload=None):
+    """Стартира сървъра (блокира до /shutdown или Ctrl+C)"""
+    server = ThreadingHTTPServer((host, port), DaemonHandler)
+    server.state = AnalysisState()
+    
+    # Тежките библиотеки се импортират веднъж при старта, а не при всяка заявка
+    import audio_features
+    try:
+        import moviepy.editor
+    except ImportError:
+        print("ВНИМАНИЕ: moviepy не е инсталиран - /render няма да работи")
+    
+    from analysis_profiles import DEFAULT_PROFILE
+    for audio_file in preload or []:
+        print(f"Предварително зареждане: {audio_file}")
+        server.state.get(audio_file, DEFAULT_PROFILE, False)
+    
+    print(f"Сървърът слуша на http://{host}:{port} (Ctrl+C за спиране)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    print("Сървърът е спрян")
+
+def request(path, payload=None, url=DEFAULT_URL, timeout=3600):
+    """Изпраща заявка към сървъра и връща JSON отговора (хвърля DaemonError при грешка)"""
+    data = json.dumps(payload or {}).encode('utf-8')
+    req = urllib.request.Request(url.rstrip('/') + path, data=data,
+                                 headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.loads(e.read().decode('utf-8')).get('error', str(e))
+        except ValueError:
+            message = str(e)
+        raise DaemonError(message)
+    except urllib.error.URLError as e:
+        raise DaemonError(f"Няма връзка със сървъра на {url} ({e.reason}). "
+                          f"Стартирай го с: python analysis_daemon.py")
+
+def add_daemon_argument(parser):
+    """Добавя --daemon [URL] към argparse парсер"""
+    parser.add_argument('--daemon', nargs='?', const=DEFAULT_URL, metavar='URL',
+                        help=f'изпращане на заявката към analysis_daemon.py (по подразбиране {DEFAULT_URL})')
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Резидентен сървър за анализ и синхронизация')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--preload', nargs='*', default=[], metavar='AUDIO',
+                        help='аудио файлове за анализ при старта')
+    parser.add_argument('--stop', action='store_true', help='спиране на работещ сървър')
+    parser.add_argument('--status', action='store_true', help='състояние на работещ сървър')
+    args = parser.parse_args(argv)
+    
+    url = f'http://{args.host}:{args.port}'
+    if args.stop or args.status:
+        try:
+            result = request('/shutdown' if args.stop else '/status', url=url)
+        except DaemonError as e:
+            print(f"ГРЕШКА: {e}")
+            return 1
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+        return 0
+    
+    serve(args.host, args.port, args.preload)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
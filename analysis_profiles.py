@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Профили на аудио анализа (резолюция срещу скорост)
+Всеки профил задава sample rate, размер на прозореца и hop, dtype на сигнала и качеството
+на resampling. Всички характеристики, които използваме (RMS, centroid, ZCR, onsets, beats),
+работят добре на 22.05 kHz моно, така че по подразбиране не се анализира в пълна резолюция.
+"""
+
+DEFAULT_PROFILE = 'standard'
+
+# sample_rate None означава native sample rate на файла (без resampling)
+PROFILES = {
+    'draft': {
+        'sample_rate': 16000,
+        'n_fft': 1024,
+        'hop_length': 512,
+        'dtype': 'float32',
+        'res_type': 'soxr_lq'
+    },
+    'standard': {
+        'sample_rate': 22050,
+        'n_fft': 1024,
+        'hop_length': 256,
+        'dtype': 'float32',
+        'res_type': 'soxr_hq'
+    },
+    'precise': {
+        'sample_rate': None,
+        'n_fft': 2048,
+        'hop_length': 256,
+        'dtype': 'float64',
+        'res_type': None
+    }
+}
+
+def get_profile(name=DEFAULT_PROFILE):
+    """Връща параметрите на профила (копие, за да не се променя таблицата)"""
+    if name not in PROFILES:
+        raise ValueError(f"Непознат профил на анализа: {name} (възможни: {', '.join(PROFILES)})")
+    return dict(PROFILES[name])
+
+def profile_names():
+    """Имената на профилите, започвайки с профила по подразбиране"""
+    return [DEFAULT_PROFILE] + [name for name in PROFILES if name != DEFAULT_PROFILE]
+
+def add_profile_argument(parser):
+    """Добавя --analysis-profile към argparse парсер"""
+    parser.add_argument('--analysis-profile', choices=list(PROFILES), default=DEFAULT_PROFILE,
+                        help=f'профил на анализа: draft (бърз), standard, precise (native sample rate) '
+                             f'(по подразбиране {DEFAULT_PROFILE})')
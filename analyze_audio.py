@@ -3,104 +3,157 @@
 Скрипт за анализ на аудио файл и създаване на таймкодове за музикално видео
 """
 
-import librosa
+import sys
 import numpy as np
-from datetime import timedelta
+from analysis_cache import load_analysis, save_analysis
+from segmentation import novelty_curve, segment_song
+from beat_grid import load_beat_grid, save_beat_grid, snap_timeline
+from analysis_profiles import DEFAULT_PROFILE, add_profile_argument, get_profile
+from profiling import add_timing_arguments, configure, profiled, report, stage
+from analysis_daemon import DaemonError, add_daemon_argument, request
+from timeline_format import format_time
+from timeline_writer import add_timeline_arguments, write_timeline
+from timeline_validation import add_validation_arguments, apply_validation
 
-def format_time(seconds):
-    """Форматира секунди в MM:SS.mmm формат"""
-    td = timedelta(seconds=seconds)
-    total_seconds = int(td.total_seconds())
-    minutes = total_seconds // 60
-    seconds = total_seconds % 60
-    milliseconds = int((td.total_seconds() - total_seconds) * 1000)
-    return f"{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+# Версия на структурния анализ - увеличава се при промяна, за да се инвалидира кешът
+STRUCTURE_ANALYSIS_VERSION = 6
 
-def analyze_audio_structure(audio_file):
-    """Анализира структурата на аудио файла"""
+@profiled('analyze_audio_structure')
+def analyze_audio_structure(audio_file, streaming=False, use_cache=True, profile=DEFAULT_PROFILE):
+    """Анализира структурата на аудио файла (streaming=True за поточен анализ с ограничена памет)"""
     print(f"Зареждане на аудио файл: {audio_file}...")
     
-    # Зареждане на аудио файла
-    y, sr = librosa.load(audio_file, sr=None)
-    duration = librosa.get_duration(y=y, sr=sr)
+    params = get_profile(profile)
+    hop_length = params['hop_length']
+    cache_params = {
+        'analysis': 'structure',
+        'version': STRUCTURE_ANALYSIS_VERSION,
+        'profile': profile,
+        'streaming': streaming
+    }
+    cache_params.update(params)
+    
+    # Ако аудиото не е променено, анализът идва директно от кеша
+    if use_cache:
+        cached = load_analysis(audio_file, cache_params)
+        if cached is not None:
+            print(f"Анализът е зареден от кеша ({format_time(cached['duration'])}, {cached['tempo']:.2f} BPM)")
+            return cached
+    
+    from audio_features import get_profile_features, normalize, beat_sync_features
+    
+    # Зареждане на аудио и извличане на характеристиките от една STFT
+    features = get_profile_features(audio_file, params, streaming=streaming)
+    duration = features['duration']
+    sr = features['sample_rate']
     
     print(f"Продължителност: {format_time(duration)}")
-    print(f"Sample rate: {sr} Hz")
-    
-    # Изчисляване на темпото
-    tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
-    # Конвертиране на tempo в скалар, ако е масив
-    if isinstance(tempo, np.ndarray):
-        tempo_value = float(tempo.item()) if tempo.size > 0 else float(tempo[0])
-    elif isinstance(tempo, (list, tuple)):
-        tempo_value = float(tempo[0]) if len(tempo) > 0 else 120.0
-    else:
-        tempo_value = float(tempo)
+    print(f"Sample rate: {sr} Hz (профил {profile})")
+    
+    # Темпото идва от общия onset envelope
+    tempo_value = features['tempo']
     print(f"Темпо (BPM): {tempo_value:.2f}")
     
+    # Мрежата от удари се записва, за да не се пуска beat tracking във всеки скрипт
+    save_beat_grid(audio_file, features['beat_times'], features['onset_env'][features['beat_frames']], tempo_value,
+                   profile)
+    
     # Анализ на енергията за идентифициране на секции
     # Използваме спектралния център и rolloff за да идентифицираме промени
-    spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
-    spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)[0]
-    
-    # Нормализиране
-    spectral_centroids = (spectral_centroids - np.min(spectral_centroids)) / (np.max(spectral_centroids) - np.min(spectral_centroids))
-    spectral_rolloff = (spectral_rolloff - np.min(spectral_rolloff)) / (np.max(spectral_rolloff) - np.min(spectral_rolloff))
+    spectral_centroids = normalize(features['spectral_centroid'])
+    spectral_rolloff = normalize(features['spectral_rolloff'])
     
     # Комбинирана метрика за промени в структурата
     combined = (spectral_centroids + spectral_rolloff) / 2
     
     # Намиране на промени (вероятни граници на секции)
-    frame_length = 2048
-    hop_length = 512
-    times = librosa.frames_to_time(np.arange(len(combined)), sr=sr, hop_length=hop_length)
+    times = features['times']
     
-    # Изчисляване на RMS енергия за по-добро разпознаване на секции
-    rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length)[0]
-    rms_normalized = (rms - np.min(rms)) / (np.max(rms) - np.min(rms))
+    # RMS енергия за по-добро разпознаване на секции
+    rms_normalized = normalize(features['rms'])
     
-    return {
+    # Chroma + MFCC по удари и novelty крива за структурната сегментация
+    print("Анализ на структурата (self-similarity по удари)...")
+    with stage('analyze_audio_structure.beat_sync'):
+        beat_features, beat_starts, beat_energy = beat_sync_features(features)
+    with stage('analyze_audio_structure.novelty'):
+        novelty = novelty_curve(beat_features)
+    
+    analysis = {
         'duration': duration,
         'tempo': tempo_value,
+        'beat_times': features['beat_times'],
         'times': times,
         'rms': rms_normalized,
         'spectral_centroids': spectral_centroids,
+        'beat_starts': beat_starts,
+        'beat_features': beat_features,
+        'beat_energy': beat_energy,
+        'novelty': novelty,
         'sample_rate': sr,
         'hop_length': hop_length
     }
+    
+    if use_cache:
+        save_analysis(audio_file, cache_params, analysis)
+    
+    return analysis
 
-def estimate_sections(analysis, lyrics_structure):
-    """Оценява секциите на песента въз основа на анализа и структурата на текста"""
+@profiled('estimate_sections')
+def estimate_sections(analysis, lyrics_structure=None):
+    """Оценява секциите на песента въз основа на анализа и структурата на текста
+    
+    Границите идват от novelty кривата на self-similarity по удари. Ако е подадена
+    структурата на текста, се търсят точно толкова секции, колкото са в нея.
+    """
     duration = analysis['duration']
     times = analysis['times']
     rms = analysis['rms']
     
-    # Намиране на пикове в енергията (вероятни припеви)
-    from scipy.signal import find_peaks
-    peaks, properties = find_peaks(rms, height=0.5, distance=len(rms)//10)
-    peak_times = times[peaks]
-    
-    # Оценка на структурата въз основа на текста
-    # Имаме: Встъп, Верс 1, Припев 1, Интерлюд, Верс 2, Припев 2, Припев 3, Финал
+    n_sections = len(lyrics_structure) if lyrics_structure else None
+    sections = segment_song(
+        analysis['beat_features'],
+        analysis['beat_starts'],
+        analysis['beat_energy'],
+        duration,
+        n_sections=n_sections,
+        novelty=analysis['novelty']
+    )
     
-    sections = []
-    
-    # Ако знаем приблизителната структура, можем да я използваме
-    # За сега ще създадем базова структура въз основа на енергията
-    
-    # Намиране на точки с ниска енергия (вероятни версове или интерлюди)
-    valleys, _ = find_peaks(-rms, height=-0.3, distance=len(rms)//10)
-    valley_times = times[valleys]
+    # Пикове (вероятни припеви) и долини (версове/интерлюди) в енергията на секциите
+    peak_times = np.array([s['start'] for s in sections if s['kind'] == 'chorus'])
+    valley_times = np.array([s['start'] for s in sections if s['kind'] in ('verse', 'interlude')])
     
     return {
+        'sections': sections,
+        'boundaries': np.array([s['start'] for s in sections[1:]]),
         'peaks': peak_times,
         'valleys': valley_times,
         'rms_times': times,
         'rms_values': rms
     }
 
-def create_timeline(analysis, lyrics_file):
-    """Създава таймлайн с таймкодове за всеки ред от текста"""
+# Структура на текста с приблизителни продължителности (fallback, ако сегментацията не успее)
+# Те ще бъдат мащабирани спрямо реалната продължителност
+SONG_STRUCTURE = [
+    {'type': 'intro', 'lines': 1, 'base_duration': 3.0},  # Встъп
+    {'type': 'verse1', 'lines': 16, 'base_duration': 50.0},  # Верс 1 (16 реда)
+    {'type': 'chorus1', 'lines': 2, 'base_duration': 8.0},  # Припев 1
+    {'type': 'interlude', 'lines': 1, 'base_duration': 6.0},  # Интерлюд
+    {'type': 'verse2', 'lines': 8, 'base_duration': 25.0},  # Верс 2 (8 реда)
+    {'type': 'chorus2', 'lines': 2, 'base_duration': 8.0},  # Припев 2
+    {'type': 'chorus3', 'lines': 2, 'base_duration': 8.0},  # Припев 3
+    {'type': 'outro', 'lines': 1, 'base_duration': 5.0},  # Финал
+]
+
+@profiled('create_timeline')
+def create_timeline(analysis, lyrics_file, sections=None, beat_grid=None, snap_tolerance=0.1):
+    """Създава таймлайн с таймкодове за всеки ред от текста
+    
+    Ако са подадени открити секции (по една за всяка секция от текста), редовете се
+    разпределят в техните граници; иначе се използват приблизителните продължителности.
+    Ако е подадена мрежа от удари, началата и краищата се прилепват към нея.
+    """
     # Прочитане на текста
     with open(lyrics_file, 'r', encoding='utf-8') as f:
         lines = f.readlines()
@@ -116,19 +169,24 @@ def create_timeline(analysis, lyrics_file):
     
     timeline = []
     current_time = 0
+    structure = SONG_STRUCTURE
     
-    # Дефиниране на структурата с приблизителни продължителности
-    # Те ще бъдат мащабирани спрямо реалната продължителност
-    structure = [
-        {'type': 'intro', 'lines': 1, 'base_duration': 3.0},  # Встъп
-        {'type': 'verse1', 'lines': 16, 'base_duration': 50.0},  # Верс 1 (16 реда)
-        {'type': 'chorus1', 'lines': 2, 'base_duration': 8.0},  # Припев 1
-        {'type': 'interlude', 'lines': 1, 'base_duration': 6.0},  # Интерлюд
-        {'type': 'verse2', 'lines': 8, 'base_duration': 25.0},  # Верс 2 (8 реда)
-        {'type': 'chorus2', 'lines': 2, 'base_duration': 8.0},  # Припев 2
-        {'type': 'chorus3', 'lines': 2, 'base_duration': 8.0},  # Припев 3
-        {'type': 'outro', 'lines': 1, 'base_duration': 5.0},  # Финал
-    ]
+    # Открити граници на секциите - редовете на всяка секция се разпределят равномерно в нея
+    if sections and len(sections) == len(structure):
+        line_index = 0
+        for section, detected in zip(structure, sections):
+            lines_in_section = section['lines']
+            time_per_line = (detected['end'] - detected['start']) / lines_in_section
+            for j in range(lines_in_section):
+                if line_index < len(lyrics_lines):
+                    timeline.append({
+                        'line': lyrics_lines[line_index],
+                        'start': detected['start'] + j * time_per_line,
+                        'end': detected['start'] + (j + 1) * time_per_line,
+                        'section': section['type']
+                    })
+                    line_index += 1
+        return snap_timeline(timeline, beat_grid, snap_tolerance)
     
     # Изчисляване на общата базова продължителност
     total_base_duration = sum(s['base_duration'] for s in structure)
@@ -179,19 +237,51 @@ def create_timeline(analysis, lyrics_file):
         if timeline:
             timeline[-1]['end'] = duration
     
-    return timeline
+    return snap_timeline(timeline, beat_grid, snap_tolerance)
 
-def main():
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Анализ на аудио файл за таймкодове')
+    parser.add_argument('--stream', action='store_true',
+                        help='поточен анализ на блокове (за дълги записи, паметта не расте с дължината)')
+    parser.add_argument('--no-cache', action='store_true', help='анализ наново, без кеша на характеристиките')
+    add_profile_argument(parser)
+    parser.add_argument('--beat-snap', type=float, default=0.1, metavar='SECONDS',
+                        help='прилепване към удар в рамките на SECONDS (0 изключва, по подразбиране 0.1)')
+    add_timeline_arguments(parser)
+    add_validation_arguments(parser)
+    add_daemon_argument(parser)
+    add_timing_arguments(parser)
+    args = parser.parse_args(argv)
+    configure(args)
+    
     audio_file = 'FakeNews.wav'
     lyrics_file = 'Lyrics.md'
     
+    if args.daemon:
+        # Анализът остава в паметта на analysis_daemon.py за следващите заявки
+        import os
+        try:
+            result = request('/analyze', {
+                'audio': os.path.abspath(audio_file),
+                'profile': args.analysis_profile,
+                'stream': args.stream
+            }, url=args.daemon)
+        except DaemonError as e:
+            print(f"ГРЕШКА: {e}")
+            return 1
+        print(f"Анализ в сървъра: {format_time(result['duration'])}, {result['tempo']:.2f} BPM, "
+              f"{result['onsets']} onsets, {result['beats']} удара ({result['seconds'] * 1000:.0f} ms)")
+        return 0
+    
     print("=" * 60)
     print("АНАЛИЗ НА АУДИО ФАЙЛ ЗА ТАЙМКОДОВЕ")
     print("=" * 60)
     print()
     
     # Анализ на аудио
-    analysis = analyze_audio_structure(audio_file)
+    analysis = analyze_audio_structure(audio_file, streaming=args.stream, use_cache=not args.no_cache,
+                                       profile=args.analysis_profile)
     
     print()
     print("=" * 60)
@@ -199,42 +289,30 @@ def main():
     print("=" * 60)
     print()
     
+    # Структурна сегментация - по една секция за всяка секция от текста
+    sections = estimate_sections(analysis, SONG_STRUCTURE)['sections']
+    if len(sections) == len(SONG_STRUCTURE):
+        print("Открити секции:")
+        for structure_section, detected in zip(SONG_STRUCTURE, sections):
+            print(f"  {structure_section['type']:<10} {format_time(detected['start'])} - "
+                  f"{format_time(detected['end'])} ({detected['label']}, {detected['kind']})")
+    else:
+        print("ВНИМАНИЕ: Сегментацията не откри достатъчно секции, използват се приблизителни продължителности")
+    print()
+    
     # Създаване на таймлайн
-    timeline = create_timeline(analysis, lyrics_file)
+    timeline = create_timeline(analysis, lyrics_file, sections, load_beat_grid(audio_file, args.analysis_profile),
+                               args.beat_snap)
+    
+    # Проверка на таймлайна (при --repair кратките записи се прилепват към ударите)
+    from cue_index import CueIndex
+    timeline = apply_validation(timeline, analysis['duration'], args, CueIndex(analysis['beat_times'], []))
     
     # Записване на резултатите
     output_file = 'Timeline.md'
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write("# FAKE NEWS - Таймлайн с таймкодове\n\n")
-        f.write(f"**Обща продължителност:** {format_time(analysis['duration'])}\n")
-        f.write(f"**Темпо (BPM):** {analysis['tempo']:.2f}\n\n")
-        f.write("---\n\n")
-        
-        section_names = {
-            'intro': 'Встъп',
-            'verse1': 'Верс 1',
-            'chorus1': 'Припев 1',
-            'interlude': 'Интерлюд',
-            'verse2': 'Верс 2',
-            'chorus2': 'Припев 2',
-            'chorus3': 'Припев 3',
-            'outro': 'Финал'
-        }
-        
-        current_section = None
-        for i, entry in enumerate(timeline, 1):
-            start_time = format_time(entry['start'])
-            end_time = format_time(entry['end'])
-            duration = format_time(entry['end'] - entry['start'])
-            
-            # Показване на секцията само при промяна
-            if entry.get('section') != current_section:
-                current_section = entry.get('section')
-                section_name = section_names.get(current_section, current_section)
-                f.write(f"\n### {section_name.upper()}\n\n")
-            
-            f.write(f"## {i}. {start_time} - {end_time} ({duration})\n")
-            f.write(f"**Текст:** {entry['line']}\n\n")
+    # Записаният таймлайн (със запазените ръчни редакции)
+    timeline = write_timeline(timeline, output_file, analysis['duration'], title="FAKE NEWS - Таймлайн с таймкодове",
+                              tempo=analysis['tempo'], overwrite_edits=args.overwrite_edits)['timeline']
     
     print(f"Таймлайнът е записан в: {output_file}")
     print()
@@ -245,16 +323,21 @@ def main():
     
     print()
     print(f"Общо записи: {len(timeline)}")
+    
+    report(args)
+    return 0
 
 if __name__ == '__main__':
     try:
-        main()
+        sys.exit(main())
     except ImportError as e:
         print(f"ГРЕШКА: Липсва необходима библиотека: {e}")
         print("\nМоля, инсталирайте необходимите библиотеки:")
         print("pip install librosa numpy scipy soundfile")
+        sys.exit(1)
     except Exception as e:
         print(f"ГРЕШКА: {e}")
         import traceback
         traceback.print_exc()
+        sys.exit(1)
 
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Кеш на декодирано аудио
+Декодираният сигнал се пази като .npy файл (float32 или float64 според профила на анализа) (зарежда се memory-mapped, без копиране)
+заедно с малък JSON файл с метаданни. Ключът е SHA-256 хеш на съдържанието на аудио файла,
+така че кешът се инвалидира автоматично, когато файлът се промени.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+from profiling import stage
+
+CACHE_DIR = '.audio_cache'
+INDEX_FILE = 'index.json'
+DEFAULT_RES_TYPE = 'soxr_hq'
+
+def _load_index(cache_dir):
+    """Зарежда индекса път -> (размер, mtime, хеш)"""
+    index_path = os.path.join(cache_dir, INDEX_FILE)
+    if os.path.exists(index_path):
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    return {}
+
+def _save_index(index, cache_dir):
+    """Записва индекса атомарно"""
+    index_path = os.path.join(cache_dir, INDEX_FILE)
+    tmp_path = index_path + f'.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, index_path)
+
+def file_hash(path, cache_dir=CACHE_DIR, chunk_size=1 << 20):
+    """Връща SHA-256 хеш на съдържанието на файла
+    
+    Хешът се запомня в индекса заедно с размера и mtime на файла и се изчислява
+    наново само ако те се променят.
+    """
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    index = _load_index(cache_dir)
+    entry = index.get(key)
+    if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['hash']
+    
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+    
+    os.makedirs(cache_dir, exist_ok=True)
+    index[key] = {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'hash': content_hash
+    }
+    _save_index(index, cache_dir)
+    return content_hash
+
+def _cache_paths(content_hash, sr, mono, cache_dir, dtype='float32', res_type=DEFAULT_RES_TYPE):
+    """Връща пътищата до .npy и .json файловете за даден ключ"""
+    rate = 'native' if sr is None else f"{sr}-{res_type}"
+    channels = 'mono' if mono else 'multi'
+    suffix = '' if dtype == 'float32' else f"_{dtype}"
+    base = os.path.join(cache_dir, f"{content_hash[:32]}_{rate}_{channels}{suffix}")
+    return base + '.npy', base + '.json'
+
+def _decode(audio_file, sr, mono, dtype='float32', res_type=DEFAULT_RES_TYPE):
+    """Декодира аудио файла с librosa"""
+    import librosa
+    y, sr = librosa.load(audio_file, sr=sr, mono=mono, dtype=np.dtype(dtype), res_type=res_type or DEFAULT_RES_TYPE)
+    return np.ascontiguousarray(y, dtype=dtype), sr
+
+def load_audio(audio_file, sr=None, mono=True, cache_dir=CACHE_DIR, dtype='float32', res_type=DEFAULT_RES_TYPE):
+    """Зарежда аудио файл през кеша
+    
+    Връща (y, sr), където y е read-only memory-mapped масив с дадения dtype.
+    При sr различен от native файлът се преобразува с res_type (напр. 'soxr_lq', 'soxr_hq').
+    При липса в кеша файлът се декодира веднъж и се записва.
+    """
+    content_hash = file_hash(audio_file, cache_dir)
+    npy_path, meta_path = _cache_paths(content_hash, sr, mono, cache_dir, dtype, res_type)
+    
+    if os.path.exists(npy_path) and os.path.exists(meta_path):
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            y = np.load(npy_path, mmap_mode='r')
+            return y, meta['sample_rate']
+        except (OSError, ValueError, KeyError):
+            pass  # Повреден запис - декодираме наново
+    
+    with stage('load_audio.decode'):
+        y, sample_rate = _decode(audio_file, sr, mono, dtype, res_type)
+    
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = npy_path + f'.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, y)
+    os.replace(tmp_path, npy_path)
+    
+    meta = {
+        'source': os.path.abspath(audio_file),
+        'hash': content_hash,
+        'sample_rate': int(sample_rate),
+        'samples': int(y.shape[-1]),
+        'channels': 1 if y.ndim == 1 else int(y.shape[0]),
+        'dtype': str(y.dtype),
+        'duration': y.shape[-1] / float(sample_rate)
+    }
+    tmp_path = meta_path + f'.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, meta_path)
+    
+    return np.load(npy_path, mmap_mode='r'), sample_rate
+
+def get_duration(audio_file, cache_dir=CACHE_DIR):
+    """Връща продължителността на аудио файла в секунди
+    
+    Чете метаданните на който и да е кеширан запис за файла (native или преобразуван), а ако
+    няма такъв - заглавката на файла. Файлът никога не се декодира.
+    """
+    content_hash = file_hash(audio_file, cache_dir)
+    prefix = f"{content_hash[:32]}_"
+    if os.path.isdir(cache_dir):
+        for name in sorted(os.listdir(cache_dir)):
+            if not (name.startswith(prefix) and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(cache_dir, name), 'r', encoding='utf-8') as f:
+                    return float(json.load(f)['duration'])
+            except (OSError, ValueError, KeyError):
+                pass
+    
+    try:
+        import soundfile
+        return float(soundfile.info(audio_file).duration)
+    except (ImportError, RuntimeError):
+        # Формати, които libsndfile не чете (напр. стари версии и MP3) - audioread чете само заглавката
+        import librosa
+        return float(librosa.get_duration(path=audio_file))
+
+def clear_cache(cache_dir=CACHE_DIR):
+    """Изтрива всички записи от кеша"""
+    if not os.path.isdir(cache_dir):
+        return 0
+    removed = 0
+    for name in os.listdir(cache_dir):
+        os.remove(os.path.join(cache_dir, name))
+        removed += 1
+    return removed
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Кеш на декодирано аудио')
+    parser.add_argument('audio_files', nargs='*', help='аудио файлове за предварително декодиране')
+    parser.add_argument('--clear', action='store_true', help='изтриване на кеша')
+    args = parser.parse_args(argv)
+    
+    if args.clear:
+        print(f"Изтрити файлове от кеша: {clear_cache()}")
+        return 0
+    
+    for audio_file in args.audio_files:
+        y, sr = load_audio(audio_file)
+        print(f"{audio_file}: {y.shape[-1]} семпъла, {sr} Hz, {y.shape[-1] / sr:.3f} s")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
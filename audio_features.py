@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Общ модул за извличане на аудио характеристики
+Спектрограмата и onset envelope се изчисляват веднъж за (файл, n_fft, hop_length),
+а всички останали характеристики (RMS, centroid, rolloff, onsets, beats) се извличат от тях.
+Самата спектрограма не се пази - в кеша остават само характеристиките по рамки.
+"""
+
+from collections import OrderedDict
+import librosa
+import numpy as np
+from audio_cache import DEFAULT_RES_TYPE, load_audio, file_hash
+from profiling import profiled, stage
+
+# Кеш в паметта: (хеш на файла, n_fft, hop_length, режим, sr, dtype, res_type) -> характеристики
+# Вокалният и структурният анализ на един файл ползват един запис; по-старите се изхвърлят (LRU),
+# за да не расте паметта на демона с всеки анализиран файл или профил
+_FEATURES = OrderedDict()
+MAX_FEATURE_ENTRIES = 2
+
+def tempo_to_float(tempo):
+    """Конвертира tempo от librosa в скалар"""
+    if isinstance(tempo, np.ndarray):
+        return float(tempo.item()) if tempo.size == 1 else float(tempo[0])
+    if isinstance(tempo, (list, tuple)):
+        return float(tempo[0]) if len(tempo) > 0 else 120.0
+    return float(tempo)
+
+def _finish_features(sr, n_fft, hop_length, n_samples, frame_features):
+    """Извлича onsets, темпо и beats от onset envelope и сглобява речника с характеристики"""
+    onset_env = frame_features['onset_env']
+    with stage('features.onset_detect'):
+        onset_times = librosa.onset.onset_detect(
+            onset_envelope=onset_env,
+            sr=sr,
+            hop_length=hop_length,
+            units='time',
+            backtrack=True
+        )
+    with stage('features.beat_track'):
+        tempo, beats = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop_length)
+    
+    times = librosa.frames_to_time(np.arange(len(onset_env)), sr=sr, hop_length=hop_length)
+    
+    features = {
+        'duration': n_samples / float(sr),
+        'sample_rate': sr,
+        'n_fft': n_fft,
+        'hop_length': hop_length,
+        'times': times,
+        'onset_times': onset_times,
+        'tempo': tempo_to_float(tempo),
+        'beat_frames': beats,
+        'beat_times': librosa.frames_to_time(beats, sr=sr, hop_length=hop_length)
+    }
+    features.update(frame_features)
+    return features
+
+def compute_features(y, sr, n_fft=2048, hop_length=512):
+    """Изчислява всички характеристики от една STFT и един onset envelope"""
+    # Една STFT за всички спектрални характеристики
+    with stage('features.stft'):
+        S = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length))
+    
+    with stage('features.spectral'):
+        rms = librosa.feature.rms(S=S, frame_length=n_fft, hop_length=hop_length)[0]
+        spectral_centroid = librosa.feature.spectral_centroid(S=S, sr=sr, n_fft=n_fft, hop_length=hop_length)[0]
+        spectral_rolloff = librosa.feature.spectral_rolloff(S=S, sr=sr, n_fft=n_fft, hop_length=hop_length)[0]
+        
+        # ZCR се изчислява във времевата област, но със същите рамки
+        zcr = librosa.feature.zero_crossing_rate(y, frame_length=n_fft, hop_length=hop_length)[0]
+    
+    # Един onset envelope за onset detection и beat tracking
+    # (top_db=None, за да съвпада с поточния режим, където глобалният максимум не е известен)
+    with stage('features.onset_strength'):
+        mel = librosa.feature.melspectrogram(S=S ** 2, sr=sr)
+        onset_env = librosa.onset.onset_strength(
+            S=librosa.power_to_db(mel, top_db=None),
+            sr=sr,
+            n_fft=n_fft,
+            hop_length=hop_length
+        )
+    
+    # Chroma и MFCC за структурна сегментация (от същата спектрограма)
+    with stage('features.chroma_mfcc'):
+        chroma = librosa.feature.chroma_stft(S=S ** 2, sr=sr, n_fft=n_fft, hop_length=hop_length, tuning=0.0)
+        mfcc = librosa.feature.mfcc(S=librosa.power_to_db(mel, top_db=None), n_mfcc=13)
+    
+    return _finish_features(sr, n_fft, hop_length, len(y), {
+        'rms': rms,
+        'spectral_centroid': spectral_centroid,
+        'spectral_rolloff': spectral_rolloff,
+        'zcr': zcr,
+        'onset_env': onset_env,
+        'chroma': chroma,
+        'mfcc': mfcc
+    })
+
+def _stream_mono_blocks(sound_file, blocksize, sr=None, res_type=None):
+    """Чете файла на моно блокове; при sr, различен от native, ги преобразува поточно със soxr
+    
+    soxr пази състоянието на филтъра между блоковете, така че резултатът съвпада с
+    librosa.load(sr=sr, res_type=res_type) върху целия файл.
+    """
+    resampler = None
+    if sr is not None and sr != sound_file.samplerate:
+        res_type = res_type or DEFAULT_RES_TYPE
+        if not res_type.startswith('soxr'):
+            raise ValueError(f"Поточният режим поддържа само soxr_* преобразуване, а не {res_type}")
+        import soxr
+        resampler = soxr.ResampleStream(sound_file.samplerate, sr, 1, dtype='float32', quality=res_type)
+    
+    for block in sound_file.blocks(blocksize=blocksize, dtype='float32', always_2d=True):
+        y = block.mean(axis=1)
+        if resampler is not None:
+            y = resampler.resample_chunk(y)
+        if len(y):
+            yield y
+    if resampler is not None:
+        y = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+        if len(y):
+            yield y
+
+def _stream_frame_blocks(blocks, n_fft, hop_length):
+    """Събира моно блоковете (виж _stream_mono_blocks) в буфери с цял брой рамки
+    
+    Между блоковете се пренасят последните n_fft - hop_length семпъла, така че
+    рамките съвпадат с тези на центрираната STFT върху целия сигнал. Връща
+    (buffer, lead, trail) - lead/trail са броят семпли padding в началото/края,
+    които за STFT трябва да са нули, а за ZCR - повторение на крайния семпъл.
+    """
+    pad = n_fft // 2
+    buf = None
+    lead = pad
+    
+    def take(buf, lead, trail_start):
+        n_frames = (len(buf) - n_fft) // hop_length + 1 if len(buf) >= n_fft else 0
+        if n_frames == 0:
+            return None, buf, lead
+        used = (n_frames - 1) * hop_length + n_fft
+        trail = max(0, used - trail_start)
+        consumed = n_frames * hop_length
+        return (buf[:used], min(lead, used), trail), buf[consumed:], max(0, lead - consumed)
+    
+    for y in blocks:
+        if buf is None:
+            buf = np.concatenate([np.full(pad, y[0], dtype=np.float32), y])
+        else:
+            buf = np.concatenate([buf, y])
+        chunk, buf, lead = take(buf, lead, len(buf))
+        if chunk is not None:
+            yield chunk
+    
+    if buf is None:
+        return
+    
+    # Край на файла - центриращ padding и в края
+    trail_start = len(buf)
+    buf = np.concatenate([buf, np.full(pad, buf[-1], dtype=np.float32)])
+    chunk, buf, lead = take(buf, lead, trail_start)
+    if chunk is not None:
+        yield chunk
+
+@profiled('features.streaming')
+def compute_features_streaming(audio_file, n_fft=2048, hop_length=512, block_length=1024, sr=None,
+                               res_type=None):
+    """Изчислява характеристиките поточно, блок по блок, с ограничена памет
+    
+    Дава същите RMS/centroid/rolloff/ZCR/onset/chroma/MFCC стойности като compute_features,
+    но в паметта се държат само един блок семпли и по няколко десетки числа на рамка.
+    sr None означава native sample rate на файла, иначе блоковете се преобразуват поточно с res_type.
+    """
+    import soundfile as sf
+    
+    rms_blocks = []
+    centroid_blocks = []
+    rolloff_blocks = []
+    zcr_blocks = []
+    onset_blocks = []
+    chroma_blocks = []
+    mfcc_blocks = []
+    prev_mel_db = None
+    n_samples = 0
+    
+    with sf.SoundFile(audio_file) as f:
+        sr = sr or f.samplerate
+        mel_basis = librosa.filters.mel(sr=sr, n_fft=n_fft)
+        
+        def counted(blocks):
+            nonlocal n_samples
+            for y in blocks:
+                n_samples += len(y)
+                yield y
+        
+        blocks = counted(_stream_mono_blocks(f, block_length * hop_length, sr, res_type))
+        for buf, lead, trail in _stream_frame_blocks(blocks, n_fft, hop_length):
+            # За STFT центриращият padding е с нули (както в librosa.stft)
+            stft_buf = buf
+            if lead or trail:
+                stft_buf = buf.copy()
+                stft_buf[:lead] = 0.0
+                stft_buf[len(buf) - trail:] = 0.0
+            
+            S = np.abs(librosa.stft(stft_buf, n_fft=n_fft, hop_length=hop_length, center=False))
+            rms_blocks.append(librosa.feature.rms(S=S, frame_length=n_fft, hop_length=hop_length)[0])
+            centroid_blocks.append(librosa.feature.spectral_centroid(S=S, sr=sr, n_fft=n_fft, hop_length=hop_length)[0])
+            rolloff_blocks.append(librosa.feature.spectral_rolloff(S=S, sr=sr, n_fft=n_fft, hop_length=hop_length)[0])
+            zcr_blocks.append(librosa.feature.zero_crossing_rate(
+                buf, frame_length=n_fft, hop_length=hop_length, center=False)[0])
+            
+            # Onset strength: положителната разлика спрямо предишната mel рамка,
+            # последната рамка се пренася към следващия блок
+            mel_db = librosa.power_to_db(mel_basis @ S ** 2, top_db=None)
+            if prev_mel_db is not None:
+                mel_db_lagged = np.concatenate([prev_mel_db[:, None], mel_db], axis=1)
+            else:
+                mel_db_lagged = mel_db
+            onset_blocks.append(np.mean(np.maximum(0.0, np.diff(mel_db_lagged, axis=1)), axis=0))
+            prev_mel_db = mel_db[:, -1]
+            
+            # Chroma и MFCC се изчисляват рамка по рамка, така че и те са поточни
+            chroma_blocks.append(librosa.feature.chroma_stft(S=S ** 2, sr=sr, n_fft=n_fft, hop_length=hop_length, tuning=0.0))
+            mfcc_blocks.append(librosa.feature.mfcc(S=mel_db, n_mfcc=13))
+    
+    rms = np.concatenate(rms_blocks)
+    onset_diffs = np.concatenate(onset_blocks)
+    
+    # Компенсация на lag и центрирането, както в librosa.onset.onset_strength
+    pad_width = 1 + n_fft // (2 * hop_length)
+    onset_env = np.pad(onset_diffs, (pad_width, 0))[:len(rms)].astype(np.float32)
+    
+    return _finish_features(sr, n_fft, hop_length, n_samples, {
+        'rms': rms,
+        'spectral_centroid': np.concatenate(centroid_blocks),
+        'spectral_rolloff': np.concatenate(rolloff_blocks),
+        'zcr': np.concatenate(zcr_blocks),
+        'onset_env': onset_env,
+        'chroma': np.concatenate(chroma_blocks, axis=1).astype(np.float32),
+        'mfcc': np.concatenate(mfcc_blocks, axis=1).astype(np.float32)
+    })
+
+def get_features(audio_file, n_fft=2048, hop_length=512, streaming=False, sr=None, dtype='float32', res_type=None):
+    """Връща характеристиките за файла, като ги изчислява само веднъж
+    
+    sr, dtype и res_type идват от профила на анализа (analysis_profiles.py).
+    Поточният режим преобразува блоковете до същия sample rate (n_fft и hop_length остават в
+    семпли при него), но винаги смята във float32.
+    """
+    if streaming:
+        dtype = 'float32'
+    key = (file_hash(audio_file), n_fft, hop_length, streaming, sr, dtype, res_type)
+    if key in _FEATURES:
+        _FEATURES.move_to_end(key)
+        return _FEATURES[key]
+    
+    if streaming:
+        features = compute_features_streaming(audio_file, n_fft=n_fft, hop_length=hop_length, sr=sr,
+                                              res_type=res_type)
+    else:
+        y, sample_rate = load_audio(audio_file, sr=sr, dtype=dtype, res_type=res_type)
+        features = compute_features(y, sample_rate, n_fft=n_fft, hop_length=hop_length)
+    _FEATURES[key] = features
+    while len(_FEATURES) > MAX_FEATURE_ENTRIES:
+        _FEATURES.popitem(last=False)
+    return features
+
+def clear_features():
+    """Изчиства кеша на характеристиките в паметта"""
+    _FEATURES.clear()
+
+def get_profile_features(audio_file, profile, streaming=False):
+    """Връща характеристиките с параметрите на даден профил (речник от analysis_profiles)"""
+    return get_features(audio_file, n_fft=profile['n_fft'], hop_length=profile['hop_length'],
+                        streaming=streaming, sr=profile['sample_rate'], dtype=profile['dtype'],
+                        res_type=profile['res_type'])
+
+def beat_sync_features(features):
+    """Chroma + MFCC (медиана) и RMS енергия (средна), агрегирани между съседни удари
+    
+    Връща (матрица d × удари, времена на началата на интервалите, енергия по удари).
+    """
+    n_frames = features['chroma'].shape[1]
+    beat_frames = librosa.util.fix_frames(features['beat_frames'], x_min=0, x_max=n_frames)
+    stacked = np.vstack([features['chroma'], features['mfcc']])
+    synced = librosa.util.sync(stacked, beat_frames, aggregate=np.median)
+    energy = librosa.util.sync(normalize(features['rms'])[None, :], beat_frames, aggregate=np.mean)[0]
+    times = librosa.frames_to_time(beat_frames[:-1], sr=features['sample_rate'], hop_length=features['hop_length'])
+    return synced[:, :len(times)], times, energy[:len(times)]
+
+def normalize(values):
+    """Min-max нормализиране в [0, 1]"""
+    return (values - np.min(values)) / (np.max(values) - np.min(values) + 1e-10)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Пакетен анализ и синхронизация на много песни
+Пуска analyze_vocal_activity + sync_lyrics_with_audio за всяка двойка (аудио, текст)
+в пул от процеси и записва по един таймлайн за всяка песен.
+
+Употреба:
+    python batch_analyze.py album/                 # директория с Song.wav + Song.md
+    python batch_analyze.py manifest.json -w 4     # JSON списък от {"audio", "lyrics", "output"}
+
+Секциите на всяка песен идват от строфите на нейния текст (виж sync_lyrics.lyrics_structure),
+а в манифеста могат да се зададат изрично с "structure": [{"type", "lines"}, ...].
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from analysis_profiles import DEFAULT_PROFILE, add_profile_argument
+
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.mp3', '.ogg')
+LYRICS_SUFFIXES = ('.lyrics.md', '.md', '.txt')
+
+def find_jobs_in_directory(directory, output_dir):
+    """Намира двойки (аудио, текст) в директория по общо име на файла"""
+    audio_by_stem = {}
+    for name in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() not in AUDIO_EXTENSIONS:
+            continue
+        # При няколко формата предпочитаме по-ранния в AUDIO_EXTENSIONS (WAV пред MP3)
+        previous = audio_by_stem.get(stem)
+        if previous is None or AUDIO_EXTENSIONS.index(ext.lower()) < AUDIO_EXTENSIONS.index(os.path.splitext(previous)[1].lower()):
+            audio_by_stem[stem] = name
+    
+    jobs = []
+    for stem, audio_name in sorted(audio_by_stem.items()):
+        lyrics_file = None
+        for suffix in LYRICS_SUFFIXES:
+            candidate = os.path.join(directory, stem + suffix)
+            if os.path.exists(candidate):
+                lyrics_file = candidate
+                break
+        if lyrics_file is None:
+            print(f"ВНИМАНИЕ: Няма текст за {audio_name}, пропуска се")
+            continue
+        jobs.append({
+            'name': stem,
+            'audio': os.path.join(directory, audio_name),
+            'lyrics': lyrics_file,
+            'output': os.path.join(output_dir, f"{stem}_Timeline.md")
+        })
+    return jobs
+
+def load_manifest(manifest_file, output_dir):
+    """Зарежда JSON манифест със списък от {"audio", "lyrics", "output" и "structure" (по избор)}"""
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    
+    base_dir = os.path.dirname(os.path.abspath(manifest_file))
+    jobs = []
+    for entry in entries:
+        audio_file = os.path.join(base_dir, entry['audio'])
+        name = entry.get('name') or os.path.splitext(os.path.basename(audio_file))[0]
+        output_file = entry.get('output')
+        if output_file:
+            output_file = os.path.join(base_dir, output_file)
+        else:
+            output_file = os.path.join(output_dir, f"{name}_Timeline.md")
+        jobs.append({
+            'name': name,
+            'audio': audio_file,
+            'lyrics': os.path.join(base_dir, entry['lyrics']),
+            'output': output_file,
+            'structure': entry.get('structure')
+        })
+    return jobs
+
+def process_song(job, streaming=False, profile=DEFAULT_PROFILE):
+    """Анализира и синхронизира една песен (изпълнява се в отделен процес)"""
+    from sync_lyrics import (analyze_vocal_activity, assign_sections, lyrics_file_structure, sync_lyrics_with_audio,
+                             write_timeline)
+    
+    result = {'name': job['name'], 'output': job['output']}
+    log = io.StringIO()
+    t0 = time.perf_counter()
+    try:
+        # Подробният изход на анализа се събира, за да не се смесва между процесите
+        with contextlib.redirect_stdout(log):
+            analysis = analyze_vocal_activity(job['audio'], streaming=streaming, profile=profile)
+            t1 = time.perf_counter()
+            timeline = sync_lyrics_with_audio(analysis, job['lyrics'])
+            assign_sections(timeline, job.get('structure') or lyrics_file_structure(job['lyrics']))
+            os.makedirs(os.path.dirname(os.path.abspath(job['output'])), exist_ok=True)
+            timeline = write_timeline(timeline, job['output'], analysis['duration'],
+                                      title=f"{job['name']} - Таймлайн с таймкодове (Прецизна синхронизация)")['timeline']
+        t2 = time.perf_counter()
+        result.update({
+            'ok': True,
+            'duration': analysis['duration'],
+            'lines': len(timeline),
+            'analysis_seconds': t1 - t0,
+            'sync_seconds': t2 - t1,
+            'wall_seconds': t2 - t0
+        })
+    except Exception as e:
+        result.update({
+            'ok': False,
+            'error': f"{type(e).__name__}: {e}",
+            'log': log.getvalue(),
+            'wall_seconds': time.perf_counter() - t0
+        })
+    return result
+
+def run_batch(jobs, workers=None, streaming=False, profile=DEFAULT_PROFILE):
+    """Пуска задачите в пул от процеси и връща резултатите в реда на завършване"""
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_song, job, streaming, profile): job for job in jobs}
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result['ok']:
+                print(f"✓ {result['name']}: {result['lines']} реда, "
+                      f"{result['duration']:.1f} s аудио за {result['wall_seconds']:.2f} s "
+                      f"(анализ {result['analysis_seconds']:.2f} s, синхронизация {result['sync_seconds']:.3f} s, "
+                      f"{result['duration'] / result['wall_seconds']:.1f}x реално време)")
+            else:
+                print(f"✗ {result['name']}: {result['error']}")
+    return results
+
+def print_summary(results, wall_seconds, workers):
+    """Отпечатва обобщена пропускателна способност"""
+    done = [r for r in results if r['ok']]
+    audio_seconds = sum(r['duration'] for r in done)
+    cpu_seconds = sum(r['wall_seconds'] for r in done)
+    
+    print()
+    print("=" * 60)
+    print("ОБОБЩЕНИЕ")
+    print("=" * 60)
+    print(f"Песни: {len(done)}/{len(results)} успешни, процеси: {workers}")
+    print(f"Общо аудио: {audio_seconds:.1f} s")
+    print(f"Общо време: {wall_seconds:.2f} s")
+    if wall_seconds > 0:
+        print(f"Пропускателна способност: {audio_seconds / wall_seconds:.1f}x реално време, "
+              f"{len(done) / wall_seconds * 60:.1f} песни/мин")
+    if cpu_seconds > 0 and wall_seconds > 0:
+        print(f"Паралелна ефективност: {cpu_seconds / wall_seconds / workers * 100:.0f}% "
+              f"({cpu_seconds:.2f} s сумарно време на песните)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Пакетен анализ и синхронизация на много песни')
+    parser.add_argument('source', help='директория с аудио + текстове или JSON манифест')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                        help='брой процеси (по подразбиране броя ядра)')
+    parser.add_argument('-o', '--output-dir', default='timelines', help='директория за таймлайните')
+    parser.add_argument('--stream', action='store_true', help='поточен анализ на блокове')
+    add_profile_argument(parser)
+    args = parser.parse_args(argv)
+    
+    if os.path.isdir(args.source):
+        jobs = find_jobs_in_directory(args.source, args.output_dir)
+    elif os.path.exists(args.source):
+        jobs = load_manifest(args.source, args.output_dir)
+    else:
+        print(f"ГРЕШКА: Не е намерен източник: {args.source}")
+        return 1
+    
+    if not jobs:
+        print("ГРЕШКА: Няма намерени песни за анализ")
+        return 1
+    
+    workers = max(1, min(args.workers or 1, len(jobs)))
+    print(f"Анализ на {len(jobs)} песни с {workers} процеса...")
+    print()
+    
+    t0 = time.perf_counter()
+    results = run_batch(jobs, workers=workers, streaming=args.stream, profile=args.analysis_profile)
+    print_summary(results, time.perf_counter() - t0, workers)
+    return 0 if all(result['ok'] for result in results) else 1
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except Exception as e:
+        print(f"ГРЕШКА: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
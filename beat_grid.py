@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Мрежа от удари (beats) и силни времена (downbeats) за прилепване на таймкодовете
+Мрежата се записва в кеша на анализа веднъж (от analyze_audio.py или sync_lyrics.py) като
+сортирани масиви от времена, а всички производители на таймлайн я зареждат оттам и прилепват
+началата и краищата на редовете векторно, без да пускат beat tracking наново. Началата на
+секциите се прилепват към силно време, ако има такова в рамките на половин удар.
+"""
+
+import numpy as np
+from analysis_cache import load_analysis, save_analysis
+from analysis_profiles import DEFAULT_PROFILE, get_profile, profile_names
+from cue_index import nearest_indices
+
+# Мрежата се записва от анализите - при промяна се увеличават и техните версии, за да се изчисли наново
+BEAT_GRID_VERSION = 2
+
+def beat_grid_params(profile=DEFAULT_PROFILE):
+    """Параметрите на мрежата в кеша на анализа (ударите зависят от sample rate и hop на профила)"""
+    params = {
+        'analysis': 'beat_grid',
+        'version': BEAT_GRID_VERSION,
+        'profile': profile
+    }
+    params.update(get_profile(profile))
+    return params
+
+def estimate_downbeats(beat_times, beat_strength, beats_per_bar=4):
+    """Избира фазата на такта, при която сумарната сила на ударите е най-голяма"""
+    beat_times = np.asarray(beat_times, dtype=float)
+    beat_strength = np.asarray(beat_strength, dtype=float)[:len(beat_times)]
+    if len(beat_times) < beats_per_bar:
+        return beat_times[:1]
+    scores = [beat_strength[phase::beats_per_bar].mean() for phase in range(beats_per_bar)]
+    return beat_times[int(np.argmax(scores))::beats_per_bar]
+
+class BeatGrid:
+    """Сортирани времена на ударите и силните времена"""
+    
+    def __init__(self, beats, downbeats=None, tempo=None):
+        self.beats = np.sort(np.asarray(beats, dtype=float))
+        self.downbeats = np.sort(np.asarray(downbeats if downbeats is not None else [], dtype=float))
+        self.tempo = tempo
+    
+    @property
+    def beat_period(self):
+        """Средна продължителност на един удар в секунди"""
+        if len(self.beats) > 1:
+            return float(np.median(np.diff(self.beats)))
+        return 60.0 / self.tempo if self.tempo else None
+    
+    def snap(self, times, tolerance, downbeats=False):
+        """Прилепва времената към най-близкия удар, ако е на не повече от tolerance секунди"""
+        grid = self.downbeats if downbeats else self.beats
+        times = np.asarray(times, dtype=float)
+        if len(grid) == 0 or tolerance <= 0:
+            return times
+        nearest = grid[nearest_indices(grid, times)]
+        return np.where(np.abs(nearest - times) <= tolerance, nearest, times)
+    
+    def snap_timeline(self, timeline, tolerance, section_starts=(), downbeat_tolerance=0.0):
+        """Прилепва 'start' и 'end' на всички записи (на място) и връща таймлайна
+        
+        Началата на записите с индекси в section_starts се прилепват към силно време в рамките
+        на downbeat_tolerance (краят на предишния запис, ако съвпада с началото, ги следва).
+        Записите, при които прилепването би направило края преди началото, остават непроменени.
+        """
+        if not timeline:
+            return timeline
+        starts = np.array([entry['start'] for entry in timeline], dtype=float)
+        ends = np.array([entry['end'] for entry in timeline], dtype=float)
+        new_starts = self.snap(starts, tolerance)
+        new_ends = self.snap(ends, tolerance)
+        
+        sections = np.array([i for i in section_starts if 0 <= i < len(timeline)], dtype=int)
+        if len(sections) and len(self.downbeats) and downbeat_tolerance > 0:
+            on_downbeat = self.snap(starts[sections], downbeat_tolerance, downbeats=True)
+            moved = on_downbeat != starts[sections]
+            new_starts[sections[moved]] = on_downbeat[moved]
+            # Редът преди секцията свършва там, където тя започва (ако е свършвал там и преди)
+            previous = sections[moved] - 1
+            joined = (previous >= 0) & (np.abs(ends[np.maximum(previous, 0)] - starts[sections[moved]]) < 1e-6)
+            new_ends[previous[joined]] = on_downbeat[moved][joined]
+        
+        invalid = new_ends <= new_starts
+        new_starts[invalid] = starts[invalid]
+        new_ends[invalid] = ends[invalid]
+        for entry, start, end in zip(timeline, new_starts, new_ends):
+            entry['start'] = float(start)
+            entry['end'] = float(end)
+        return timeline
+
+def section_start_indices(timeline):
+    """Индексите на записите, с които започва нова секция (по ключа 'section', ако го има)"""
+    starts = []
+    previous = None
+    for i, entry in enumerate(timeline):
+        section = entry.get('section')
+        if section is not None and section != previous:
+            starts.append(i)
+        previous = section
+    return starts
+
+def snap_timeline(timeline, beat_grid, tolerance, section_starts=None):
+    """Прилепва таймлайна към мрежата, ако има такава (толерансът е най-много 1/4 удар)
+    
+    Началата на секциите (section_starts или смените на 'section') се прилепват към силно
+    време в рамките на двойния толеранс, но не повече от половин удар.
+    """
+    if beat_grid is None or tolerance <= 0:
+        return timeline
+    period = beat_grid.beat_period
+    downbeat_tolerance = 2.0 * tolerance
+    if period:
+        tolerance = min(tolerance, period / 4.0)
+        downbeat_tolerance = min(downbeat_tolerance, period / 2.0)
+    if section_starts is None:
+        section_starts = section_start_indices(timeline)
+    return beat_grid.snap_timeline(timeline, tolerance, section_starts, downbeat_tolerance)
+
+def save_beat_grid(audio_file, beat_times, beat_strength=None, tempo=None, profile=DEFAULT_PROFILE):
+    """Записва мрежата от удари в кеша на анализа (за профила, с който е изчислена)"""
+    if beat_strength is None:
+        beat_strength = np.ones(len(beat_times))
+    grid = BeatGrid(beat_times, estimate_downbeats(beat_times, beat_strength), tempo)
+    save_analysis(audio_file, beat_grid_params(profile), {
+        'beats': grid.beats,
+        'downbeats': grid.downbeats,
+        'tempo': float(tempo) if tempo is not None else 0.0
+    })
+    return grid
+
+def load_beat_grid(audio_file, profile=None):
+    """Зарежда мрежата от удари от кеша или връща None, ако още не е изчислена
+    
+    Без profile (профилът на анализа не е известен) се проверяват всички профили.
+    """
+    for name in ([profile] if profile is not None else profile_names()):
+        data = load_analysis(audio_file, beat_grid_params(name))
+        if data is not None:
+            return BeatGrid(data['beats'], data['downbeats'], data['tempo'] or None)
+    return None
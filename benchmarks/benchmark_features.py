@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: отделни librosa извиквания срещу общия модул audio_features
+Измерва времето на всеки етап в двата варианта и показва спестеното време.
+
+Употреба: python benchmarks/benchmark_features.py [аудио файл] [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import librosa
+import numpy as np
+from audio_cache import load_audio
+
+def timed(func, repeat):
+    """Връща най-доброто време от repeat изпълнения и последния резултат"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+def bench_separate(y, sr, n_fft, hop_length, repeat):
+    """Старият подход - всяко извикване прави собствена STFT/onset envelope"""
+    stages = [
+        ('spectral_centroid', lambda: librosa.feature.spectral_centroid(y=y, sr=sr, n_fft=n_fft, hop_length=hop_length)),
+        ('spectral_rolloff', lambda: librosa.feature.spectral_rolloff(y=y, sr=sr, n_fft=n_fft, hop_length=hop_length)),
+        ('rms', lambda: librosa.feature.rms(y=y, frame_length=n_fft, hop_length=hop_length)),
+        ('beat_track', lambda: librosa.beat.beat_track(y=y, sr=sr, hop_length=hop_length)),
+        ('onset_detect', lambda: librosa.onset.onset_detect(y=y, sr=sr, hop_length=hop_length, units='time', backtrack=True)),
+        ('zero_crossing_rate', lambda: librosa.feature.zero_crossing_rate(y, frame_length=n_fft, hop_length=hop_length)),
+    ]
+    # Вторият скрипт (sync_lyrics) повтаря centroid и rms
+    stages += [
+        ('spectral_centroid (sync_lyrics)', stages[0][1]),
+        ('rms (sync_lyrics)', stages[2][1]),
+    ]
+    return [(name, timed(func, repeat)[0]) for name, func in stages]
+
+def bench_shared(y, sr, n_fft, hop_length, repeat):
+    """Новият подход - една STFT и един onset envelope за всички характеристики"""
+    results = []
+    t, S = timed(lambda: np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length)), repeat)
+    results.append(('stft', t))
+    t, onset_env = timed(lambda: librosa.onset.onset_strength(
+        S=librosa.power_to_db(librosa.feature.melspectrogram(S=S ** 2, sr=sr)), sr=sr, hop_length=hop_length), repeat)
+    results.append(('mel + onset_strength', t))
+    stages = [
+        ('spectral_centroid', lambda: librosa.feature.spectral_centroid(S=S, sr=sr, n_fft=n_fft, hop_length=hop_length)),
+        ('spectral_rolloff', lambda: librosa.feature.spectral_rolloff(S=S, sr=sr, n_fft=n_fft, hop_length=hop_length)),
+        ('rms', lambda: librosa.feature.rms(S=S, frame_length=n_fft, hop_length=hop_length)),
+        ('beat_track', lambda: librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop_length)),
+        ('onset_detect', lambda: librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr, hop_length=hop_length,
+                                                           units='time', backtrack=True)),
+        ('zero_crossing_rate', lambda: librosa.feature.zero_crossing_rate(y, frame_length=n_fft, hop_length=hop_length)),
+    ]
+    results += [(name, timed(func, repeat)[0]) for name, func in stages]
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк на извличането на характеристики')
+    parser.add_argument('audio_file', nargs='?', default='FakeNews.wav')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--n-fft', type=int, default=2048)
+    parser.add_argument('--hop-length', type=int, default=512)
+    args = parser.parse_args()
+    
+    y, sr = load_audio(args.audio_file)
+    y = np.asarray(y)
+    print(f"Аудио: {args.audio_file} ({len(y) / sr:.1f} s, {sr} Hz), най-добро от {args.repeat}")
+    
+    # Загряване на numba/FFT кешовете, за да не се отчита в първия етап
+    librosa.onset.onset_strength(y=y[:sr * 5], sr=sr)
+    
+    separate = bench_separate(y, sr, args.n_fft, args.hop_length, args.repeat)
+    shared = bench_shared(y, sr, args.n_fft, args.hop_length, args.repeat)
+    
+    print()
+    print("ОТДЕЛНИ ИЗВИКВАНИЯ")
+    print("-" * 60)
+    for name, t in separate:
+        print(f"{name:<36} {t * 1000:9.1f} ms")
+    total_separate = sum(t for _, t in separate)
+    print(f"{'ОБЩО':<36} {total_separate * 1000:9.1f} ms")
+    
+    print()
+    print("ОБЩ МОДУЛ (audio_features)")
+    print("-" * 60)
+    for name, t in shared:
+        print(f"{name:<36} {t * 1000:9.1f} ms")
+    total_shared = sum(t for _, t in shared)
+    print(f"{'ОБЩО':<36} {total_shared * 1000:9.1f} ms")
+    
+    print()
+    print(f"Ускорение: {total_separate / total_shared:.2f}x")
+
+if __name__ == '__main__':
+    main()
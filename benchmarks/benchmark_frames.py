@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: предаване на кадрите от Pillow към moviepy - през PNG файлове или през паметта
+За всеки запис от таймлайна измерва пътя на картата до първия кадър на ImageClip:
+    disk   - img.save(temp_frames/frame_XXXX.png) + ImageClip(път) (PNG кодиране и декодиране)
+    memory - np.asarray(img) + ImageClip(масив), по един масив за всяка уникална карта
+Рисуването на картите не се измерва (то е еднакво и за двата режима).
+
+Употреба: python benchmarks/benchmark_frames.py [Timeline.md] [--repeat N] [--output frames.json]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from create_video_simple import card_frame, card_params, create_text_image
+from frame_cache import card_key
+from timeline_format import read_timeline
+
+def handoff_disk(timeline, images, temp_dir):
+    """PNG файл за всеки запис (както преди) - връща записаните байтове"""
+    from moviepy.editor import ImageClip
+    written = 0
+    for i, (entry, image) in enumerate(zip(timeline, images)):
+        path = os.path.join(temp_dir, f"frame_{i:04d}.png")
+        image.save(path)
+        written += os.path.getsize(path)
+        clip = ImageClip(path, duration=entry['end'] - entry['start'])
+        clip.get_frame(0)
+        clip.close()
+    return written
+
+def handoff_memory(timeline, images):
+    """Масив в паметта, споделен от еднаквите карти"""
+    from moviepy.editor import ImageClip
+    frames = {}
+    for entry, image in zip(timeline, images):
+        key = card_key(card_params(entry['text'], entry['section']))
+        if key not in frames:
+            frames[key] = card_frame(image)
+        clip = ImageClip(frames[key], duration=entry['end'] - entry['start'])
+        clip.get_frame(0)
+        clip.close()
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк на предаването на кадрите')
+    parser.add_argument('timeline', nargs='?', default='Timeline.md')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='запис на резултатите като JSON')
+    args = parser.parse_args()
+    
+    timeline = read_timeline(args.timeline)
+    print(f"Таймлайн: {args.timeline} ({len(timeline)} записа)")
+    rendered = {}
+    images = []
+    for entry in timeline:
+        key = card_key(card_params(entry['text'], entry['section']))
+        if key not in rendered:
+            rendered[key] = create_text_image(entry['text'], entry['section'])
+        images.append(rendered[key])
+    print(f"Уникални карти: {len(rendered)}")
+    
+    # Загряване (импорт на moviepy/imageio)
+    handoff_memory(timeline[:1], images[:1])
+    
+    results = {}
+    for mode in ('disk', 'memory'):
+        best = float('inf')
+        written = 0
+        for _ in range(args.repeat):
+            temp_dir = tempfile.mkdtemp(prefix='temp_frames_')
+            try:
+                t0 = time.perf_counter()
+                if mode == 'disk':
+                    written = handoff_disk(timeline, images, temp_dir)
+                else:
+                    written = handoff_memory(timeline, images)
+                best = min(best, time.perf_counter() - t0)
+            finally:
+                shutil.rmtree(temp_dir)
+        results[mode] = {'seconds': best, 'bytes_written': written}
+    
+    print()
+    print(f"{'Режим':<8} {'общо':>9} {'на запис':>10} {'записано на диска':>19}")
+    print("-" * 50)
+    for mode, result in results.items():
+        print(f"{mode:<8} {result['seconds'] * 1000:7.0f}ms {result['seconds'] * 1000 / len(timeline):8.1f}ms "
+              f"{result['bytes_written'] / 1e6:16.1f} MB")
+    print()
+    print(f"Ускорение: {results['disk']['seconds'] / results['memory']['seconds']:.1f}x")
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'timeline': args.timeline, 'entries': len(timeline), 'unique_cards': len(rendered),
+                       'results': results}, f, indent=2)
+        print(f"Резултатите са записани в: {args.output}")
+
+if __name__ == '__main__':
+    main()
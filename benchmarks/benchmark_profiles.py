@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: профили на анализа (draft / standard / precise) срещу ръчна синхронизация
+За всеки профил измерва времето на анализа + синхронизацията и грешката на началата на редовете
+спрямо таймкодовете от manual_sync.py (sync_data.json).
+
+Употреба: python benchmarks/benchmark_profiles.py [аудио файл] [--lyrics Lyrics.md]
+          [--ground-truth sync_data.json] [--repeat N] [--output profiles.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import audio_features
+from analysis_profiles import PROFILES, get_profile
+from audio_cache import load_audio
+from sync_lyrics import analyze_vocal_activity, sync_lyrics_with_audio
+
+def run_profile(audio_file, lyrics_file, profile, repeat):
+    """Връща най-доброто време (анализ, синхронизация) и началата на редовете"""
+    best_analysis = float('inf')
+    best_sync = float('inf')
+    starts = None
+    for _ in range(repeat):
+        # Кешът в паметта се изчиства, за да се измерва реалното изчисление
+        audio_features.clear_features()
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            analysis = analyze_vocal_activity(audio_file, use_cache=False, profile=profile)
+            t1 = time.perf_counter()
+            timeline = sync_lyrics_with_audio(analysis, lyrics_file)
+            t2 = time.perf_counter()
+        best_analysis = min(best_analysis, t1 - t0)
+        best_sync = min(best_sync, t2 - t1)
+        starts = np.array([entry['start'] for entry in timeline])
+    return best_analysis, best_sync, starts
+
+def error_stats(starts, truth):
+    """Грешка на началата на редовете спрямо ръчните таймкодове (в секунди)"""
+    n = min(len(starts), len(truth))
+    errors = np.abs(starts[:n] - truth[:n])
+    return {
+        'lines': int(n),
+        'mean_error': float(np.mean(errors)),
+        'median_error': float(np.median(errors)),
+        'p90_error': float(np.percentile(errors, 90)),
+        'within_100ms': float(np.mean(errors <= 0.1)),
+        'within_250ms': float(np.mean(errors <= 0.25))
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк на профилите на анализа')
+    parser.add_argument('audio_file', nargs='?', default='FakeNews.wav')
+    parser.add_argument('--lyrics', default='Lyrics.md')
+    parser.add_argument('--ground-truth', default='sync_data.json', help='таймкодове от manual_sync.py')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='JSON файл за записване на резултатите')
+    args = parser.parse_args()
+    
+    truth = None
+    if os.path.exists(args.ground_truth):
+        with open(args.ground_truth, 'r', encoding='utf-8') as f:
+            truth = np.array(json.load(f)['timestamps'], dtype=float)
+    else:
+        print(f"ВНИМАНИЕ: Няма {args.ground_truth} - измерва се само времето (пусни manual_sync.py)")
+    
+    # Декодирането (и resampling) се записва в кеша веднъж, извън измерването
+    for name in PROFILES:
+        params = get_profile(name)
+        load_audio(args.audio_file, sr=params['sample_rate'], dtype=params['dtype'], res_type=params['res_type'])
+    
+    # Загряване на numba/FFT кешовете, за да не се отчита в първия профил
+    run_profile(args.audio_file, args.lyrics, 'draft', 1)
+    
+    print(f"Аудио: {args.audio_file}, най-добро от {args.repeat}")
+    print()
+    print(f"{'Профил':<10} {'sr':>7} {'hop':>5} {'анализ':>10} {'синхр.':>9} "
+          f"{'ср. грешка':>11} {'медиана':>9} {'p90':>8} {'≤100ms':>7} {'≤250ms':>7}")
+    print("-" * 92)
+    
+    results = {}
+    for name in PROFILES:
+        params = get_profile(name)
+        t_analysis, t_sync, starts = run_profile(args.audio_file, args.lyrics, name, args.repeat)
+        result = dict(params, analysis_seconds=t_analysis, sync_seconds=t_sync)
+        line = (f"{name:<10} {str(params['sample_rate'] or 'native'):>7} {params['hop_length']:>5} "
+                f"{t_analysis * 1000:8.0f}ms {t_sync * 1000:7.0f}ms")
+        if truth is not None:
+            stats = error_stats(starts, truth)
+            result.update(stats)
+            line += (f" {stats['mean_error'] * 1000:9.0f}ms {stats['median_error'] * 1000:7.0f}ms "
+                     f"{stats['p90_error'] * 1000:6.0f}ms {stats['within_100ms']:7.0%} {stats['within_250ms']:7.0%}")
+        print(line)
+        results[name] = result
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'audio': args.audio_file, 'repeat': args.repeat, 'profiles': results},
+                      f, indent=2, ensure_ascii=False)
+        print(f"\nРезултатите са записани в: {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: рендиране на видеоклипа с moviepy срещу директно през ffmpeg
+Пуска create_video_simple.create_sample_video с всеки backend върху един и същ таймлайн и аудио.
+Картите се зареждат в кеша на кадрите предварително, така че се измерва само композирането и
+кодирането. Проверката на таймлайна е изключена (бенчмаркът работи и с невалиден таймлайн).
+
+Употреба: python benchmarks/benchmark_render.py [аудио файл] [Timeline.md] [--end SECONDS]
+          [--backends moviepy ffmpeg ffmpeg-vfr] [--jobs N] [--render-profile draft|final]
+          [--output render.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from create_video_simple import create_sample_video
+from render_profiles import add_render_profile_argument
+
+# Име -> аргументи на create_sample_video
+BACKENDS = {
+    'moviepy': {'backend': 'moviepy'},
+    'ffmpeg': {'backend': 'ffmpeg'},
+    'ffmpeg-vfr': {'backend': 'ffmpeg', 'vfr': True}
+}
+
+def render(audio_file, timeline_file, segment, options):
+    """Рендира във временен файл и връща (секунди, размер на файла)"""
+    with tempfile.TemporaryDirectory(prefix='benchmark_render_') as temp_dir:
+        output_file = os.path.join(temp_dir, 'out.mp4')
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            t0 = time.perf_counter()
+            create_sample_video(audio_file, timeline_file, output_file, segment=segment, validate=False, **options)
+            seconds = time.perf_counter() - t0
+        return seconds, os.path.getsize(output_file)
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк на рендирането (moviepy срещу ffmpeg)')
+    parser.add_argument('audio', nargs='?', default='FakeNews.wav')
+    parser.add_argument('timeline', nargs='?', default='Timeline.md')
+    parser.add_argument('--end', type=float, help='рендиране само до SECONDS (по подразбиране цялата песен)')
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument('--jobs', type=int, default=1, help='паралелни процеси (отрязъци, виж parallel_render.py)')
+    add_render_profile_argument(parser)
+    parser.add_argument('--output', help='запис на резултатите като JSON')
+    args = parser.parse_args()
+    
+    segment = None if args.end is None else (0.0, args.end)
+    # Затопляне на кеша на кадрите (бързият ffmpeg-vfr рисува всички карти веднъж)
+    render(args.audio, args.timeline, segment, dict(BACKENDS['ffmpeg-vfr'], render_profile=args.render_profile))
+    
+    results = {}
+    print(f"{'Backend':<12} {'време':>9} {'файл':>10}")
+    print("-" * 34)
+    for name in args.backends:
+        options = dict(BACKENDS[name], jobs=args.jobs, render_profile=args.render_profile)
+        seconds, size = render(args.audio, args.timeline, segment, options)
+        results[name] = {'seconds': seconds, 'bytes': size}
+        print(f"{name:<12} {seconds:8.2f}s {size / 1e6:8.2f} MB")
+    
+    if 'moviepy' in results:
+        print()
+        for name, result in results.items():
+            if name != 'moviepy':
+                print(f"{name}: {results['moviepy']['seconds'] / result['seconds']:.1f}x по-бързо от moviepy")
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'audio': args.audio, 'timeline': args.timeline, 'end': args.end, 'jobs': args.jobs,
+                       'render_profile': args.render_profile,
+                       'results': results},
+                      f, indent=2)
+        print(f"Резултатите са записани в: {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: време за стартиране на командния ред и на импорта на модулите
+Пуска всяка проверка в отделен процес (най-доброто от N пъти) и проверява, че тежките
+библиотеки (librosa, scipy, moviepy, numba) не се импортират, преди да са нужни.
+Връща код 1, ако някоя проверка е по-бавна от бюджета или импортира тежка библиотека.
+
+Употреба: python benchmarks/benchmark_startup.py [--repeat N] [--budget-ms 400]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ('librosa', 'scipy', 'moviepy', 'numba', 'imageio', 'soundfile')
+
+# (име, аргументи на fakenews.py)
+CLI_CHECKS = [
+    ('fakenews.py --help', ['--help']),
+    ('fakenews.py analyze --help', ['analyze', '--help']),
+    ('fakenews.py sync --help', ['sync', '--help']),
+    ('fakenews.py manual-sync --help', ['manual-sync', '--help']),
+    ('fakenews.py export --help', ['export', '--help']),
+    ('fakenews.py render --help', ['render', '--help']),
+    ('fakenews.py daemon --help', ['daemon', '--help']),
+]
+
+# Модули, които трябва да се импортират без тежки библиотеки
+IMPORT_CHECKS = ['fakenews', 'analyze_audio', 'sync_lyrics', 'manual_sync', 'create_video',
+                 'create_video_simple', 'batch_analyze', 'analysis_daemon']
+
+IMPORT_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t0
+print(json.dumps({{'seconds': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def best_of(command, repeat):
+    """Най-доброто време на процес от repeat пускания"""
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def probe_import(module, repeat):
+    """Време за импорт на модула (в нов процес) и кои тежки библиотеки е заредил"""
+    best = None
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                                cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк на времето за стартиране')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=400.0,
+                        help='максимално допустимо време за стартиране на команда (ms)')
+    args = parser.parse_args()
+    
+    failures = []
+    baseline = best_of([sys.executable, '-c', 'pass'], args.repeat)
+    print(f"Празен интерпретатор: {baseline * 1000:.0f} ms (най-добро от {args.repeat})")
+    print()
+    print(f"{'Команда':<36} {'време':>9}")
+    print("-" * 48)
+    for name, cli_args in CLI_CHECKS:
+        seconds = best_of([sys.executable, os.path.join(ROOT, 'fakenews.py')] + cli_args, args.repeat)
+        mark = ''
+        if seconds * 1000 > args.budget_ms:
+            mark = '  ✗ над бюджета'
+            failures.append(name)
+        print(f"{name:<36} {seconds * 1000:7.0f}ms{mark}")
+    
+    print()
+    print(f"{'Импорт':<36} {'време':>9}  тежки библиотеки")
+    print("-" * 64)
+    for module in IMPORT_CHECKS:
+        result = probe_import(module, args.repeat)
+        mark = ', '.join(result['heavy']) if result['heavy'] else '-'
+        if result['heavy']:
+            failures.append(f"import {module}")
+        print(f"{module:<36} {result['seconds'] * 1000:7.0f}ms  {mark}")
+    
+    print()
+    if failures:
+        print(f"ГРЕШКА: Регресия при стартиране: {', '.join(failures)}")
+        return 1
+    print(f"Всички проверки са в бюджета от {args.budget_ms:.0f} ms")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Композиране на клиповете по интервален индекс
+CompositeVideoClip на moviepy обхожда всички клипове за всеки кадър, за да види кои се
+показват в момента - цената на кадър расте с броя на редовете. Тук активният клип се намира
+с TimelineIndex (O(log n)), а при неподвижни карти последният кадър се връща наготово, докато
+активният клип не се смени. Клиповете са непрозрачни карти на цял екран, затова се рисува
+само горният (започналият последен) - както би изглеждал резултатът и от CompositeVideoClip.
+"""
+
+import numpy as np
+from profiling import stage
+from timeline_index import TimelineIndex
+
+class TimelineCompositor:
+    """make_frame(t) върху клипове с зададени start/end (по един активен клип в момент)"""
+    
+    def __init__(self, clips, size=(1920, 1080), bg_color=(0, 0, 0), static=True):
+        self.clips = list(clips)
+        self.size = size
+        self.static = static
+        self.index = TimelineIndex([{'start': clip.start, 'end': clip.end} for clip in self.clips])
+        self.background = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+        self.background[:] = bg_color
+        self.last_index = None
+        self.last_frame = None
+        self.evaluated = 0
+        self.reused = 0
+    
+    def frame(self, index, t):
+        """Кадърът на клипа index в момент t (t е времето на целия видеоклип)"""
+        if index < 0:
+            return self.background
+        clip = self.clips[index]
+        if clip.mask is None and tuple(clip.size) == tuple(self.size) and clip.pos(t - clip.start) == (0, 0):
+            return clip.get_frame(t - clip.start)
+        # Карта с прозрачност, друг размер или позиция - върху фона, както в CompositeVideoClip
+        return clip.blit_on(self.background.copy(), t)
+    
+    def make_frame(self, t):
+        index = self.index.active_index(t)
+        if self.static and index == self.last_index:
+            self.reused += 1
+            return self.last_frame
+        with stage('compositor.frame'):
+            frame = self.frame(index, t)
+        self.evaluated += 1
+        self.last_index = index
+        self.last_frame = frame
+        return frame
+    
+    def summary(self):
+        """Колко кадъра са изчислени и колко са повторени"""
+        return f"Кадри: {self.evaluated} изчислени, {self.reused} повторени"
+
+def compose_timeline(clips, duration, size=(1920, 1080), bg_color=(0, 0, 0), static=True):
+    """VideoClip с продължителност duration, който показва активния клип във всеки момент
+    
+    Заменя CompositeVideoClip(clips, size=size).set_duration(duration) за непрозрачни карти;
+    static=False изчислява кадъра наново всеки път (за анимирани клипове). Паузите са с bg_color.
+    """
+    from moviepy.editor import VideoClip
+    compositor = TimelineCompositor(clips, size, bg_color, static)
+    video = VideoClip(compositor.make_frame, duration=duration)
+    video.compositor = compositor
+    return video
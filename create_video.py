@@ -3,68 +3,21 @@
 Скрипт за създаване на примерен видеоклип с синхронизирани текстове
 """
 
-import re
-from moviepy.editor import (
-    AudioFileClip, 
-    TextClip, 
-    CompositeVideoClip, 
-    ColorClip,
-    concatenate_videoclips
-)
-from datetime import timedelta
+import sys
+from compositor import compose_timeline
+from profiling import add_timing_arguments, configure, profiled, report, stage
+from render_profiles import DEFAULT_RENDER_PROFILE, add_render_profile_argument, get_render_profile, scale_layout
+from timeline_format import read_timeline
+from timeline_validation import TimelineValidationError, check_render_timeline
 
-def parse_time(time_str):
-    """Парсва време от формат MM:SS.mmm в секунди"""
-    parts = time_str.split(':')
-    minutes = int(parts[0])
-    seconds_parts = parts[1].split('.')
-    seconds = int(seconds_parts[0])
-    milliseconds = int(seconds_parts[1]) if len(seconds_parts) > 1 else 0
-    return minutes * 60 + seconds + milliseconds / 1000.0
-
-def parse_timeline(timeline_file):
-    """Парсва Timeline.md файла и извлича таймкодовете"""
-    timeline = []
-    current_section = None
-    
-    with open(timeline_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # Намиране на секции и записи
-    section_pattern = r'###\s+([^\n]+)'
-    entry_pattern = r'##\s+\d+\.\s+(\d{2}:\d{2}\.\d{3})\s+-\s+(\d{2}:\d{2}\.\d{3})[^\n]*\n\*\*Текст:\*\*\s+([^\n]+)'
-    
-    sections = re.finditer(section_pattern, content)
-    entries = re.finditer(entry_pattern, content)
-    
-    # Създаване на списък с секции и техните позиции
-    section_list = []
-    for match in sections:
-        section_list.append((match.start(), match.group(1).strip()))
-    
-    # Обработка на записите
-    for entry_match in entries:
-        start_time = parse_time(entry_match.group(1))
-        end_time = parse_time(entry_match.group(2))
-        text = entry_match.group(3).strip()
-        
-        # Определяне на секцията
-        entry_pos = entry_match.start()
-        section = 'Unknown'
-        for i, (sec_pos, sec_name) in enumerate(section_list):
-            if entry_pos > sec_pos:
-                section = sec_name
-            else:
-                break
-        
-        timeline.append({
-            'start': start_time,
-            'end': end_time,
-            'text': text,
-            'section': section
-        })
-    
-    return timeline
+# Размери на текста при 1080 реда (мащабират се според размера на кадъра)
+TEXT_LAYOUT = {
+    'font_size': 60,
+    'fallback_font_size': 50,
+    'margin': 100
+}
+# TextClip версията кодира финалното видео с по-висок bitrate от PIL версията
+FINAL_BITRATE = '8000k'
 
 def get_section_color(section):
     """Връща цвят за различните секции"""
@@ -80,10 +33,14 @@ def get_section_color(section):
     }
     return colors.get(section, ('black', 'white'))
 
+@profiled('create_text_clip')
 def create_text_clip(text, start, end, section, size=(1920, 1080)):
     """Създава текстов клип за даден ред"""
+    from moviepy.editor import ColorClip, CompositeVideoClip, TextClip
+    
     bg_color, text_color = get_section_color(section)
     duration = end - start
+    layout = scale_layout(TEXT_LAYOUT, size)
     
     # Създаване на фонов клип
     bg = ColorClip(size=size, color=bg_color, duration=duration)
@@ -115,11 +72,11 @@ def create_text_clip(text, start, end, section, size=(1920, 1080)):
     try:
         txt_clip = TextClip(
             display_text,
-            fontsize=60,
+            fontsize=layout['font_size'],
             color=text_color,
             font='Arial-Bold',
             method='caption',
-            size=(size[0] - 200, None),
+            size=(size[0] - 2 * layout['margin'], None),
             align='center'
         ).set_duration(duration).set_position(('center', 'center'))
     except Exception:
@@ -127,16 +84,16 @@ def create_text_clip(text, start, end, section, size=(1920, 1080)):
         try:
             txt_clip = TextClip(
                 display_text,
-                fontsize=60,
+                fontsize=layout['font_size'],
                 color=text_color,
                 method='label',
-                size=(size[0] - 200, None)
+                size=(size[0] - 2 * layout['margin'], None)
             ).set_duration(duration).set_position(('center', 'center'))
         except Exception:
             # Последен опит - проста версия
             txt_clip = TextClip(
                 display_text,
-                fontsize=50,
+                fontsize=layout['fallback_font_size'],
                 color=text_color
             ).set_duration(duration).set_position(('center', 'center'))
     
@@ -145,16 +102,38 @@ def create_text_clip(text, start, end, section, size=(1920, 1080)):
     
     return video.set_start(start)
 
-def create_sample_video(audio_file, timeline_file, output_file='FakeNews_Sample.mp4'):
-    """Създава примерен видеоклип"""
+def create_sample_video(audio_file, timeline_file, output_file='FakeNews_Sample.mp4', validate=True,
+                        render_profile=DEFAULT_RENDER_PROFILE, strict=False):
+    """Създава примерен видеоклип (validate=False пропуска проверката на таймлайна, strict=True
+    спира рендирането при грешка в него)
+    
+    render_profile избира размера на кадъра и кодирането (draft или final, виж render_profiles.py).
+    """
+    # moviepy (с imageio/ffmpeg) се импортира само при рендиране - импортът отнема около секунда
+    from moviepy.editor import AudioFileClip
+    
+    profile = get_render_profile(render_profile)
+    if profile['bitrate'] is not None:
+        profile['bitrate'] = FINAL_BITRATE
+    size = profile['size']
+    
     print("Зареждане на таймлайн...")
-    timeline = parse_timeline(timeline_file)
+    timeline = read_timeline(timeline_file)
     
     print(f"Намерени {len(timeline)} записа")
     print("Зареждане на аудио...")
-    audio = AudioFileClip(audio_file)
+    with stage('AudioFileClip'):
+        audio = AudioFileClip(audio_file)
     duration = audio.duration
     
+    if validate:
+        # Със --strict грешен таймлайн спира рендирането преди минутите кодиране
+        try:
+            check_render_timeline(timeline, duration, strict)
+        except Exception:
+            audio.close()
+            raise
+    
     print("Създаване на видеоклипове за всеки ред...")
     clips = []
     
@@ -164,27 +143,34 @@ def create_sample_video(audio_file, timeline_file, output_file='FakeNews_Sample.
             entry['text'],
             entry['start'],
             entry['end'],
-            entry['section']
+            entry['section'],
+            size
         )
         clips.append(clip)
     
     print("Комбиниране на клипове...")
-    final_video = CompositeVideoClip(clips, size=(1920, 1080)).set_duration(duration)
+    # Във всеки кадър се изчислява само активният клип (виж compositor.py)
+    final_video = compose_timeline(clips, duration, size=size)
     
     print("Добавяне на аудио...")
     final_video = final_video.set_audio(audio)
     
     print(f"Експортиране на видео: {output_file}")
     print("Това може да отнеме няколко минути...")
-    final_video.write_videofile(
-        output_file,
-        fps=24,
-        codec='libx264',
-        audio_codec='aac',
-        preset='medium',
-        bitrate='8000k'
-    )
+    with stage('write_videofile'):
+        final_video.write_videofile(
+            output_file,
+            fps=profile['fps'],
+            codec=profile['codec'],
+            audio_codec=profile['audio_codec'],
+            preset=profile['preset'],
+            bitrate=profile['bitrate'],
+            audio_bitrate=profile['audio_bitrate'],
+            audio_fps=profile['audio_fps'] or 44100,
+            ffmpeg_params=None if profile['crf'] is None else ['-crf', str(profile['crf'])]
+        )
     
+    print(final_video.compositor.summary())
     print(f"Видеото е готово: {output_file}")
     
     # Почистване
@@ -193,7 +179,18 @@ def create_sample_video(audio_file, timeline_file, output_file='FakeNews_Sample.
     for clip in clips:
         clip.close()
 
-def main():
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Създаване на примерен видеоклип (TextClip)')
+    parser.add_argument('--no-validate', action='store_true',
+                        help='рендиране без проверка на таймлайна (застъпвания, твърде кратки записи)')
+    parser.add_argument('--strict', action='store_true',
+                        help='рендирането спира, ако таймлайнът има грешки (иначе те само се отпечатват)')
+    add_render_profile_argument(parser)
+    add_timing_arguments(parser)
+    args = parser.parse_args(argv)
+    configure(args)
+    
     audio_file = 'FakeNews.mp3'  # Използваме MP3 за по-бързо обработване
     timeline_file = 'Timeline.md'
     output_file = 'FakeNews_Sample.mp4'
@@ -205,19 +202,28 @@ def main():
     
     if not os.path.exists(audio_file):
         print(f"ГРЕШКА: Не е намерен аудио файл: {audio_file}")
-        return
+        return 1
     
     if not os.path.exists(timeline_file):
         print(f"ГРЕШКА: Не е намерен таймлайн файл: {timeline_file}")
-        return
+        return 1
     
+    status = 0
     try:
-        create_sample_video(audio_file, timeline_file, output_file)
+        create_sample_video(audio_file, timeline_file, output_file, validate=not args.no_validate,
+                            render_profile=args.render_profile, strict=args.strict)
+    except TimelineValidationError as e:
+        print(f"ГРЕШКА: {e}")
+        status = 1
     except Exception as e:
         print(f"ГРЕШКА: {e}")
         import traceback
         traceback.print_exc()
+        status = 1
+    
+    report(args)
+    return status
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
 
@@ -4,58 +4,35 @@
 Използва PIL за създаване на текстови изображения
 """
 
-import re
-from moviepy.editor import AudioFileClip, ImageClip, CompositeVideoClip, concatenate_videoclips
-from PIL import Image, ImageDraw, ImageFont
-import numpy as np
 import os
+import sys
+from functools import lru_cache
+from compositor import compose_timeline
+from profiling import add_timing_arguments, configure, profiled, report, stage
+from frame_cache import FrameCache
+from render_profiles import DEFAULT_RENDER_PROFILE, add_render_profile_argument, get_render_profile, scale_layout
+from timeline_format import read_timeline
+from timeline_validation import TimelineValidationError, check_render_timeline
+from timeline_index import TimelineIndex
+from timeline_parser import parse_time
 
-def parse_time(time_str):
-    """Парсва време от формат MM:SS.mmm в секунди"""
-    parts = time_str.split(':')
-    minutes = int(parts[0])
-    seconds_parts = parts[1].split('.')
-    seconds = int(seconds_parts[0])
-    milliseconds = int(seconds_parts[1]) if len(seconds_parts) > 1 else 0
-    return minutes * 60 + seconds + milliseconds / 1000.0
-
-def parse_timeline(timeline_file):
-    """Парсва Timeline.md файла и извлича таймкодовете"""
-    timeline = []
-    
-    with open(timeline_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # Намиране на секции и записи
-    section_pattern = r'###\s+([^\n]+)'
-    entry_pattern = r'##\s+\d+\.\s+(\d{2}:\d{2}\.\d{3})\s+-\s+(\d{2}:\d{2}\.\d{3})[^\n]*\n\*\*Текст:\*\*\s+([^\n]+)'
-    
-    sections = list(re.finditer(section_pattern, content))
-    entries = list(re.finditer(entry_pattern, content))
-    
-    # Обработка на записите
-    for entry_match in entries:
-        start_time = parse_time(entry_match.group(1))
-        end_time = parse_time(entry_match.group(2))
-        text = entry_match.group(3).strip()
-        
-        # Определяне на секцията
-        entry_pos = entry_match.start()
-        section = 'Unknown'
-        for sec_match in sections:
-            if entry_pos > sec_match.start():
-                section = sec_match.group(1).strip()
-            else:
-                break
-        
-        timeline.append({
-            'start': start_time,
-            'end': end_time,
-            'text': text,
-            'section': section
-        })
-    
-    return timeline
+# Параметри на подредбата на текстовата карта при 1080 реда (мащабират се според размера на кадъра
+# и влизат в ключа на кеша на кадрите)
+CARD_LAYOUT = {
+    'font_size': 80,
+    'margin': 100,
+    'line_height': 100,
+    'outline': 2
+}
+FONT_PATHS = [
+    "/System/Library/Fonts/Helvetica.ttc",
+    "/System/Library/Fonts/Arial.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+    "C:/Windows/Fonts/arial.ttf"
+]
 
 def get_section_colors(section):
     """Връща цветове за различните секции"""
@@ -71,27 +48,58 @@ def get_section_colors(section):
     }
     return colors.get(section, ((0, 0, 0), (255, 255, 255)))
 
+@lru_cache(maxsize=None)
+def load_font(size):
+    """Зарежда шрифта за картите и връща (шрифт, име на шрифта)"""
+    from PIL import ImageFont
+    
+    # Опитваме се със системни шрифтове
+    for path in FONT_PATHS:
+        try:
+            return ImageFont.truetype(path, size), f"{path}:{size}"
+        except OSError:
+            pass
+    # Вграденият шрифт на Pillow (>= 10.1 е мащабируем - иначе черновата и финалното видео
+    # биха имали текст с еднакъв размер в пиксели)
+    try:
+        font = ImageFont.load_default(size)
+    except TypeError:
+        font = ImageFont.load_default()
+    if isinstance(font, ImageFont.FreeTypeFont):
+        return font, f"default:{size}"
+    return font, 'default'
+
+def card_params(text, section, size=(1920, 1080)):
+    """Всичко, от което зависи изображението на картата (ключ за кеша на кадрите)"""
+    bg_color, text_color = get_section_colors(section)
+    layout = scale_layout(CARD_LAYOUT, size)
+    return {
+        'text': text,
+        'colors': [list(bg_color), list(text_color)],
+        'font': load_font(layout['font_size'])[1],
+        'size': list(size),
+        'layout': layout
+    }
+
+@profiled('create_text_image')
 def create_text_image(text, section, size=(1920, 1080)):
     """Създава изображение с текст"""
+    from PIL import Image, ImageDraw
+    
     bg_color, text_color = get_section_colors(section)
     
     # Създаване на изображение
     img = Image.new('RGB', size, bg_color)
     draw = ImageDraw.Draw(img)
-    
-    # Опит за зареждане на шрифт
-    try:
-        # Опитваме се с системни шрифтове
-        font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 80)
-    except:
-        try:
-            font = ImageFont.truetype("/System/Library/Fonts/Arial.ttf", 80)
-        except:
-            # Използване на default шрифт
-            font = ImageFont.load_default()
+    layout = scale_layout(CARD_LAYOUT, size)
+    font = load_font(layout['font_size'])[0]
+    line_height = layout['line_height']
+    outline = layout['outline']
+    # Приблизителна ширина на знак, ако шрифтът не може да бъде измерен
+    char_width = layout['font_size'] // 2
     
     # Разделяне на текста на редове
-    max_width = size[0] - 200
+    max_width = size[0] - 2 * layout['margin']
     words = text.split()
     lines = []
     current_line = []
@@ -109,7 +117,7 @@ def create_text_image(text, section, size=(1920, 1080)):
                 word_width = draw.textsize(word + ' ', font=font)[0]
             except:
                 # Fallback - приблизителна ширина
-                word_width = len(word) * 40
+                word_width = len(word) * char_width
         
         if current_width + word_width <= max_width:
             current_line.append(word)
@@ -124,7 +132,7 @@ def create_text_image(text, section, size=(1920, 1080)):
         lines.append(' '.join(current_line))
     
     # Рисуване на текста
-    total_height = len(lines) * 100
+    total_height = len(lines) * line_height
     start_y = (size[1] - total_height) // 2
     
     for i, line in enumerate(lines):
@@ -136,66 +144,160 @@ def create_text_image(text, section, size=(1920, 1080)):
             try:
                 line_width = draw.textsize(line, font=font)[0]
             except:
-                line_width = len(line) * 40
+                line_width = len(line) * char_width
         
         x = (size[0] - line_width) // 2
-        y = start_y + i * 100
+        y = start_y + i * line_height
         
         # Рисуване с outline за по-добра четимост
-        draw.text((x-2, y-2), line, fill=(0, 0, 0), font=font)
-        draw.text((x+2, y+2), line, fill=(0, 0, 0), font=font)
-        draw.text((x-2, y+2), line, fill=(0, 0, 0), font=font)
-        draw.text((x+2, y-2), line, fill=(0, 0, 0), font=font)
+        draw.text((x-outline, y-outline), line, fill=(0, 0, 0), font=font)
+        draw.text((x+outline, y+outline), line, fill=(0, 0, 0), font=font)
+        draw.text((x-outline, y+outline), line, fill=(0, 0, 0), font=font)
+        draw.text((x+outline, y-outline), line, fill=(0, 0, 0), font=font)
         draw.text((x, y), line, fill=text_color, font=font)
     
     return img
 
-def create_sample_video(audio_file, timeline_file, output_file='FakeNews_Sample.mp4'):
-    """Създава примерен видеоклип"""
+def card_frame(image):
+    """Кадър от PIL изображение като непрекъснат uint8 масив (H, W, 3) за ImageClip"""
+    import numpy as np
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    # np.asarray взема буфера на изображението наведнъж (без PNG кодиране и декодиране)
+    return np.asarray(image)
+
+def segment_timeline(timeline, segment, duration):
+    """Само редовете, които се виждат в отрязъка segment=(start, end), с времена спрямо началото му
+    
+    Връща (таймлайн, начало, край на отрязъка); end None означава до края на песента.
+    """
+    seg_start = segment[0]
+    seg_end = duration if segment[1] is None else min(segment[1], duration)
+    visible = TimelineIndex(timeline).range(seg_start, seg_end)
+    timeline = [dict(timeline[i], start=max(timeline[i]['start'], seg_start) - seg_start,
+                     end=min(timeline[i]['end'], seg_end) - seg_start)
+                for i in sorted(visible)]
+    print(f"Отрязък {seg_start:.3f} - {seg_end:.3f} s: {len(timeline)} записа")
+    return timeline, seg_start, seg_end
+
+def parse_position(value):
+    """Позиция в песента - секунди (82.5) или MM:SS.mmm (01:22.500)"""
+    return parse_time(value) if ':' in value else float(value)
+
+def create_sample_video(audio_file, timeline_file, output_file='FakeNews_Sample.mp4', segment=None, validate=True,
+                        use_cache=True, spill_frames=False, backend='moviepy', vfr=False, jobs=1, chunk=None,
+                        with_audio=True, incremental=False, render_profile=DEFAULT_RENDER_PROFILE, strict=False):
+    """Създава примерен видеоклип
+    
+    segment=(start, end) в секунди рендира само този отрязък (end None означава до края).
+    validate=False пропуска проверката на таймлайна, а strict=True спира рендирането при грешка в
+    него (иначе грешките само се отпечатват); use_cache=False изключва кеша на картите.
+    Кадрите се подават на moviepy като масиви в паметта; spill_frames=True ги записва
+    като PNG в temp_frames/ (за много дълги клипове при малко памет).
+    backend='ffmpeg' подава неподвижните карти директно на ffmpeg (виж ffmpeg_render.py),
+    а vfr=True (само с ffmpeg) записва по един кадър на карта.
+    jobs > 1 рендира отрязъци (по секции или по chunk секунди) в отделни процеси и ги слепва
+    без прекодиране (виж parallel_render.py); with_audio=False записва само видео.
+    incremental=True рендира на отрязъци и кодира наново само тези с променени записи.
+    render_profile избира размера на кадъра и кодирането (draft или final, виж render_profiles.py).
+    """
+    if jobs > 1 or incremental:
+        from parallel_render import render_parallel
+        return render_parallel(audio_file, timeline_file, output_file, segment, validate, use_cache, backend, vfr,
+                               jobs, chunk, incremental, render_profile, strict)
+    if backend == 'ffmpeg':
+        from ffmpeg_render import render_static
+        return render_static(audio_file, timeline_file, output_file, segment, validate, use_cache, vfr, with_audio,
+                             render_profile, strict)
+    
+    profile = get_render_profile(render_profile)
+    size = profile['size']
+    
+    # moviepy (с imageio/ffmpeg) се импортира само при рендиране - импортът отнема около секунда
+    from moviepy.editor import AudioFileClip, ImageClip
+    
     print("Зареждане на таймлайн...")
-    timeline = parse_timeline(timeline_file)
+    timeline = read_timeline(timeline_file)
     
     print(f"Намерени {len(timeline)} записа")
     print("Зареждане на аудио...")
-    audio = AudioFileClip(audio_file)
+    with stage('AudioFileClip'):
+        audio = AudioFileClip(audio_file)
     duration = audio.duration
     
+    if validate:
+        # Със --strict грешен таймлайн спира рендирането преди минутите кодиране
+        try:
+            check_render_timeline(timeline, duration, strict)
+        except Exception:
+            audio.close()
+            raise
+    
+    if segment is not None:
+        timeline, seg_start, seg_end = segment_timeline(timeline, segment, duration)
+        audio = audio.subclip(seg_start, seg_end)
+        duration = seg_end - seg_start
+    
     print("Създаване на видеоклипове за всеки ред...")
     clips = []
     temp_dir = 'temp_frames'
-    os.makedirs(temp_dir, exist_ok=True)
+    if spill_frames:
+        os.makedirs(temp_dir, exist_ok=True)
     
+    cards = FrameCache(enabled=use_cache)
+    # Кадър (масив или път до PNG при spill_frames) за всяка уникална карта
+    frames = {}
     for i, entry in enumerate(timeline):
         print(f"Обработка {i+1}/{len(timeline)}: {entry['text'][:50]}...")
         
-        # Създаване на изображение
-        img = create_text_image(entry['text'], entry['section'])
-        img_path = f"{temp_dir}/frame_{i:04d}.png"
-        img.save(img_path)
+        # Създаване на изображение (еднаквите карти се рисуват веднъж, вкл. между рендиранията)
+        key, img = cards.get(card_params(entry['text'], entry['section'], size),
+                             lambda: create_text_image(entry['text'], entry['section'], size))
+        if key not in frames:
+            if spill_frames:
+                frames[key] = f"{temp_dir}/frame_{len(frames):04d}.png"
+                with stage('save_frame'):
+                    img.save(frames[key])
+            else:
+                # Масивът се подава директно на ImageClip и се споделя от всички еднакви карти
+                with stage('frame_array'):
+                    frames[key] = card_frame(img)
         
         # Създаване на видеоклип от изображението
         clip_duration = entry['end'] - entry['start']
-        clip = ImageClip(img_path, duration=clip_duration).set_start(entry['start'])
+        with stage('ImageClip'):
+            clip = ImageClip(frames[key], duration=clip_duration).set_start(entry['start'])
         clips.append(clip)
     
+    print(cards.summary())
+    # Кешът не расте безкрайно - най-отдавна използваните карти се изтриват
+    cards.prune()
     print("Комбиниране на клипове...")
-    final_video = CompositeVideoClip(clips, size=(1920, 1080)).set_duration(duration)
+    # Във всеки кадър се изчислява само активният клип (виж compositor.py)
+    final_video = compose_timeline(clips, duration, size=size)
     
-    print("Добавяне на аудио...")
-    final_video = final_video.set_audio(audio)
+    if with_audio:
+        print("Добавяне на аудио...")
+        final_video = final_video.set_audio(audio)
     
     print(f"Експортиране на видео: {output_file}")
     print("Това може да отнеме няколко минути...")
-    final_video.write_videofile(
-        output_file,
-        fps=24,
-        codec='libx264',
-        audio_codec='aac',
-        preset='medium',
-        bitrate='5000k',
-        threads=4
-    )
+    with stage('write_videofile'):
+        final_video.write_videofile(
+            output_file,
+            fps=profile['fps'],
+            codec=profile['codec'],
+            audio_codec=profile['audio_codec'],
+            preset=profile['preset'],
+            bitrate=profile['bitrate'],
+            audio_bitrate=profile['audio_bitrate'],
+            audio_fps=profile['audio_fps'] or 44100,
+            threads=profile['threads'],
+            ffmpeg_params=None if profile['crf'] is None else ['-crf', str(profile['crf'])],
+            audio=with_audio
+        )
     
+    print(final_video.compositor.summary())
     print(f"Видеото е готово: {output_file}")
     
     # Почистване на временни файлове
@@ -206,14 +308,46 @@ def create_sample_video(audio_file, timeline_file, output_file='FakeNews_Sample.
     audio.close()
     
     # Изтриване на временни изображения
-    import shutil
-    if os.path.exists(temp_dir):
+    if spill_frames and os.path.exists(temp_dir):
+        import shutil
         shutil.rmtree(temp_dir)
 
-def main():
+def main(argv=None):
+    import argparse
+    from analysis_daemon import DaemonError, add_daemon_argument, request
+    parser = argparse.ArgumentParser(description='Създаване на примерен видеоклип (PIL)')
+    parser.add_argument('--start', type=parse_position, help='начало на отрязък (секунди или MM:SS.mmm)')
+    parser.add_argument('--end', type=parse_position, help='край на отрязък (секунди или MM:SS.mmm)')
+    parser.add_argument('--output', default='FakeNews_Sample.mp4', help='изходен видео файл')
+    parser.add_argument('--no-cache', action='store_true', help='без кеша на текстовите карти (.frame_cache/)')
+    parser.add_argument('--backend', choices=['moviepy', 'ffmpeg'], default='moviepy',
+                        help='ffmpeg записва всяка карта веднъж и я показва с точната ѝ продължителност (по-бързо)')
+    parser.add_argument('--vfr', action='store_true',
+                        help='с --backend ffmpeg: по един кадър на карта (променлива кадрова честота)')
+    parser.add_argument('--jobs', type=int, default=1, metavar='N',
+                        help='рендиране на отрязъци в N паралелни процеса, слепени без прекодиране')
+    parser.add_argument('--chunk', type=float, metavar='SECONDS',
+                        help='с --jobs: отрязъци с фиксирана дължина вместо по секции (с --incremental: 10 s)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='кеш на рендираните отрязъци (.segment_cache/) - кодират се само променените')
+    parser.add_argument('--spill-frames', action='store_true',
+                        help='кадрите минават през PNG файлове в temp_frames/ вместо през паметта')
+    add_render_profile_argument(parser)
+    add_daemon_argument(parser)
+    parser.add_argument('--no-validate', action='store_true',
+                        help='рендиране без проверка на таймлайна (застъпвания, твърде кратки записи)')
+    parser.add_argument('--strict', action='store_true',
+                        help='рендирането спира, ако таймлайнът има грешки (иначе те само се отпечатват)')
+    add_timing_arguments(parser)
+    args = parser.parse_args(argv)
+    configure(args)
+    
     audio_file = 'FakeNews.mp3'
     timeline_file = 'Timeline.md'
-    output_file = 'FakeNews_Sample.mp4'
+    output_file = args.output
+    segment = None
+    if args.start is not None or args.end is not None:
+        segment = (args.start or 0.0, args.end)
     
     # Проверка за MP3, ако няма - използваме WAV
     if not os.path.exists(audio_file):
@@ -221,19 +355,54 @@ def main():
     
     if not os.path.exists(audio_file):
         print(f"ГРЕШКА: Не е намерен аудио файл: {audio_file}")
-        return
+        return 1
     
     if not os.path.exists(timeline_file):
         print(f"ГРЕШКА: Не е намерен таймлайн файл: {timeline_file}")
-        return
+        return 1
     
+    if args.daemon:
+        try:
+            result = request('/render', {
+                'audio': os.path.abspath(audio_file),
+                'timeline': os.path.abspath(timeline_file),
+                'output': os.path.abspath(output_file),
+                'start': args.start,
+                'end': args.end,
+                'validate': not args.no_validate,
+                'strict': args.strict,
+                'cache': not args.no_cache,
+                'backend': args.backend,
+                'vfr': args.vfr,
+                'jobs': args.jobs,
+                'chunk': args.chunk,
+                'incremental': args.incremental,
+                'render_profile': args.render_profile
+            }, url=args.daemon)
+        except DaemonError as e:
+            print(f"ГРЕШКА: {e}")
+            return 1
+        print(f"Видеото е готово: {result['output']} ({result['seconds']:.2f} s)")
+        return 0
+    
+    status = 0
     try:
-        create_sample_video(audio_file, timeline_file, output_file)
+        create_sample_video(audio_file, timeline_file, output_file, segment=segment, validate=not args.no_validate,
+                            use_cache=not args.no_cache, spill_frames=args.spill_frames,
+                            backend=args.backend, vfr=args.vfr, jobs=args.jobs, chunk=args.chunk,
+                            incremental=args.incremental, render_profile=args.render_profile, strict=args.strict)
+    except TimelineValidationError as e:
+        print(f"ГРЕШКА: {e}")
+        status = 1
     except Exception as e:
         print(f"ГРЕШКА: {e}")
         import traceback
         traceback.print_exc()
+        status = 1
+    
+    report(args)
+    return status
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
 
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Индекс на cue точки (onsets и вокални пикове) върху сортирани масиви
+Заявките "най-близкия onset/пик до t" са O(log n) чрез searchsorted и работят векторно
+върху масиви от времена. Използва се от синхронизацията, прилепването на таймлайна
+и инструмента за ръчна синхронизация.
+"""
+
+import numpy as np
+
+def nearest_indices(sorted_times, query):
+    """Връща индексите на най-близките елементи от сортиран масив (векторно, O(log n) за заявка)"""
+    sorted_times = np.asarray(sorted_times)
+    query = np.asarray(query, dtype=float)
+    if len(sorted_times) == 0:
+        raise ValueError("Празен масив от времена")
+    right = np.clip(np.searchsorted(sorted_times, query, side='left'), 0, len(sorted_times) - 1)
+    left = np.clip(right - 1, 0, len(sorted_times) - 1)
+    # При равно разстояние се избира левият елемент (както np.argmin)
+    use_left = np.abs(query - sorted_times[left]) <= np.abs(sorted_times[right] - query)
+    return np.where(use_left, left, right)
+
+class CueIndex:
+    """Сортирани onsets и вокални пикове с вокалната активност по рамки"""
+    
+    def __init__(self, onset_times, vocal_peaks, frame_times=None, activity=None):
+        self.cues = {
+            'onset': np.sort(np.asarray(onset_times, dtype=float)),
+            'peak': np.sort(np.asarray(vocal_peaks, dtype=float))
+        }
+        self.cues['any'] = np.union1d(self.cues['onset'], self.cues['peak'])
+        self.frame_times = None if frame_times is None else np.asarray(frame_times, dtype=float)
+        self.activity = None if activity is None else np.asarray(activity, dtype=float)
+    
+    @classmethod
+    def from_analysis(cls, analysis):
+        """Създава индекс от речника на analyze_vocal_activity"""
+        return cls(
+            analysis['onset_times'],
+            analysis['vocal_peaks'],
+            frame_times=analysis.get('rms_times'),
+            activity=analysis.get('vocal_activity')
+        )
+    
+    def nearest(self, t, kind='any'):
+        """Най-близката cue точка до t (t може да е скалар или масив); без cue точки - самото t"""
+        times = self.cues[kind]
+        t_arr = np.asarray(t, dtype=float)
+        result = times[nearest_indices(times, t_arr)] if len(times) else t_arr
+        return float(result) if np.ndim(t) == 0 else result
+    
+    def within(self, t, tolerance, kind='any'):
+        """Най-близката cue точка до t, ако е на не повече от tolerance секунди, иначе t"""
+        times = self.cues[kind]
+        t_arr = np.asarray(t, dtype=float)
+        if len(times) == 0:
+            return float(t_arr) if np.ndim(t) == 0 else t_arr
+        nearest = times[nearest_indices(times, t_arr)]
+        result = np.where(np.abs(nearest - t_arr) <= tolerance, nearest, t_arr)
+        return float(result) if np.ndim(t) == 0 else result
+    
+    def range(self, start, end, kind='any'):
+        """Всички cue точки в интервала [start, end)"""
+        times = self.cues[kind]
+        lo, hi = np.searchsorted(times, [start, end], side='left')
+        return times[lo:hi]
+    
+    def activity_at(self, t):
+        """Вокалната активност в рамката, най-близка до t"""
+        if self.activity is None:
+            raise ValueError("Индексът няма данни за вокална активност")
+        return self.activity[nearest_indices(self.frame_times, t)]
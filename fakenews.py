@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Общ команден ред за целия процес: анализ, синхронизация, ръчна синхронизация, рендиране, експорт
+Всяка подкоманда импортира своя модул едва когато бъде избрана, така че librosa, scipy и moviepy
+се зареждат само от командите, които наистина ги използват.
+
+Употреба:
+    python fakenews.py analyze [--analysis-profile draft] [--timings]
+    python fakenews.py sync [--audio FakeNews.wav] [--lyrics Lyrics.md] [--output Timeline.md]
+    python fakenews.py manual-sync [--snap 0.15]
+    python fakenews.py export [--sync-data sync_data.json] [--output Timeline.md]
+    python fakenews.py render [--engine pil|textclip] [--timings]
+    python fakenews.py batch album/ -w 4
+    python fakenews.py daemon [--preload FakeNews.wav]
+"""
+
+import argparse
+import importlib
+import os
+import sys
+
+# Подкоманда -> (модул с main(argv), описание)
+COMMANDS = {
+    'analyze': ('analyze_audio', 'структурен анализ и таймлайн по приблизителни продължителности'),
+    'sync': ('sync_lyrics', 'прецизна синхронизация по вокалната активност'),
+    'manual-sync': ('manual_sync', 'интерактивна ръчна синхронизация'),
+    'export': (None, 'таймлайн от запазената ръчна синхронизация (sync_data.json)'),
+    'render': ('create_video_simple', 'примерен видеоклип (--engine textclip за create_video.py)'),
+    'batch': ('batch_analyze', 'пакетен анализ на много песни'),
+    'daemon': ('analysis_daemon', 'резидентен сървър за анализ (--daemon в останалите команди)'),
+}
+
+RENDER_ENGINES = {
+    'pil': 'create_video_simple',
+    'textclip': 'create_video'
+}
+
+def run_export(argv):
+    """Създава Timeline.md от sync_data.json без интерактивна сесия"""
+    parser = argparse.ArgumentParser(prog='fakenews.py export', description=COMMANDS['export'][1])
+    parser.add_argument('--audio', default='FakeNews.wav', help='аудио файл (за продължителността)')
+    parser.add_argument('--lyrics', default='Lyrics.md', help='файл с текстовете')
+    parser.add_argument('--sync-data', default='sync_data.json', help='таймкодове от manual-sync')
+    parser.add_argument('--output', default='Timeline.md', help='изходен таймлайн')
+    parser.add_argument('--snap', type=float, default=0.0, metavar='SECONDS',
+                        help='прилепване към onset в рамките на SECONDS')
+    parser.add_argument('--beat-snap', type=float, default=0.0, metavar='SECONDS',
+                        help='прилепване към удар в рамките на SECONDS')
+    from timeline_writer import add_timeline_arguments
+    add_timeline_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    from manual_sync import (create_timeline_from_sync, export_timeline, get_duration,
+                             load_beat_grid, load_cue_index, load_lyrics, load_sync_data)
+    
+    for path in (args.audio, args.lyrics, args.sync_data):
+        if not os.path.exists(path):
+            print(f"ГРЕШКА: Не е намерен файл: {path}")
+            return 1
+    
+    sync_data = load_sync_data(args.sync_data)
+    lyrics_lines = load_lyrics(args.lyrics)
+    duration = get_duration(args.audio)
+    cue_index = load_cue_index(args.audio) if args.snap > 0 else None
+    beat_grid = load_beat_grid(args.audio) if args.beat_snap > 0 else None
+    timeline = create_timeline_from_sync(sync_data, lyrics_lines, duration, cue_index, args.snap,
+                                         beat_grid, args.beat_snap)
+    export_timeline(timeline, args.output, args.overwrite_edits)
+    return 0
+
+def print_usage():
+    """Отпечатва списъка с подкоманди"""
+    print("Употреба: python fakenews.py <команда> [аргументи]")
+    print()
+    print("Команди:")
+    for name, (_, description) in COMMANDS.items():
+        print(f"  {name:<13} {description}")
+    print()
+    print("python fakenews.py <команда> --help показва аргументите на командата")
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0] in ('-h', '--help'):
+        print_usage()
+        return 0
+    
+    command, rest = argv[0], argv[1:]
+    if command not in COMMANDS:
+        print(f"ГРЕШКА: Непозната команда: {command}")
+        print_usage()
+        return 2
+    
+    if command == 'export':
+        return run_export(rest)
+    
+    module_name = COMMANDS[command][0]
+    if command == 'render':
+        engine_parser = argparse.ArgumentParser(add_help=False)
+        engine_parser.add_argument('--engine', choices=list(RENDER_ENGINES), default='pil')
+        engine_args, rest = engine_parser.parse_known_args(rest)
+        module_name = RENDER_ENGINES[engine_args.engine]
+    
+    # Тежките зависимости идват с модула на избраната команда
+    module = importlib.import_module(module_name)
+    sys.argv[0] = f"fakenews.py {command}"
+    return module.main(rest) or 0
+
+if __name__ == '__main__':
+    sys.exit(main())
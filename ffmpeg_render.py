@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Рендиране на статичните текстови карти директно през ffmpeg (без moviepy)
+Всяка карта е неподвижно изображение, показано от start до end, затова не е нужно Python да
+композира и подава 24 кадъра в секунда. Всяка уникална карта се записва веднъж като PNG (в кеша
+на кадрите), а ffmpeg получава списък за concat демултиплексора с точната продължителност на
+всяка карта (черен кадър в паузите) и смесва аудиото директно от файла.
+"""
+
+import os
+import subprocess
+import tempfile
+from profiling import stage
+from render_profiles import DEFAULT_RENDER_PROFILE, audio_arguments, get_render_profile, quality_arguments
+
+VFR_TIMEBASE = 1000                # времева база на картите при vfr (милисекунди, както в Timeline.md)
+VFR_TAIL = 1.0 / VFR_TIMEBASE      # последният кадър при vfr - отбелязва края на видеото
+
+def ffmpeg_exe():
+    """Пътят до ffmpeg (този на imageio-ffmpeg, който идва с moviepy)"""
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return 'ffmpeg'
+
+def build_segments(timeline, duration):
+    """Поредица от (ключ на карта или None за черен кадър, продължителност), покриваща [0, duration]"""
+    segments = []
+    t = 0.0
+    for entry in sorted(timeline, key=lambda entry: entry['start']):
+        start = max(entry['start'], t)
+        end = min(entry['end'], duration)
+        if end <= start:
+            continue
+        if start > t:
+            segments.append((None, start - t))
+        segments.append((entry['key'], end - start))
+        t = end
+    if t < duration:
+        segments.append((None, duration - t))
+    return segments
+
+def concat_list(segments, paths, vfr=False):
+    """Съдържание на списъка за concat демултиплексора
+    
+    При vfr=True картите се четат с времева база 1/VFR_TIMEBASE вместо 1/25 s (иначе 0.5 s става
+    0.52 s), а последният кадър се повтаря VFR_TAIL секунди преди края - mp4 пази продължителността
+    на кадър само като разлика до следващия, така че без него видеото свършва с началото на
+    последната карта.
+    """
+    lines = ['ffconcat version 1.0']
+    option = [f"option framerate {VFR_TIMEBASE}"] if vfr else []
+    for i, (key, length) in enumerate(segments):
+        if vfr and i == len(segments) - 1 and length > 2 * VFR_TAIL:
+            length -= VFR_TAIL
+        path = os.path.abspath(paths[key]).replace("'", "'\\''")
+        lines.append(f"file '{path}'")
+        lines += option
+        lines.append(f"duration {length:.6f}")
+    # Последният файл се повтаря, иначе concat пренебрегва продължителността му
+    if segments:
+        path = os.path.abspath(paths[segments[-1][0]]).replace("'", "'\\''")
+        lines.append(f"file '{path}'")
+        lines += option
+    return '\n'.join(lines) + '\n'
+
+def encode_command(list_file, audio_file, output_file, audio_start, duration, profile=None, vfr=False):
+    """Командата на ffmpeg: карти от concat списъка + аудио от файла (audio_file None - без звук)
+    
+    vfr=True записва по един кадър на карта (променлива кадрова честота).
+    """
+    params = profile or get_render_profile()
+    if vfr:
+        # Всяка карта е един кадър с продължителността си - кодират се десетки кадри, а не хиляди
+        # Без B-кадри - с тях mp4 файлът получава грешна продължителност при неравномерни кадри
+        video_filter = ['-fps_mode', 'vfr', '-vf', 'format=yuv420p', '-bf', '0']
+    else:
+        video_filter = ['-vf', f"fps={params['fps']},format=yuv420p"]
+    if audio_file is None:
+        audio_input = []
+        audio_output = ['-map', '0:v:0', '-an']
+    else:
+        audio_input = ['-ss', f"{audio_start:.6f}", '-t', f"{duration:.6f}", '-i', audio_file]
+        audio_output = ['-map', '0:v:0', '-map', '1:a:0'] + audio_arguments(params)
+    return [
+        ffmpeg_exe(), '-y', '-loglevel', 'error',
+        '-f', 'concat', '-safe', '0', '-i', list_file
+    ] + audio_input + video_filter + [
+        '-c:v', params['codec'], '-preset', params['preset'], '-tune', 'stillimage'
+    ] + quality_arguments(params) + [
+        '-threads', str(params['threads'])
+    ] + audio_output + [
+        '-t', f"{duration:.6f}",
+        output_file
+    ]
+
+def render_static(audio_file, timeline_file, output_file='FakeNews_Sample.mp4', segment=None, validate=True,
+                  use_cache=True, vfr=False, with_audio=True, render_profile=DEFAULT_RENDER_PROFILE, strict=False):
+    """Създава видеоклипа с ffmpeg (същите аргументи като create_video_simple.create_sample_video)
+    
+    vfr=True записва по един кадър на карта вместо постоянни 24 кадъра в секунда;
+    with_audio=False записва само видео (отрязъците на паралелното рендиране), а render_profile
+    задава размера на кадъра и кодирането (виж render_profiles.py).
+    """
+    from PIL import Image
+    from audio_cache import get_duration
+    from create_video_simple import card_params, create_text_image, segment_timeline
+    from frame_cache import FrameCache
+    from timeline_format import read_timeline
+    from timeline_validation import check_render_timeline
+    
+    profile = get_render_profile(render_profile)
+    size = profile['size']
+    print("Зареждане на таймлайн...")
+    timeline = read_timeline(timeline_file)
+    print(f"Намерени {len(timeline)} записа")
+    duration = get_duration(audio_file)
+    if validate:
+        check_render_timeline(timeline, duration, strict)
+    
+    audio_start = 0.0
+    if segment is not None:
+        timeline, audio_start, seg_end = segment_timeline(timeline, segment, duration)
+        duration = seg_end - audio_start
+    
+    with tempfile.TemporaryDirectory(prefix='fakenews_ffmpeg_') as temp_dir:
+        # Всяка уникална карта се записва веднъж (директно от кеша на кадрите, ако е включен)
+        cards = FrameCache(enabled=use_cache)
+        paths = {}
+        
+        def card_path(key, image):
+            if key not in paths:
+                cached = cards.path(key)
+                if use_cache and os.path.exists(cached):
+                    paths[key] = cached
+                else:
+                    paths[key] = os.path.join(temp_dir, f"{key}.png")
+                    image.save(paths[key], compress_level=1)
+            return paths[key]
+        
+        keyed = []
+        with stage('ffmpeg.cards'):
+            for entry in timeline:
+                params = card_params(entry['text'], entry['section'], size)
+                key, image = cards.get(params, lambda: create_text_image(entry['text'], entry['section'], size))
+                card_path(key, image)
+                keyed.append(dict(entry, key=key))
+            blank_key, blank = cards.get({'blank': [0, 0, 0], 'size': list(size)},
+                                         lambda: Image.new('RGB', size, (0, 0, 0)))
+            paths[None] = card_path(blank_key, blank)
+        print(cards.summary())
+        
+        segments = build_segments(keyed, duration)
+        list_file = os.path.join(temp_dir, 'cards.ffconcat')
+        with open(list_file, 'w', encoding='utf-8') as f:
+            f.write(concat_list(segments, paths, vfr))
+        
+        print(f"Експортиране на видео (ffmpeg, {len(segments)} неподвижни сегмента): {output_file}")
+        command = encode_command(list_file, audio_file if with_audio else None, output_file, audio_start, duration,
+                                 profile, vfr)
+        with stage('ffmpeg.encode'):
+            result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg завърши с код {result.returncode}: {result.stderr.strip()[-500:]}")
+        # След кодирането - дотогава ffmpeg чете картите директно от кеша
+        cards.prune()
+    
+    print(f"Видеото е готово: {output_file}")
+    return output_file
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Кеш на текстовите карти (кадрите с текста на всеки ред)
+Ключът е хеш на всичко, от което зависи изображението - текст, цветове на секцията, шрифт,
+размер и параметри на подредбата. Еднаквите карти (например повтарящите се редове от припева)
+се рисуват веднъж, а при повторно рендиране с непроменен текст не се рисува нищо - картите се
+зареждат от `.frame_cache/` като PNG.
+Всяко зареждане обновява mtime на картата, а след рендиране кешът се свива до FRAME_MAX_BYTES,
+като първи се изтриват най-отдавна използваните карти.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+from profiling import stage
+
+CACHE_DIR = '.frame_cache'
+CACHE_VERSION = 1
+FRAME_MAX_BYTES = 200 * 1024 ** 2  # 200 MB - около 10 000 карти 1920x1080 (по ~20 KB)
+
+def card_key(params):
+    """Хеш на параметрите на картата"""
+    data = json.dumps([CACHE_VERSION, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+class FrameCache:
+    """Карти в паметта (за текущото рендиране) и на диска (между рендиранията)"""
+    
+    def __init__(self, cache_dir=CACHE_DIR, enabled=True):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.images = {}
+        self.rendered = 0
+        self.loaded = 0
+        self.reused = 0
+    
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.png")
+    
+    def get(self, params, render):
+        """Връща (ключ, PIL изображение) на картата; render() се вика само ако я няма в кеша"""
+        key = card_key(params)
+        if key in self.images:
+            self.reused += 1
+            return key, self.images[key]
+        
+        path = self.path(key)
+        image = None
+        if self.enabled and os.path.exists(path):
+            from PIL import Image
+            try:
+                with stage('frame_cache.load'):
+                    with Image.open(path) as cached:
+                        image = cached.convert('RGB')
+                # mtime е времето на последното използване (за prune)
+                os.utime(path)
+                self.loaded += 1
+            except OSError:
+                image = None
+        if image is None:
+            image = render()
+            self.rendered += 1
+            if self.enabled:
+                self.save(path, image)
+        self.images[key] = image
+        return key, image
+    
+    def save(self, path, image):
+        """Записва картата атомарно"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + f'.{os.getpid()}.tmp'
+        with stage('frame_cache.save'):
+            # Картите са с плътни цветове - и ниската степен на компресия ги прави малки
+            image.save(tmp_path, format='PNG', compress_level=1)
+        os.replace(tmp_path, path)
+    
+    def prune(self, max_bytes=FRAME_MAX_BYTES):
+        """Изтрива най-отдавна използваните карти, докато кешът стане до max_bytes
+        
+        Картите на текущото рендиране не се изтриват. Връща броя изтрити карти.
+        """
+        if not self.enabled:
+            return 0
+        files = list_cards(self.cache_dir)
+        total = sum(size for _, size, _ in files)
+        keep = {os.path.abspath(self.path(key)) for key in self.images}
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= max_bytes:
+                break
+            if os.path.abspath(path) in keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Изтрита междувременно от друг процес (паралелното рендиране)
+                pass
+            total -= size
+            removed += 1
+        return removed
+    
+    def summary(self):
+        """Кратко описание колко карти са нарисувани, заредени и преизползвани"""
+        return (f"Карти: {self.rendered} нарисувани, {self.loaded} от кеша, "
+                f"{self.reused} повторени")
+
+def list_cards(cache_dir=CACHE_DIR):
+    """Картите в кеша като [(mtime, размер, път), ...]"""
+    files = []
+    if not os.path.isdir(cache_dir):
+        return files
+    for root, _, names in os.walk(cache_dir):
+        for name in names:
+            if name.endswith('.png'):
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+    return files
+
+def clear_cache(cache_dir=CACHE_DIR):
+    """Изтрива всички карти от кеша и връща броя им"""
+    if not os.path.isdir(cache_dir):
+        return 0
+    removed = len(list_cards(cache_dir))
+    shutil.rmtree(cache_dir)
+    return removed
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Кеш на текстовите карти')
+    parser.add_argument('--clear', action='store_true', help='изтриване на кеша')
+    parser.add_argument('--max-size', type=float, metavar='MB',
+                        help='изтриване на най-отдавна използваните карти над MB мегабайта')
+    args = parser.parse_args(argv)
+    
+    if args.clear:
+        print(f"Изтрити карти от кеша: {clear_cache()}")
+        return 0
+    if args.max_size is not None:
+        print(f"Изтрити карти от кеша: {FrameCache().prune(int(args.max_size * 1024 ** 2))}")
+    
+    files = list_cards()
+    print(f"{CACHE_DIR}: {len(files)} карти, {sum(size for _, size, _ in files) / 1024 ** 2:.1f} MB")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
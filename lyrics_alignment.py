@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Подравняване на редовете от текста към аудио cue точки с динамично програмиране
+За всеки ред се избира по една cue точка (onset, вокален пик или точка от равномерна мрежа)
+така, че общата цена да е минимална. Цената отчита очакваната дължина на реда (по брой срички),
+вокалната активност в точката и близостта на началото на секция до граница на секция.
+Търсенето е ограничено в лента около очакваната позиция на всеки ред, а предшествениците на
+всяка точка - в прозорец от допустими дължини на предишния ред (searchsorted). Прозорецът
+зависи само от дължината на реда, а не от лентата, така че времето е O(редове × cues в лентата)
+и скалира до дълги песни с хиляди onsets.
+"""
+
+import numpy as np
+from cue_index import nearest_indices
+
+VOWELS = set('аъоуеиюяѝэыaeiouyАЪОУЕИЮЯЍЭЫAEIOUY')
+
+# Тегла на отделните компоненти на цената
+DURATION_WEIGHT = 1.0      # отклонение от очакваната дължина на реда (логаритмично)
+STRENGTH_WEIGHT = 0.5      # слаба вокална активност в cue точката
+BOUNDARY_WEIGHT = 1.0      # начало на секция далеч от граница на секция
+POSITION_WEIGHT = 0.5      # отдалечаване от очакваната позиция в песента
+GRID_PENALTY = 0.5         # точка от мрежата вместо реален onset/пик
+MAX_LENGTH_RATIO = 4.0     # най-много толкова пъти очакваната дължина на ред (цена над 1.9)
+
+def count_syllables(line):
+    """Приблизителен брой срички в реда (брой гласни)"""
+    return max(1, sum(1 for ch in line if ch in VOWELS))
+
+def build_cues(onset_times, vocal_peaks, duration, activity=None, activity_times=None, grid_step=0.25):
+    """Обединява onsets, вокални пикове и равномерна мрежа в сортиран набор от cue точки
+    
+    Връща (times, strength, is_grid). strength е вокалната активност (0..1) в точката,
+    а мрежата гарантира, че винаги има допустимо решение.
+    """
+    real = np.unique(np.concatenate([np.asarray(onset_times, dtype=float),
+                                     np.asarray(vocal_peaks, dtype=float)]))
+    grid = np.arange(0.0, duration, grid_step)
+    times = np.concatenate([real, grid])
+    is_grid = np.concatenate([np.zeros(len(real), dtype=bool), np.ones(len(grid), dtype=bool)])
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+    is_grid = is_grid[order]
+    
+    if activity is not None and len(activity) > 0:
+        activity = np.asarray(activity, dtype=float)
+        span = np.max(activity) - np.min(activity)
+        activity = (activity - np.min(activity)) / (span + 1e-10)
+        strength = activity[nearest_indices(activity_times, times)]
+    else:
+        strength = np.where(is_grid, 0.0, 1.0)
+    
+    return times, strength, is_grid
+
+def stanza_starts(lyrics_text):
+    """Връща индексите на редовете, които започват нова строфа (след празен ред или коментар)"""
+    starts = []
+    index = 0
+    new_stanza = True
+    for raw in lyrics_text.splitlines():
+        line = raw.strip()
+        if not line or line.startswith('//'):
+            new_stanza = True
+            continue
+        if new_stanza:
+            starts.append(index)
+            new_stanza = False
+        index += 1
+    return starts
+
+def quiet_boundaries(activity, times, percentile=25, min_gap=1.5):
+    """Намира вероятни граници на секции - моментите, в които вокалът се връща след тиха част"""
+    activity = np.asarray(activity, dtype=float)
+    if len(activity) < 2:
+        return np.array([])
+    hop = times[1] - times[0]
+    
+    # Изглаждане с плъзгаща средна от ~0.5 s
+    width = max(1, int(round(0.5 / hop)))
+    smooth = np.convolve(activity, np.ones(width) / width, mode='same')
+    quiet = smooth < np.percentile(smooth, percentile)
+    
+    # Начала и краища на тихите участъци
+    edges = np.diff(np.concatenate([[0], quiet.astype(np.int8), [0]]))
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)
+    long_runs = (run_ends - run_starts) * hop >= min_gap
+    ends = run_ends[long_runs]
+    return times[np.minimum(ends, len(times) - 1)]
+
+def _duration_cost(durations, expected, one_sided):
+    """Цена за отклонение от очакваната дължина (в логаритмичен мащаб)"""
+    ratio = np.log(np.maximum(durations, 1e-3) / expected)
+    if one_sided:
+        # Последният ред на секция може да продължи през инструментална част
+        ratio = np.minimum(ratio, 0.0)
+    return DURATION_WEIGHT * ratio ** 2
+
+def _best_predecessors(times, prev_times, prev_cost, expected, one_sided, min_line):
+    """Най-добрият предишен кандидат за всяка точка в times (индекси в prev_times и цените им)
+    
+    Разглеждат се само предшественици, за които дължината на предишния ред е в
+    [min_line, MAX_LENGTH_RATIO × expected] - прозорецът се намира със searchsorted върху
+    сортираните prev_times. При one_sided дължините над expected нямат цена, затова за тях
+    е достатъчен префиксният минимум на prev_cost.
+    """
+    upper = max(expected, min_line) if one_sided else max(MAX_LENGTH_RATIO * expected, min_line)
+    lo = np.searchsorted(prev_times, times - upper, side='right' if one_sided else 'left')
+    hi = np.searchsorted(prev_times, times - min_line, side='right')
+    
+    # Прозорците са с различна дължина - матрица (точки × най-дългия прозорец) с маска
+    width = int(np.max(hi - lo)) if len(times) else 0
+    cols = lo[:, None] + np.arange(max(width, 1))[None, :]
+    valid = cols < hi[:, None]
+    cols = np.minimum(cols, len(prev_times) - 1)
+    trans = _duration_cost(times[:, None] - prev_times[cols], expected, one_sided)
+    total = np.where(valid, prev_cost[cols] + trans, np.inf)
+    best = np.argmin(total, axis=1)
+    rows = np.arange(len(times))
+    pred, cost = cols[rows, best], total[rows, best]
+    
+    if one_sided:
+        # Предшественици с дължина >= upper: цената на прехода е 0
+        running = np.minimum.accumulate(prev_cost)
+        argmin = np.maximum.accumulate(np.where(prev_cost <= running, np.arange(len(prev_cost)), 0))
+        far = lo - 1
+        has_far = far >= 0
+        far_cost = np.where(has_far, running[np.maximum(far, 0)], np.inf)
+        use_far = far_cost < cost
+        pred = np.where(use_far, argmin[np.maximum(far, 0)], pred)
+        cost = np.where(use_far, far_cost, cost)
+    return pred, cost
+
+def align_lines(cue_times, cue_strength, cue_is_grid, line_weights, section_starts=None,
+                section_boundaries=None, vocal_start=0.0, vocal_end=None, band=None, min_line=0.6):
+    """Избира по една cue точка за всеки ред с динамично програмиране
+    
+    Връща (начала на редовете, очаквани дължини) или None, ако няма допустимо решение.
+    """
+    cue_times = np.asarray(cue_times, dtype=float)
+    n_lines = len(line_weights)
+    if n_lines == 0 or len(cue_times) == 0:
+        return None
+    if vocal_end is None or vocal_end <= vocal_start:
+        vocal_end = cue_times[-1]
+    
+    # Очаквани начала и дължини на редовете, пропорционални на броя срички
+    weights = np.asarray(line_weights, dtype=float)
+    span = max(vocal_end - vocal_start, min_line * n_lines)
+    expected_len = span * weights / weights.sum()
+    expected_start = vocal_start + np.concatenate([[0.0], np.cumsum(expected_len)[:-1]])
+    if band is None:
+        band = min(60.0, max(15.0, 0.15 * span))
+    
+    section_starts = set(section_starts or [0])
+    section_end = np.array([(i + 1) in section_starts for i in range(n_lines)])
+    boundaries = np.sort(np.asarray(section_boundaries if section_boundaries is not None else [], dtype=float))
+    
+    def candidates(i):
+        lo = np.searchsorted(cue_times, expected_start[i] - band, side='left')
+        hi = np.searchsorted(cue_times, expected_start[i] + band, side='right')
+        return np.arange(lo, hi)
+    
+    def local_cost(i, idx):
+        t = cue_times[idx]
+        cost = STRENGTH_WEIGHT * (1.0 - cue_strength[idx]) + GRID_PENALTY * cue_is_grid[idx]
+        cost = cost + POSITION_WEIGHT * ((t - expected_start[i]) / band) ** 2
+        if i in section_starts and len(boundaries) > 0:
+            pos = np.searchsorted(boundaries, t)
+            left = boundaries[np.clip(pos - 1, 0, len(boundaries) - 1)]
+            right = boundaries[np.clip(pos, 0, len(boundaries) - 1)]
+            nearest = np.minimum(np.abs(t - left), np.abs(t - right))
+            cost = cost + BOUNDARY_WEIGHT * np.minimum(1.0, nearest / 2.0)
+        return cost
+    
+    prev_idx = candidates(0)
+    if len(prev_idx) == 0:
+        return None
+    prev_cost = local_cost(0, prev_idx)
+    history = []
+    
+    for i in range(1, n_lines):
+        idx = candidates(i)
+        if len(idx) == 0:
+            return None
+        pred, cost = _best_predecessors(cue_times[idx], cue_times[prev_idx], prev_cost, expected_len[i - 1],
+                                        section_end[i - 1], min_line)
+        history.append((idx, prev_idx[pred]))
+        prev_idx, prev_cost = idx, cost + local_cost(i, idx)
+    
+    if not np.isfinite(prev_cost).any():
+        return None
+    
+    # Обратно проследяване на оптималния път
+    chosen = np.empty(n_lines, dtype=int)
+    chosen[-1] = prev_idx[np.argmin(prev_cost)]
+    for i in range(n_lines - 1, 0, -1):
+        idx, pred = history[i - 1]
+        chosen[i - 1] = pred[np.searchsorted(idx, chosen[i])]
+    
+    return cue_times[chosen], expected_len
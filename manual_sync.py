@@ -6,17 +6,17 @@
 
 import json
 import os
-from datetime import timedelta
-from moviepy.editor import AudioFileClip
-
-def format_time(seconds):
-    """Форматира секунди в MM:SS.mmm формат"""
-    td = timedelta(seconds=seconds)
-    total_seconds = int(td.total_seconds())
-    minutes = total_seconds // 60
-    seconds = total_seconds % 60
-    milliseconds = int((td.total_seconds - total_seconds) * 1000)
-    return f"{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+import sys
+import numpy as np
+from audio_cache import get_duration
+from analysis_cache import load_analysis
+from cue_index import CueIndex
+from lyrics_alignment import count_syllables
+from beat_grid import load_beat_grid, snap_timeline
+from profiling import add_timing_arguments, configure, profiled, report
+from timeline_format import format_time, read_timeline
+from timeline_writer import add_timeline_arguments, write_timeline
+from timeline_validation import print_issues, validate_timeline
 
 def parse_time(time_str):
     """Парсва време от формат MM:SS.mmm в секунди"""
@@ -27,6 +27,10 @@ def parse_time(time_str):
     milliseconds = int(seconds_parts[1]) if len(seconds_parts) > 1 else 0
     return minutes * 60 + seconds + milliseconds / 1000.0
 
+def parse_position(value):
+    """Позиция в песента - секунди (82.5) или MM:SS.mmm (01:22.500)"""
+    return parse_time(value) if ':' in value else float(value)
+
 def load_lyrics(lyrics_file):
     """Зарежда текстовете от файла"""
     with open(lyrics_file, 'r', encoding='utf-8') as f:
@@ -53,89 +57,141 @@ def load_sync_data(input_file='sync_data.json'):
             return json.load(f)
     return None
 
-def create_timeline_from_sync(sync_data, lyrics_lines, duration):
-    """Създава таймлайн от синхронизационните данни"""
+def load_cue_index(audio_file):
+    """Зарежда индекса на cue точки от кеша на анализа (ако sync_lyrics.py вече е пускан)"""
+    from sync_lyrics import vocal_cache_params
+    from analysis_profiles import profile_names
+    # Профилът, с който е пускан анализът, не е известен - проверяват се всички
+    for profile in profile_names():
+        for streaming in (False, True):
+            analysis = load_analysis(audio_file, vocal_cache_params(profile, streaming))
+            if analysis is not None:
+                return CueIndex.from_analysis(analysis)
+    return None
+
+@profiled('create_timeline_from_sync')
+def create_timeline_from_sync(sync_data, lyrics_lines, duration, cue_index=None, snap_tolerance=0.0,
+                              beat_grid=None, beat_snap=0.0):
+    """Създава таймлайн от синхронизационните данни
+    
+    Ако е подаден cue_index и snap_tolerance > 0, всеки timestamp се прилепва към
+    най-близкия onset/вокален пик, стига да е на не повече от snap_tolerance секунди.
+    Ако е подадена мрежа от удари и beat_snap > 0, таймлайнът се прилепва и към ударите.
+    """
     timeline = []
+    timestamps = list(sync_data['timestamps'])
+    if cue_index is not None and snap_tolerance > 0 and timestamps:
+        timestamps = [float(t) for t in cue_index.within(timestamps, snap_tolerance)]
     
-    for i, line in enumerate(lyrics_lines):
-        if i < len(sync_data['timestamps']):
-            start = sync_data['timestamps'][i]
-            
-            # Крайът е следващият timestamp или края на песента
-            if i + 1 < len(sync_data['timestamps']):
-                end = sync_data['timestamps'][i + 1]
-            else:
-                end = duration
-            
-            timeline.append({
-                'line': line,
-                'start': start,
-                'end': end
-            })
-        else:
-            # Ако няма timestamp, използваме приблизително време
-            timeline.append({
-                'line': line,
-                'start': 0,
-                'end': duration
-            })
+    timed = min(len(timestamps), len(lyrics_lines))
+    for i in range(timed):
+        # Крайът е следващият timestamp или края на песента
+        end = timestamps[i + 1] if i + 1 < len(timestamps) else duration
+        timeline.append({
+            'line': lyrics_lines[i],
+            'start': timestamps[i],
+            'end': end
+        })
+    
+    if timed < len(lyrics_lines):
+        # Редовете без timestamp делят времето след последния маркиран ред (заедно с него)
+        # според броя срички, вместо всеки да заема цялата песен
+        first = max(timed - 1, 0)
+        window_start = timestamps[first] if timed else 0.0
+        lines = lyrics_lines[first:]
+        weights = np.array([count_syllables(line) for line in lines], dtype=float)
+        bounds = window_start + (duration - window_start) * np.concatenate([[0.0], np.cumsum(weights) / weights.sum()])
+        timeline[first:] = [{'line': line, 'start': float(start), 'end': float(end), 'estimated': i + first >= timed}
+                            for i, (line, start, end) in enumerate(zip(lines, bounds[:-1], bounds[1:]))]
+        print(f"ВНИМАНИЕ: {len(lyrics_lines) - timed} реда нямат timestamp - времената им са приблизителни")
     
-    return timeline
+    return snap_timeline(timeline, beat_grid, beat_snap)
 
-def export_timeline(timeline, output_file='Timeline.md'):
-    """Експортира таймлайна в Markdown формат"""
-    section_names = {
-        'intro': 'Встъп',
-        'verse1': 'Верс 1',
-        'chorus1': 'Припев 1',
-        'interlude': 'Интерлюд',
-        'verse2': 'Верс 2',
-        'chorus2': 'Припев 2',
-        'chorus3': 'Припев 3',
-        'outro': 'Финал'
-    }
+@profiled('export_timeline')
+def export_timeline(timeline, output_file='Timeline.md', overwrite_edits=False):
+    """Експортира таймлайна (Timeline.json и генерирания от него Timeline.md)
+    
+    В съществуващ Timeline.md се подменят само променените записи, а ръчните редакции се пазят.
+    """
+    from sync_lyrics import assign_sections
     
     # Определяне на секциите
-    structure = [
-        {'type': 'intro', 'lines': 1},
-        {'type': 'verse1', 'lines': 16},
-        {'type': 'chorus1', 'lines': 2},
-        {'type': 'interlude', 'lines': 1},
-        {'type': 'verse2', 'lines': 8},
-        {'type': 'chorus2', 'lines': 2},
-        {'type': 'chorus3', 'lines': 2},
-        {'type': 'outro', 'lines': 1},
-    ]
+    assign_sections(timeline)
+    print_issues(validate_timeline(timeline))
+    changes = write_timeline(timeline, output_file, title="FAKE NEWS - Таймлайн с таймкодове (Ръчна синхронизация)",
+                             overwrite_edits=overwrite_edits)
     
-    line_idx = 0
-    for section in structure:
-        for _ in range(section['lines']):
-            if line_idx < len(timeline):
-                timeline[line_idx]['section'] = section['type']
-                line_idx += 1
+    print(f"\nТаймлайнът е експортиран в: {output_file}")
+    return changes
+
+def preview_timeline(audio_file, timeline_file='Timeline.md', start=0.0):
+    """Live преглед: пуска песента от start и показва активния ред на таймлайна
     
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write("# FAKE NEWS - Таймлайн с таймкодове (Ръчна синхронизация)\n\n")
-        f.write("---\n\n")
-        
-        current_section = None
-        for i, entry in enumerate(timeline, 1):
-            start_time = format_time(entry['start'])
-            end_time = format_time(entry['end'])
-            duration = format_time(entry['end'] - entry['start'])
-            
-            section_type = entry.get('section', 'unknown')
-            if section_type != current_section:
-                current_section = section_type
-                section_name = section_names.get(section_type, section_type)
-                f.write(f"\n### {section_name.upper()}\n\n")
-            
-            f.write(f"## {i}. {start_time} - {end_time} ({duration})\n")
-            f.write(f"**Текст:** {entry['line']}\n\n")
+    Активният ред и следващата смяна се намират с TimelineIndex, така че цикълът спи точно
+    до следващата граница, вместо да проверява всички редове на всяка стъпка.
+    Без pygame (или без аудио устройство) часовникът тече без звук.
+    """
+    import time
+    from timeline_index import TimelineIndex
     
-    print(f"\nТаймлайнът е експортиран в: {output_file}")
+    timeline = read_timeline(timeline_file)
+    index = TimelineIndex(timeline)
+    duration = get_duration(audio_file)
+    
+    print("=" * 60)
+    print(f"ПРЕГЛЕД НА ТАЙМЛАЙНА: {timeline_file} ({len(timeline)} реда)")
+    print("=" * 60)
+    print("Ctrl+C за спиране\n")
+    
+    try:
+        import pygame
+    except ImportError:
+        pygame = None
+        print("pygame не е инсталиран - прегледът върви без звук\n")
+    if pygame is not None:
+        try:
+            pygame.mixer.init()
+            pygame.mixer.music.load(audio_file)
+            pygame.mixer.music.play(start=start)
+        except pygame.error as e:
+            # Няма аудио устройство (headless) или форматът не позволява start
+            print(f"ВНИМАНИЕ: звукът не може да се пусне ({e}) - прегледът върви без звук\n")
+            if pygame.mixer.get_init():
+                pygame.mixer.quit()
+            pygame = None
+    if pygame is not None:
+        clock = lambda: start + pygame.mixer.music.get_pos() / 1000.0
+    else:
+        t0 = time.monotonic()
+        clock = lambda: start + time.monotonic() - t0
+    
+    current = None
+    try:
+        while True:
+            t = clock()
+            if t >= duration:
+                break
+            active = index.active_index(t)
+            if active != current:
+                current = active
+                if active < 0:
+                    print(f"[{format_time(t)}] ...")
+                else:
+                    entry = timeline[active]
+                    print(f"[{format_time(t)}] {entry['section']:<12} {entry['text']}")
+            
+            # Сън до следващата смяна (на кратки стъпки, за да не се натрупва разминаване)
+            boundary = index.next_boundary(t)
+            if boundary is None:
+                boundary = duration
+            time.sleep(min(max(boundary - t, 0.005), 0.25))
+    except KeyboardInterrupt:
+        print("\nПрегледът е спрян")
+    finally:
+        if pygame is not None:
+            pygame.mixer.music.stop()
 
-def interactive_sync(audio_file, lyrics_file):
+def interactive_sync(audio_file, lyrics_file, snap_tolerance=0.0, beat_snap=0.0, overwrite_edits=False):
     """Интерактивен режим за синхронизация"""
     print("=" * 60)
     print("ИНТЕРАКТИВНА СИНХРОНИЗАЦИЯ НА ТЕКСТОВЕ")
@@ -144,12 +200,14 @@ def interactive_sync(audio_file, lyrics_file):
     
     # Зареждане на данни
     lyrics_lines = load_lyrics(lyrics_file)
-    audio = AudioFileClip(audio_file)
-    duration = audio.duration
+    duration = get_duration(audio_file)
+    cue_index = load_cue_index(audio_file)
     
     print(f"Песен: {audio_file}")
     print(f"Продължителност: {format_time(duration)}")
     print(f"Брой редове: {len(lyrics_lines)}")
+    if cue_index is not None:
+        print(f"Заредени cue точки: {len(cue_index.cues['any'])} (от кеша на анализа)")
     print()
     
     # Проверка за съхранени данни
@@ -208,6 +266,9 @@ def interactive_sync(audio_file, lyrics_file):
                         current_time = (pygame.time.get_ticks() / 1000.0) - start_time
                         timestamps.append(current_time)
                         print(f"\n[{format_time(current_time)}] Ред {current_line + 1}: {lyrics_lines[current_line]}")
+                        if cue_index is not None:
+                            nearest = cue_index.nearest(current_time)
+                            print(f"   Най-близък onset: {format_time(nearest)} ({(nearest - current_time) * 1000:+.0f} ms)")
                         current_line += 1
                         
                         if current_line < len(lyrics_lines):
@@ -235,7 +296,7 @@ def interactive_sync(audio_file, lyrics_file):
                     elif key == 'q':  # Quit
                         running = False
                         print("\n❌ Изход без запазване")
-                
+            
             finally:
                 termios.tcsetattr(sys.stdin, termios.TCSADRAIN, old_settings)
         
@@ -246,8 +307,10 @@ def interactive_sync(audio_file, lyrics_file):
             sync_data = {'timestamps': timestamps}
             save_sync_data(sync_data)
             
-            timeline = create_timeline_from_sync(sync_data, lyrics_lines, duration)
-            export_timeline(timeline)
+            beat_grid = load_beat_grid(audio_file) if beat_snap > 0 else None
+            timeline = create_timeline_from_sync(sync_data, lyrics_lines, duration, cue_index, snap_tolerance,
+                                                 beat_grid, beat_snap)
+            export_timeline(timeline, overwrite_edits=overwrite_edits)
         else:
             print(f"\n⚠ Синхронизирани са само {len(timestamps)} от {len(lyrics_lines)} реда")
             if timestamps:
@@ -260,9 +323,9 @@ def interactive_sync(audio_file, lyrics_file):
         print("\nГРЕШКА: pygame не е инсталиран")
         print("Инсталирай го с: pip install pygame")
         print("\nАлтернативно, можеш да използваш текстов режим...")
-        text_mode_sync(audio_file, lyrics_lines, duration)
+        text_mode_sync(audio_file, lyrics_lines, duration, snap_tolerance, beat_snap, overwrite_edits)
 
-def text_mode_sync(audio_file, lyrics_lines, duration):
+def text_mode_sync(audio_file, lyrics_lines, duration, snap_tolerance=0.0, beat_snap=0.0, overwrite_edits=False):
     """Текстов режим за синхронизация (без pygame)"""
     print("\nТЕКСТОВ РЕЖИМ ЗА СИНХРОНИЗАЦИЯ")
     print("=" * 60)
@@ -296,44 +359,73 @@ def text_mode_sync(audio_file, lyrics_lines, duration):
         sync_data = {'timestamps': timestamps}
         save_sync_data(sync_data)
         
-        timeline = create_timeline_from_sync(sync_data, lyrics_lines, duration)
-        export_timeline(timeline)
+        cue_index = load_cue_index(audio_file) if snap_tolerance > 0 else None
+        beat_grid = load_beat_grid(audio_file) if beat_snap > 0 else None
+        timeline = create_timeline_from_sync(sync_data, lyrics_lines, duration, cue_index, snap_tolerance,
+                                             beat_grid, beat_snap)
+        export_timeline(timeline, overwrite_edits=overwrite_edits)
         print(f"\n✓ Синхронизирани са {len(timestamps)} реда")
 
-def main():
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Ръчна синхронизация на текстове с аудио')
+    parser.add_argument('--snap', type=float, default=0.0, metavar='SECONDS',
+                        help='прилепване на маркираните моменти към onset в рамките на SECONDS (напр. 0.15)')
+    parser.add_argument('--beat-snap', type=float, default=0.0, metavar='SECONDS',
+                        help='прилепване на таймлайна към удар в рамките на SECONDS (нужен е анализ от analyze_audio.py или sync_lyrics.py)')
+    parser.add_argument('--preview', action='store_true',
+                        help='live преглед на готовия таймлайн по време на възпроизвеждане')
+    parser.add_argument('--timeline', default='Timeline.md', help='таймлайн за --preview')
+    parser.add_argument('--from', dest='start', type=parse_position, default=0.0,
+                        help='начало на прегледа (секунди или MM:SS.mmm)')
+    add_timeline_arguments(parser)
+    add_timing_arguments(parser)
+    args = parser.parse_args(argv)
+    configure(args)
+    
     audio_file = 'FakeNews.wav'
     lyrics_file = 'Lyrics.md'
     
-    import os
     if not os.path.exists(audio_file):
         audio_file = 'FakeNews.mp3'
     
     if not os.path.exists(audio_file):
         print(f"ГРЕШКА: Не е намерен аудио файл")
-        return
+        return 1
+    
+    if args.preview:
+        if not os.path.exists(args.timeline):
+            print(f"ГРЕШКА: Не е намерен таймлайн: {args.timeline}")
+            return 1
+        preview_timeline(audio_file, args.timeline, args.start)
+        return 0
     
     if not os.path.exists(lyrics_file):
         print(f"ГРЕШКА: Не е намерен файл с текстове")
-        return
+        return 1
     
     # Проверка за pygame
     try:
         import pygame
-        interactive_sync(audio_file, lyrics_file)
+        interactive_sync(audio_file, lyrics_file, args.snap, args.beat_snap, args.overwrite_edits)
     except ImportError:
         print("pygame не е инсталиран. Използва се текстов режим...")
         lyrics_lines = load_lyrics(lyrics_file)
-        audio = AudioFileClip(audio_file)
-        duration = audio.duration
-        text_mode_sync(audio_file, lyrics_lines, duration)
+        duration = get_duration(audio_file)
+        text_mode_sync(audio_file, lyrics_lines, duration, args.snap, args.beat_snap, args.overwrite_edits)
+    
+    report(args)
+    return 0
 
 if __name__ == '__main__':
     try:
-        main()
+        sys.exit(main())
     except KeyboardInterrupt:
         print("\n\nПрекратено от потребителя")
+        sys.exit(130)
     except Exception as e:
         print(f"ГРЕШКА: {e}")
         import traceback
         traceback.print_exc()
+        sys.exit(1)
 
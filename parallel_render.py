@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Паралелно рендиране на видеоклипа по отрязъци
+Таймлайнът се разделя на отрязъци - по секции (ВСТЪП, ВЕРС 1, ПРИПЕВ 1, ...) или с фиксирана
+дължина - и всеки се рендира само като видео в отделен процес (със същия backend). Границите са
+върху решетка от GOP_SECONDS, така че всеки отрязък е цял брой кадри и започва с ключов кадър.
+Отрязъците се слепват с concat демултиплексора без прекодиране (-c copy), а аудиото се добавя
+веднъж в края директно от файла. С incremental=True готовите отрязъци се пазят в кеша на
+отрязъците и се рендират наново само тези, чиито записи са се променили (виж segment_cache.py).
+"""
+
+import contextlib
+import io
+import math
+import os
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from ffmpeg_render import ffmpeg_exe
+from profiling import stage
+from render_profiles import DEFAULT_RENDER_PROFILE, audio_arguments, get_render_profile
+from segment_cache import SegmentCache, segment_key
+
+GOP_SECONDS = 2.0                  # решетка на границите (48 кадъра при 24 fps, 24 при 12 fps)
+CACHE_CHUNK_SECONDS = 10.0         # дължина на отрязъците с incremental=True без chunk
+
+def snap(t):
+    """Най-близката граница от решетката на GOP_SECONDS"""
+    return round(t / GOP_SECONDS) * GOP_SECONDS
+
+def snap_segment(seg_start, seg_end, fps, duration):
+    """Разширява [seg_start, seg_end] до цели кадри (началото надолу, краят нагоре до duration)
+    
+    Решетката на GOP_SECONDS е кратна на кадъра, така че след това всеки отрязък е цял брой кадри;
+    само краят на песента може да е между два кадъра (последният кадър се изрязва при слепването).
+    """
+    # Допускът пази стойностите, които вече са на решетката, от грешки при закръгляне
+    start = math.floor(seg_start * fps + 1e-6) / fps
+    end = min(math.ceil(seg_end * fps - 1e-6) / fps, duration)
+    return max(0.0, start), end
+
+def split_points(timeline, seg_start, seg_end, chunk=None):
+    """Отрязъците [(начало, край), ...] на [seg_start, seg_end]
+    
+    Без chunk границите са началата на секциите, иначе през chunk секунди; и в двата случая се
+    закръглят към решетката на GOP_SECONDS. seg_start и seg_end трябва вече да са на решетката на
+    кадрите (виж snap_segment), иначе първият и последният отрязък не са цял брой кадри.
+    """
+    if chunk:
+        step = max(1, round(chunk / GOP_SECONDS)) * GOP_SECONDS
+        first = (seg_start // step + 1) * step
+        cuts = [first + i * step for i in range(int(max(0.0, seg_end - first) // step) + 1)]
+    else:
+        cuts = []
+        previous = None
+        for entry in sorted(timeline, key=lambda entry: entry['start']):
+            if previous is not None and entry['section'] != previous:
+                cuts.append(snap(entry['start']))
+            previous = entry['section']
+    cuts = sorted(set(t for t in cuts if seg_start < t < seg_end))
+    bounds = [seg_start] + cuts + [seg_end]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def chunk_params(index, start, end, backend, vfr, profile):
+    """Всичко, от което зависи отрязъкът [start, end) (ключ за кеша на отрязъците)"""
+    from create_video_simple import card_params
+    entries = []
+    for i in sorted(index.range(start, end)):
+        entry = index.entries[i]
+        # Милисекунди, както в Timeline.md - ключът не зависи от това дали е четен .md или .json
+        entries.append({
+            'start': round(max(entry['start'], start) - start, 3),
+            'end': round(min(entry['end'], end) - start, 3),
+            'card': card_params(entry['text'], entry['section'], profile['size'])
+        })
+    return {
+        'length': round(end - start, 3),
+        'entries': entries,
+        'backend': backend,
+        'vfr': vfr,
+        'encode': profile
+    }
+
+def render_chunk(job):
+    """Рендира един отрязък без звук (изпълнява се в отделен процес)"""
+    from create_video_simple import create_sample_video
+    
+    result = {'index': job['index'], 'start': job['start'], 'end': job['end'], 'output': job['output']}
+    log = io.StringIO()
+    t0 = time.perf_counter()
+    try:
+        # Изходът на рендерите се събира, за да не се смесва между процесите
+        with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            create_sample_video(job['audio'], job['timeline'], job['output'], segment=(job['start'], job['end']),
+                                validate=False, use_cache=job['cache'], backend=job['backend'], vfr=job['vfr'],
+                                with_audio=False, render_profile=job['profile'])
+        result.update({'ok': True, 'seconds': time.perf_counter() - t0})
+    except Exception as e:
+        result.update({
+            'ok': False,
+            'error': f"{type(e).__name__}: {e}",
+            'log': log.getvalue(),
+            'seconds': time.perf_counter() - t0
+        })
+    return result
+
+def join_command(list_file, audio_file, output_file, audio_start, duration, profile=None):
+    """Слепване на отрязъците без прекодиране и добавяне на аудиото"""
+    params = profile or get_render_profile()
+    return [
+        ffmpeg_exe(), '-y', '-loglevel', 'error',
+        '-f', 'concat', '-safe', '0', '-i', list_file,
+        '-ss', f"{audio_start:.6f}", '-t', f"{duration:.6f}", '-i', audio_file,
+        '-map', '0:v:0', '-map', '1:a:0',
+        '-c:v', 'copy'
+    ] + audio_arguments(params) + [
+        '-t', f"{duration:.6f}",
+        output_file
+    ]
+
+def render_parallel(audio_file, timeline_file, output_file='FakeNews_Sample.mp4', segment=None, validate=True,
+                    use_cache=True, backend='moviepy', vfr=False, jobs=None, chunk=None, incremental=False,
+                    render_profile=DEFAULT_RENDER_PROFILE, strict=False):
+    """Рендира видеоклипа на отрязъци в jobs процеса (аргументите са като на create_sample_video)
+    
+    incremental=True взема непроменените отрязъци от кеша на отрязъците и рендира само останалите.
+    """
+    from audio_cache import get_duration
+    from timeline_format import read_timeline
+    from timeline_index import TimelineIndex
+    from timeline_validation import check_render_timeline
+    
+    profile = get_render_profile(render_profile)
+    print("Зареждане на таймлайн...")
+    timeline = read_timeline(timeline_file)
+    print(f"Намерени {len(timeline)} записа")
+    duration = get_duration(audio_file)
+    if validate:
+        # Проверката е веднъж тук - отрязъците се рендират с validate=False
+        check_render_timeline(timeline, duration, strict)
+    
+    seg_start, seg_end = 0.0, duration
+    if segment is not None:
+        seg_start = segment[0]
+        seg_end = duration if segment[1] is None else min(segment[1], duration)
+        requested = (seg_start, seg_end)
+        seg_start, seg_end = snap_segment(seg_start, seg_end, profile['fps'], duration)
+        if (seg_start, seg_end) != requested:
+            print(f"Отрязъкът е изравнен към кадрите ({profile['fps']} fps): {seg_start:.3f} - {seg_end:.3f} s")
+    if incremental and not chunk:
+        # Късите отрязъци с фиксирана дължина правят редакцията на един ред евтина
+        chunk = CACHE_CHUNK_SECONDS
+    chunks = split_points(timeline, seg_start, seg_end, chunk)
+    index = TimelineIndex(timeline)
+    segments = SegmentCache(enabled=incremental)
+    
+    with tempfile.TemporaryDirectory(prefix='fakenews_parallel_') as temp_dir:
+        chunk_jobs = [{
+            'index': i,
+            'start': start,
+            'end': end,
+            'output': os.path.join(temp_dir, f"chunk_{i:03d}.mp4"),
+            'audio': os.path.abspath(audio_file),
+            'timeline': os.path.abspath(timeline_file),
+            'cache': use_cache,
+            'backend': backend,
+            'vfr': vfr,
+            'profile': render_profile,
+            'key': segment_key(chunk_params(index, start, end, backend, vfr, profile))
+        } for i, (start, end) in enumerate(chunks)]
+        
+        pending = []
+        for job in chunk_jobs:
+            cached = segments.get(job['key'])
+            if cached is None:
+                pending.append(job)
+            else:
+                job['output'] = cached
+        workers = max(1, min(jobs or os.cpu_count() or 1, len(pending)))
+        print(f"Рендиране на {len(pending)}/{len(chunks)} отрязъка с {workers} процеса ({backend})...")
+        
+        failed = []
+        
+        def finished(result):
+            if result['ok']:
+                print(f"✓ Отрязък {result['index'] + 1}/{len(chunks)}: "
+                      f"{result['start']:.1f} - {result['end']:.1f} s за {result['seconds']:.2f} s")
+                job = chunk_jobs[result['index']]
+                job['output'] = segments.store(job['key'], job['output'])
+            else:
+                print(f"✗ Отрязък {result['index'] + 1}/{len(chunks)}: {result['error']}")
+                failed.append(result)
+        
+        with stage('parallel.chunks'):
+            if workers == 1:
+                # Един процес - без пул (импортът на moviepy в нов процес струва секунда)
+                for job in pending:
+                    finished(render_chunk(job))
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    # Най-дългите отрязъци първи - по-равномерно натоварване на процесите
+                    ordered = sorted(pending, key=lambda job: job['start'] - job['end'])
+                    futures = [executor.submit(render_chunk, job) for job in ordered]
+                    for future in as_completed(futures):
+                        finished(future.result())
+        if incremental:
+            print(segments.summary())
+        if failed:
+            raise RuntimeError(f"{len(failed)} отрязъка не бяха рендирани: {failed[0]['error']}\n{failed[0]['log']}")
+        
+        list_file = os.path.join(temp_dir, 'chunks.ffconcat')
+        with open(list_file, 'w', encoding='utf-8') as f:
+            f.write('ffconcat version 1.0\n')
+            for job in chunk_jobs:
+                # Точната дължина - при --vfr mp4 не пази колко трае последният кадър на отрязъка
+                f.write(f"file '{os.path.abspath(job['output'])}'\nduration {job['end'] - job['start']:.6f}\n")
+        
+        print(f"Слепване на отрязъците и добавяне на аудио: {output_file}")
+        command = join_command(list_file, audio_file, output_file, seg_start, seg_end - seg_start, profile)
+        with stage('parallel.join'):
+            result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg завърши с код {result.returncode}: {result.stderr.strip()[-500:]}")
+        # Кешът не расте безкрайно - най-отдавна използваните отрязъци от стари версии се изтриват
+        segments.prune(keep=[job['output'] for job in chunk_jobs])
+    
+    print(f"Видеото е готово: {output_file}")
+    return output_file
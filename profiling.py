@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Измерване на времето по етапи (анализ, синхронизация, рендиране)
+Функциите отчитат етапите си с `with stage('име'):` или `@profiled('име')`. Записват се
+wall време, CPU време и пиковата памет (RSS) на процеса. Измерването е изключено по подразбиране
+и се включва с --timings / --timings-json / --trace, като резултатът може да се запише като JSON
+или като Chrome trace (chrome://tracing, https://ui.perfetto.dev).
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_ENABLED = False
+_RECORDS = []
+_LOCK = threading.Lock()
+_ORIGIN = time.perf_counter()
+
+def enable():
+    """Включва записването на етапите"""
+    global _ENABLED
+    _ENABLED = True
+
+def is_enabled():
+    """Дали етапите се записват"""
+    return _ENABLED
+
+def reset():
+    """Изчиства записаните етапи"""
+    with _LOCK:
+        del _RECORDS[:]
+
+def peak_rss_mb():
+    """Пиковата резидентна памет на процеса досега в MB (None, ако не е достъпна)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS връща байтове, Linux - килобайти
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+@contextmanager
+def stage(name):
+    """Измерва блок код като етап с даденото име"""
+    if not _ENABLED:
+        yield
+        return
+    rss_before = peak_rss_mb()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        rss_after = peak_rss_mb()
+        record = {
+            'name': name,
+            'start': wall_start - _ORIGIN,
+            'wall': wall,
+            'cpu': cpu,
+            'peak_rss_mb': rss_after,
+            'rss_growth_mb': None if rss_after is None else rss_after - rss_before,
+            'pid': os.getpid(),
+            'tid': threading.get_ident()
+        }
+        with _LOCK:
+            _RECORDS.append(record)
+
+def profiled(name):
+    """Декоратор - цялата функция се измерва като етап"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def records():
+    """Копие на записаните етапи в реда на завършване"""
+    with _LOCK:
+        return list(_RECORDS)
+
+def summary():
+    """Обобщение по име на етап: брой извиквания, общо wall/CPU време и пикова памет"""
+    totals = {}
+    for record in records():
+        entry = totals.setdefault(record['name'], {
+            'name': record['name'],
+            'calls': 0,
+            'wall': 0.0,
+            'cpu': 0.0,
+            'peak_rss_mb': None,
+            'first_start': record['start']
+        })
+        entry['calls'] += 1
+        entry['wall'] += record['wall']
+        entry['cpu'] += record['cpu']
+        entry['first_start'] = min(entry['first_start'], record['start'])
+        if record['peak_rss_mb'] is not None:
+            entry['peak_rss_mb'] = max(entry['peak_rss_mb'] or 0.0, record['peak_rss_mb'])
+    return sorted(totals.values(), key=lambda entry: entry['first_start'])
+
+def print_summary():
+    """Отпечатва таблица с етапите"""
+    rows = summary()
+    if not rows:
+        return
+    print()
+    print("ВРЕМЕ ПО ЕТАПИ")
+    print("-" * 84)
+    print(f"{'Етап':<44} {'брой':>5} {'wall':>10} {'CPU':>10} {'пик RSS':>10}")
+    for row in rows:
+        rss = f"{row['peak_rss_mb']:7.0f} MB" if row['peak_rss_mb'] is not None else f"{'-':>10}"
+        print(f"{row['name']:<44} {row['calls']:>5} {row['wall'] * 1000:8.1f}ms {row['cpu'] * 1000:8.1f}ms {rss}")
+
+def write_json(path):
+    """Записва етапите и обобщението като JSON"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'stages': records(), 'summary': summary()}, f, indent=2, ensure_ascii=False)
+
+def write_chrome_trace(path):
+    """Записва етапите във формата на Chrome trace ("X" събития, времена в микросекунди)"""
+    events = []
+    for record in records():
+        events.append({
+            'name': record['name'],
+            'ph': 'X',
+            'ts': record['start'] * 1e6,
+            'dur': record['wall'] * 1e6,
+            'pid': record['pid'],
+            'tid': record['tid'],
+            'args': {
+                'cpu_ms': record['cpu'] * 1000,
+                'peak_rss_mb': record['peak_rss_mb'],
+                'rss_growth_mb': record['rss_growth_mb']
+            }
+        })
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+
+def add_timing_arguments(parser):
+    """Добавя --timings, --timings-json и --trace към argparse парсер"""
+    parser.add_argument('--timings', action='store_true', help='таблица с времето по етапи в края')
+    parser.add_argument('--timings-json', metavar='FILE', help='записване на времената по етапи като JSON')
+    parser.add_argument('--trace', metavar='FILE', help='записване на Chrome trace (chrome://tracing / Perfetto)')
+
+def configure(args):
+    """Включва измерването, ако е поискано от командния ред"""
+    if args.timings or args.timings_json or args.trace:
+        enable()
+
+def report(args):
+    """Отпечатва/записва резултатите според аргументите от командния ред"""
+    if not _ENABLED:
+        return
+    if args.timings:
+        print_summary()
+    if args.timings_json:
+        write_json(args.timings_json)
+        print(f"Времената по етапи са записани в: {args.timings_json}")
+    if args.trace:
+        write_chrome_trace(args.trace)
+        print(f"Chrome trace е записан в: {args.trace}")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Профили на рендирането (качество срещу скорост)
+Всеки профил задава размер на кадъра, кадрова честота и настройки на кодирането. draft е за
+бърза проверка на синхронизацията (малък кадър, 12 fps, ultrafast с CRF), а final са
+досегашните настройки. Подредбата на текста се мащабира спрямо височината на кадъра, така че
+чернова и финално видео изглеждат еднакво, само в различна резолюция.
+"""
+
+DEFAULT_RENDER_PROFILE = 'final'
+REFERENCE_HEIGHT = 1080            # височината, за която са зададени размерите на подредбата
+
+# crf None означава кодиране с bitrate; audio_bitrate и audio_fps None - по подразбиране (44.1 kHz
+# за moviepy, честотата на файла за ffmpeg)
+RENDER_PROFILES = {
+    'draft': {
+        'size': (640, 360),
+        'fps': 12,
+        'codec': 'libx264',
+        'preset': 'ultrafast',
+        'crf': 30,
+        'bitrate': None,
+        'audio_codec': 'aac',
+        'audio_bitrate': '64k',
+        'audio_fps': 22050,
+        'threads': 4
+    },
+    'final': {
+        'size': (1920, 1080),
+        'fps': 24,
+        'codec': 'libx264',
+        'preset': 'medium',
+        'crf': None,
+        'bitrate': '5000k',
+        'audio_codec': 'aac',
+        'audio_bitrate': None,
+        'audio_fps': None,
+        'threads': 4
+    }
+}
+
+def get_render_profile(name=DEFAULT_RENDER_PROFILE):
+    """Връща параметрите на профила (копие, за да не се променя таблицата)"""
+    if name not in RENDER_PROFILES:
+        raise ValueError(f"Непознат профил на рендирането: {name} (възможни: {', '.join(RENDER_PROFILES)})")
+    return dict(RENDER_PROFILES[name])
+
+def scale_layout(layout, size):
+    """Размерите на подредбата (в пиксели при 1080 реда), мащабирани за кадър с размер size"""
+    scale = size[1] / REFERENCE_HEIGHT
+    return {key: max(1, round(value * scale)) for key, value in layout.items()}
+
+def quality_arguments(profile):
+    """Аргументите на ffmpeg за качеството на видеото (-crf или -b:v)"""
+    if profile['crf'] is not None:
+        return ['-crf', str(profile['crf'])]
+    return ['-b:v', profile['bitrate']]
+
+def audio_arguments(profile):
+    """Аргументите на ffmpeg за аудиото (кодек, bitrate и честота според профила)"""
+    arguments = ['-c:a', profile['audio_codec']]
+    if profile['audio_bitrate']:
+        arguments += ['-b:a', profile['audio_bitrate']]
+    if profile['audio_fps']:
+        arguments += ['-ar', str(profile['audio_fps'])]
+    return arguments
+
+def add_render_profile_argument(parser):
+    """Добавя --render-profile към argparse парсер"""
+    parser.add_argument('--render-profile', choices=list(RENDER_PROFILES), default=DEFAULT_RENDER_PROFILE,
+                        help=f'профил на рендирането: draft (640x360, 12 fps, бърз), final '
+                             f'(по подразбиране {DEFAULT_RENDER_PROFILE})')
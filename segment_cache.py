@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Кеш на рендираните отрязъци от видеоклипа
+Ключът е хеш на всичко, от което зависи отрязъкът - записите, които се виждат в него (с времена
+спрямо началото му и параметрите на картите им, вкл. шрифта), дължината му, backend-а и
+настройките на кодирането. При повторно рендиране след редакция на един ред в Timeline.md се
+кодират наново само отрязъците, чиито записи са се променили; останалите се вземат като готови
+.mp4 от `.segment_cache/` и се слепват без прекодиране (виж parallel_render.py).
+Всяко използване обновява mtime на отрязъка, а след рендиране кешът се свива до
+SEGMENT_MAX_BYTES, като първи се изтриват най-отдавна използваните отрязъци.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+SEGMENT_DIR = '.segment_cache'
+SEGMENT_VERSION = 1
+SEGMENT_MAX_BYTES = 2 * 1024 ** 3  # 2 GB - поне 50 минути видео с 5000 kbps (профил final)
+
+def segment_key(params):
+    """Хеш на параметрите на отрязъка"""
+    data = json.dumps([SEGMENT_VERSION, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+class SegmentCache:
+    """Готовите отрязъци на диска (между рендиранията)"""
+    
+    def __init__(self, cache_dir=SEGMENT_DIR, enabled=True):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+    
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.mp4")
+    
+    def get(self, key):
+        """Пътят до готовия отрязък или None"""
+        if not self.enabled:
+            return None
+        path = self.path(key)
+        if os.path.exists(path):
+            # mtime е времето на последното използване (за prune)
+            os.utime(path)
+            self.hits += 1
+            return path
+        self.misses += 1
+        return None
+    
+    def store(self, key, file):
+        """Премества рендирания отрязък в кеша (атомарно) и връща новия му път"""
+        if not self.enabled:
+            return file
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + f'.{os.getpid()}.tmp'
+        shutil.move(file, tmp_path)
+        os.replace(tmp_path, path)
+        return path
+    
+    def prune(self, max_bytes=SEGMENT_MAX_BYTES, keep=()):
+        """Изтрива най-отдавна използваните отрязъци, докато кешът стане до max_bytes
+        
+        Пътищата в keep (отрязъците на току-що рендираното видео) не се изтриват. Връща броя
+        изтрити отрязъци.
+        """
+        if not self.enabled:
+            return 0
+        files = list_segments(self.cache_dir)
+        total = sum(size for _, size, _ in files)
+        keep = {os.path.abspath(path) for path in keep}
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= max_bytes:
+                break
+            if os.path.abspath(path) in keep:
+                continue
+            os.remove(path)
+            total -= size
+            removed += 1
+        return removed
+    
+    def summary(self):
+        """Кратко описание колко отрязъка са взети от кеша"""
+        return f"Отрязъци: {self.misses} рендирани, {self.hits} от кеша"
+
+def list_segments(cache_dir=SEGMENT_DIR):
+    """Отрязъците в кеша като [(mtime, размер, път), ...]"""
+    files = []
+    if not os.path.isdir(cache_dir):
+        return files
+    for root, _, names in os.walk(cache_dir):
+        for name in names:
+            if name.endswith('.mp4'):
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, path))
+    return files
+
+def clear_cache(cache_dir=SEGMENT_DIR):
+    """Изтрива всички отрязъци от кеша и връща броя им"""
+    if not os.path.isdir(cache_dir):
+        return 0
+    removed = len(list_segments(cache_dir))
+    shutil.rmtree(cache_dir)
+    return removed
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Кеш на рендираните отрязъци')
+    parser.add_argument('--clear', action='store_true', help='изтриване на кеша')
+    parser.add_argument('--max-size', type=float, metavar='MB',
+                        help='изтриване на най-отдавна използваните отрязъци над MB мегабайта')
+    args = parser.parse_args(argv)
+    
+    if args.clear:
+        print(f"Изтрити отрязъци от кеша: {clear_cache()}")
+        return 0
+    if args.max_size is not None:
+        print(f"Изтрити отрязъци от кеша: {SegmentCache().prune(int(args.max_size * 1024 ** 2))}")
+    
+    files = list_segments()
+    print(f"{SEGMENT_DIR}: {len(files)} отрязъка, {sum(size for _, size, _ in files) / 1024 ** 2:.1f} MB")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
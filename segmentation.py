@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Структурна сегментация на песента (верс / припев / интерлюд)
+Работи върху chroma + MFCC, агрегирани по удари. Self-similarity се пази само в лента около
+диагонала (O(удари × ширина на лентата) памет вместо O(удари²)), а границите се намират
+като пикове на novelty кривата с checkerboard kernel (Foote).
+"""
+
+import numpy as np
+
+def standardize(X):
+    """Z-score по характеристики и L2 нормализиране по удари"""
+    X = np.asarray(X, dtype=float)
+    X = (X - X.mean(axis=1, keepdims=True)) / (X.std(axis=1, keepdims=True) + 1e-10)
+    return X / (np.linalg.norm(X, axis=0, keepdims=True) + 1e-10)
+
+def banded_similarity(X, max_lag):
+    """Косинусова близост sim[lag, t] = <X[:, t], X[:, t + lag]> за lag = 0..max_lag"""
+    n = X.shape[1]
+    sim = np.zeros((max_lag + 1, n))
+    for lag in range(min(max_lag, n - 1) + 1):
+        sim[lag, :n - lag] = np.sum(X[:, :n - lag] * X[:, lag:], axis=0)
+    return sim
+
+def novelty_curve(X, half_width=8):
+    """Novelty крива с гаусов checkerboard kernel върху лентовата self-similarity матрица"""
+    X = standardize(X)
+    n = X.shape[1]
+    if n < 2:
+        return np.zeros(n)
+    sim = banded_similarity(X, 2 * half_width)
+    
+    offsets = np.arange(-half_width, half_width)
+    taper = np.exp(-0.5 * ((offsets + 0.5) / (0.5 * half_width)) ** 2)
+    t = np.arange(n)
+    novelty = np.zeros(n)
+    for a, ga in zip(offsets, taper):
+        for b, gb in zip(offsets, taper):
+            i = t + a
+            j = t + b
+            valid = (i >= 0) & (j >= 0) & (i < n) & (j < n)
+            lag = np.abs(j - i)
+            first = np.minimum(i, j)
+            sign = 1.0 if (a < 0) == (b < 0) else -1.0
+            values = np.zeros(n)
+            values[valid] = sim[lag[valid], first[valid]]
+            novelty += sign * ga * gb * values
+    
+    novelty = np.maximum(novelty, 0.0)
+    return novelty / (novelty.max() + 1e-10)
+
+def pick_peaks(novelty, min_distance, count=None):
+    """Локални максимуми на novelty, на поне min_distance удара един от друг (най-силните първи)"""
+    novelty = np.asarray(novelty, dtype=float)
+    if len(novelty) < 3:
+        return np.array([], dtype=int)
+    is_peak = (novelty[1:-1] > novelty[:-2]) & (novelty[1:-1] >= novelty[2:]) & (novelty[1:-1] > 0)
+    candidates = np.flatnonzero(is_peak) + 1
+    candidates = candidates[np.argsort(-novelty[candidates], kind='stable')]
+    
+    selected = []
+    for peak in candidates:
+        if all(abs(peak - other) >= min_distance for other in selected):
+            selected.append(peak)
+            if count is not None and len(selected) >= count:
+                break
+    return np.sort(np.array(selected, dtype=int))
+
+def label_segments(X, bounds, energy, threshold=0.85):
+    """Групира сегментите по сходство и ги етикира (A, B, ...) и като verse/chorus/interlude"""
+    X = standardize(X)
+    means = np.array([X[:, s:e].mean(axis=1) for s, e in zip(bounds[:-1], bounds[1:])])
+    means /= np.linalg.norm(means, axis=1, keepdims=True) + 1e-10
+    seg_energy = np.array([np.mean(energy[s:e]) for s, e in zip(bounds[:-1], bounds[1:])])
+    similarity = means @ means.T
+    
+    # Алчно групиране: сегмент влиза в първата група, с която е достатъчно сходен
+    labels = -np.ones(len(means), dtype=int)
+    for i in range(len(means)):
+        if labels[i] >= 0:
+            continue
+        labels[i] = labels.max() + 1
+        labels[(labels < 0) & (similarity[i] >= threshold)] = labels[i]
+    
+    counts = np.bincount(labels)
+    repeated = [g for g in range(len(counts)) if counts[g] > 1]
+    chorus = None
+    if repeated:
+        chorus = max(repeated, key=lambda g: seg_energy[labels == g].mean())
+    
+    kinds = []
+    for i, group in enumerate(labels):
+        if group == chorus:
+            kinds.append('chorus')
+        elif counts[group] > 1:
+            kinds.append('verse')
+        elif i == 0:
+            kinds.append('intro')
+        elif i == len(labels) - 1:
+            kinds.append('outro')
+        else:
+            kinds.append('interlude')
+    return [chr(ord('A') + int(g) % 26) for g in labels], kinds, seg_energy
+
+def segment_song(beat_features, beat_starts, beat_energy, duration, n_sections=None,
+                 novelty=None, half_width=8, min_section_beats=8, min_novelty=0.3):
+    """Разделя песента на секции
+    
+    Ако е зададен n_sections, се избират n_sections - 1 най-силни граници,
+    иначе всички пикове на novelty над min_novelty.
+    Връща списък от {'start', 'end', 'label', 'kind', 'energy'}.
+    """
+    beat_starts = np.asarray(beat_starts, dtype=float)
+    n_beats = len(beat_starts)
+    if n_beats < 2 * min_section_beats:
+        return []
+    if novelty is None:
+        novelty = novelty_curve(beat_features, half_width)
+    
+    count = None if n_sections is None else max(0, n_sections - 1)
+    peaks = pick_peaks(novelty, min_section_beats, count)
+    if count is None:
+        peaks = peaks[novelty[peaks] >= min_novelty]
+    bounds = np.concatenate([[0], peaks, [n_beats]]).astype(int)
+    
+    labels, kinds, seg_energy = label_segments(beat_features, bounds, np.asarray(beat_energy, dtype=float))
+    edges = np.append(beat_starts[bounds[:-1]], duration)
+    edges[0] = 0.0
+    
+    sections = []
+    for i in range(len(bounds) - 1):
+        sections.append({
+            'start': float(edges[i]),
+            'end': float(edges[i + 1]),
+            'label': labels[i],
+            'kind': kinds[i],
+            'energy': float(seg_energy[i])
+        })
+    return sections
@@ -4,101 +4,161 @@
 Използва анализ на вокалната активност и onset detection
 """
 
-import librosa
+import sys
 import numpy as np
-from scipy.signal import find_peaks
-from datetime import timedelta
+from analysis_cache import load_analysis, save_analysis
+from cue_index import nearest_indices
+from beat_grid import load_beat_grid, save_beat_grid, snap_timeline
+from analysis_profiles import DEFAULT_PROFILE, add_profile_argument, get_profile
+from profiling import add_timing_arguments, configure, profiled, report, stage
+from analysis_daemon import DaemonError, add_daemon_argument, request
+from lyrics_alignment import align_lines, build_cues, count_syllables, quiet_boundaries, stanza_starts
+from timeline_format import STANZA_PREFIX, format_time
+from timeline_writer import add_timeline_arguments
+from timeline_validation import add_validation_arguments, apply_validation
 
-def format_time(seconds):
-    """Форматира секунди в MM:SS.mmm формат"""
-    td = timedelta(seconds=seconds)
-    total_seconds = int(td.total_seconds())
-    minutes = total_seconds // 60
-    seconds = total_seconds % 60
-    milliseconds = int((td.total_seconds() - total_seconds) * 1000)
-    return f"{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+# Версия на алгоритъма за вокален анализ - увеличава се при промяна, за да се инвалидира кешът
+VOCAL_ANALYSIS_VERSION = 5
 
-def analyze_vocal_activity(audio_file):
-    """Анализира вокалната активност в аудиото"""
+# Структура на песента (брой редове във всяка секция)
+SONG_STRUCTURE = [
+    {'type': 'intro', 'lines': 1},
+    {'type': 'verse1', 'lines': 16},
+    {'type': 'chorus1', 'lines': 2},
+    {'type': 'interlude', 'lines': 1},
+    {'type': 'verse2', 'lines': 8},
+    {'type': 'chorus2', 'lines': 2},
+    {'type': 'chorus3', 'lines': 2},
+    {'type': 'outro', 'lines': 1},
+]
+
+def vocal_cache_params(profile=DEFAULT_PROFILE, streaming=False):
+    """Параметрите, с които вокалният анализ се записва в кеша"""
+    params = {
+        'analysis': 'vocal_activity',
+        'version': VOCAL_ANALYSIS_VERSION,
+        'profile': profile,
+        'streaming': streaming
+    }
+    params.update(get_profile(profile))
+    return params
+
+@profiled('analyze_vocal_activity')
+def analyze_vocal_activity(audio_file, streaming=False, use_cache=True, profile=DEFAULT_PROFILE):
+    """Анализира вокалната активност в аудиото (streaming=True за поточен анализ с ограничена памет)"""
     print(f"Зареждане и анализ на аудио: {audio_file}...")
     
-    # Зареждане на аудио
-    y, sr = librosa.load(audio_file, sr=None)
-    duration = librosa.get_duration(y=y, sr=sr)
+    # Параметри за анализ (sample rate, прозорец, hop) идват от профила
+    params = get_profile(profile)
+    hop_length = params['hop_length']
+    cache_params = vocal_cache_params(profile, streaming)
+    
+    # Ако аудиото и параметрите не са променени, анализът идва директно от кеша
+    if use_cache:
+        cached = load_analysis(audio_file, cache_params)
+        if cached is not None:
+            print(f"Анализът е зареден от кеша ({format_time(cached['duration'])})")
+            return cached
+    
+    from scipy.signal import find_peaks
+    from audio_features import get_profile_features, normalize
+    
+    # Зареждане на аудио и изчисляване на STFT и onset envelope веднъж
+    features = get_profile_features(audio_file, params, streaming=streaming)
+    duration = features['duration']
+    sr = features['sample_rate']
     
     print(f"Продължителност: {format_time(duration)}")
     
-    # Параметри за анализ
-    frame_length = 2048
-    hop_length = 512
+    # Мрежата от удари се записва, за да не се пуска beat tracking във всеки скрипт
+    save_beat_grid(audio_file, features['beat_times'], features['onset_env'][features['beat_frames']], features['tempo'],
+                   profile)
     
     # 1. Onset detection - намиране на моменти, когато започва нов звук/текст
     print("Анализ на onset моменти...")
-    onset_frames = librosa.onset.onset_detect(
-        y=y, 
-        sr=sr, 
-        hop_length=hop_length,
-        units='time',
-        backtrack=True
-    )
+    onset_frames = features['onset_times']
     
     # 2. RMS енергия - за идентифициране на вокални части
     print("Анализ на енергия...")
-    rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length)[0]
-    rms_times = librosa.frames_to_time(np.arange(len(rms)), sr=sr, hop_length=hop_length)
+    rms = features['rms']
+    rms_times = features['times']
     
     # 3. Spectral centroid - за разграничаване на вокал от инструменти
     print("Анализ на спектрални характеристики...")
-    spectral_centroid = librosa.feature.spectral_centroid(y=y, sr=sr, hop_length=hop_length)[0]
+    spectral_centroid = features['spectral_centroid']
     
     # 4. Zero crossing rate - вокалът има по-висок ZCR
-    zcr = librosa.feature.zero_crossing_rate(y, hop_length=hop_length)[0]
+    zcr = features['zcr']
     
-    # Комбинирана метрика за вокална активност
     # Нормализиране на метриките
-    rms_norm = (rms - np.min(rms)) / (np.max(rms) - np.min(rms) + 1e-10)
-    zcr_norm = (zcr - np.min(zcr)) / (np.max(zcr) - np.min(zcr) + 1e-10)
-    centroid_norm = (spectral_centroid - np.min(spectral_centroid)) / (np.max(spectral_centroid) - np.min(spectral_centroid) + 1e-10)
+    rms_norm = normalize(rms)
+    zcr_norm = normalize(zcr)
+    centroid_norm = normalize(spectral_centroid)
     
     # Комбинирана метрика (вокалът обикновено има висока RMS, среден ZCR и среден centroid)
     vocal_activity = rms_norm * 0.5 + zcr_norm * 0.3 + (1 - centroid_norm) * 0.2
     
     # Намиране на пикове в вокалната активност (вероятни моменти, когато започва нов ред)
-    peaks, properties = find_peaks(
-        vocal_activity, 
-        height=np.percentile(vocal_activity, 40),
-        distance=int(sr / hop_length * 0.5)  # Минимум 0.5 секунди между пикове
-    )
+    with stage('analyze_vocal_activity.peaks'):
+        peaks, properties = find_peaks(
+            vocal_activity, 
+            height=np.percentile(vocal_activity, 40),
+            distance=int(sr / hop_length * 0.5)  # Минимум 0.5 секунди между пикове
+        )
     
     peak_times = rms_times[peaks]
     
     # Филтриране на onset моменти - оставяме само тези, които са близо до вокална активност
-    filtered_onsets = []
-    for onset_time in onset_frames:
-        # Проверяваме дали има вокална активност около този момент
-        idx = np.argmin(np.abs(rms_times - onset_time))
-        if idx < len(vocal_activity) and vocal_activity[idx] > np.percentile(vocal_activity, 30):
-            filtered_onsets.append(onset_time)
-    
-    return {
+    # (най-близката рамка се намира векторно със searchsorted, прагът се изчислява веднъж)
+    with stage('analyze_vocal_activity.onset'):
+        onset_frames = np.asarray(onset_frames, dtype=float)
+        activity_threshold = np.percentile(vocal_activity, 30)
+        if len(onset_frames) > 0:
+            onset_idx = nearest_indices(rms_times, onset_frames)
+            filtered_onsets = onset_frames[vocal_activity[onset_idx] > activity_threshold]
+        else:
+            filtered_onsets = onset_frames
+    
+    analysis = {
         'duration': duration,
         'onset_times': filtered_onsets,
         'vocal_peaks': peak_times,
         'vocal_activity': vocal_activity,
         'rms_times': rms_times,
+        'tempo': features['tempo'],
+        'beat_times': features['beat_times'],
         'sample_rate': sr,
         'hop_length': hop_length
     }
+    
+    if use_cache:
+        save_analysis(audio_file, cache_params, analysis)
+    
+    return analysis
+
+def lyrics_section_boundaries(structure_analysis, lyrics_file):
+    """Граници на секциите от структурната сегментация (по една секция за всяка строфа) или None"""
+    from analyze_audio import estimate_sections
+    with open(lyrics_file, 'r', encoding='utf-8') as f:
+        stanzas = stanza_starts(f.read())
+    boundaries = estimate_sections(structure_analysis, stanzas)['boundaries']
+    return boundaries if len(boundaries) > 0 else None
 
-def sync_lyrics_with_audio(analysis, lyrics_file):
-    """Синхронизира текстовете с аудиото въз основа на вокалната активност"""
+@profiled('sync_lyrics_with_audio')
+def sync_lyrics_with_audio(analysis, lyrics_file, section_boundaries=None, beat_grid=None, snap_tolerance=0.1):
+    """Синхронизира текстовете с аудиото въз основа на вокалната активност
+    
+    Всеки ред получава по една cue точка чрез динамично програмиране върху всички onsets
+    и вокални пикове (виж lyrics_alignment.py). Ако е подадена мрежа от удари,
+    началата и краищата се прилепват към нея.
+    """
     # Прочитане на текста
     with open(lyrics_file, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
+        lyrics_text = f.read()
     
     # Филтриране на празни редове и коментари
     lyrics_lines = []
-    for line in lines:
+    for line in lyrics_text.splitlines():
         line = line.strip()
         if line and not line.startswith('//'):
             lyrics_lines.append(line)
@@ -107,76 +167,155 @@ def sync_lyrics_with_audio(analysis, lyrics_file):
     print(f"Намерени {len(analysis['onset_times'])} onset момента")
     print(f"Намерени {len(analysis['vocal_peaks'])} вокални пика")
     
-    # Използване на onset моментите за синхронизация
-    onset_times = sorted(analysis['onset_times'])
-    vocal_peaks = sorted(analysis['vocal_peaks'])
-    
-    # Комбиниране на двата източника и сортиране
-    all_cue_points = sorted(set(list(onset_times[:len(lyrics_lines)]) + list(vocal_peaks[:len(lyrics_lines)])))
-    
-    # Ако нямаме достатъчно cue точки, използваме равномерно разпределение като fallback
-    if len(all_cue_points) < len(lyrics_lines):
-        print(f"ВНИМАНИЕ: Намерени са само {len(all_cue_points)} cue точки за {len(lyrics_lines)} реда")
-        print("Използва се хибриден подход...")
-        
-        # Комбинираме cue точките с равномерно разпределение
-        duration = analysis['duration']
-        uniform_times = np.linspace(0, duration * 0.95, len(lyrics_lines))
-        
-        # Смесваме двата подхода
-        timeline = []
-        for i, line in enumerate(lyrics_lines):
-            if i < len(all_cue_points):
-                start = all_cue_points[i]
-            else:
-                start = uniform_times[i]
-            
-            # Определяне на края - използваме следващия cue или средна продължителност
-            if i + 1 < len(all_cue_points):
-                end = all_cue_points[i + 1]
-            elif i + 1 < len(uniform_times):
-                end = uniform_times[i + 1]
-            else:
-                # Средна продължителност на ред (приблизително 4-5 секунди)
-                end = start + 4.5
-            
-            timeline.append({
-                'line': line,
-                'start': start,
-                'end': end
-            })
+    duration = analysis['duration']
+    onset_times = np.sort(np.asarray(analysis['onset_times'], dtype=float))
+    vocal_peaks = np.sort(np.asarray(analysis['vocal_peaks'], dtype=float))
+    
+    # Всички cue точки (onsets + вокални пикове + равномерна мрежа) с тяхната вокална активност
+    cue_times, cue_strength, cue_is_grid = build_cues(
+        onset_times,
+        vocal_peaks,
+        duration,
+        activity=analysis['vocal_activity'],
+        activity_times=analysis['rms_times']
+    )
+    
+    # Граници на секции - ако не са подадени, се оценяват от тихите участъци
+    if section_boundaries is None:
+        section_boundaries = quiet_boundaries(analysis['vocal_activity'], analysis['rms_times'])
+    
+    # Вокалът започва с първия реален cue и свършва с последния вокален пик
+    real_cues = cue_times[~cue_is_grid]
+    vocal_start = float(real_cues[0]) if len(real_cues) else 0.0
+    vocal_end = float(vocal_peaks[-1]) if len(vocal_peaks) else duration
+    
+    with stage('sync_lyrics_with_audio.align'):
+        result = align_lines(
+            cue_times,
+            cue_strength,
+            cue_is_grid,
+            [count_syllables(line) for line in lyrics_lines],
+            section_starts=stanza_starts(lyrics_text),
+            section_boundaries=section_boundaries,
+            vocal_start=vocal_start,
+            vocal_end=vocal_end
+        )
+    
+    if result is None:
+        # Няма допустимо подравняване - равномерно разпределение като fallback
+        print("ВНИМАНИЕ: Неуспешно подравняване, използва се равномерно разпределение")
+        starts = np.linspace(0, duration * 0.95, len(lyrics_lines), endpoint=False)
+        expected_len = np.full(len(lyrics_lines), duration * 0.95 / max(1, len(lyrics_lines)))
     else:
-        # Имаме достатъчно cue точки
-        timeline = []
-        for i, line in enumerate(lyrics_lines):
-            start = all_cue_points[i]
-            
-            # Крайът е следващият cue или края на песента
-            if i + 1 < len(all_cue_points):
-                end = all_cue_points[i + 1]
-            else:
-                end = analysis['duration']
-            
-            timeline.append({
-                'line': line,
-                'start': start,
-                'end': end
-            })
+        starts, expected_len = result
+    
+    # Краят е следващото начало, но не повече от два пъти очакваната дължина
+    # (за да не стои текстът на екрана през инструменталните части)
+    next_starts = np.append(starts[1:], duration)
+    ends = np.minimum(next_starts, starts + np.maximum(2.0 * expected_len, 1.0))
+    
+    timeline = []
+    for line, start, end in zip(lyrics_lines, starts, ends):
+        timeline.append({
+            'line': line,
+            'start': float(start),
+            'end': float(end)
+        })
+    
+    return snap_timeline(timeline, beat_grid, snap_tolerance, stanza_starts(lyrics_text))
+
+def lyrics_structure(lyrics_text):
+    """Структура на песента по строфите на текста ([{'type', 'lines'}, ...])
+    
+    Всяка строфа е секция stanzaN; ако броят редове по строфи съвпада със SONG_STRUCTURE,
+    се запазват нейните имена (ВСТЪП, ВЕРС 1, ПРИПЕВ 1, ...).
+    """
+    starts = stanza_starts(lyrics_text)
+    total = sum(1 for line in lyrics_text.splitlines() if line.strip() and not line.strip().startswith('//'))
+    counts = [end - start for start, end in zip(starts, starts[1:] + [total])]
+    if counts == [section['lines'] for section in SONG_STRUCTURE]:
+        return [dict(section) for section in SONG_STRUCTURE]
+    return [{'type': f"{STANZA_PREFIX}{i}", 'lines': count} for i, count in enumerate(counts, 1)]
+
+def lyrics_file_structure(lyrics_file):
+    """Структурата на песента по строфите на файла с текста (виж lyrics_structure)"""
+    with open(lyrics_file, 'r', encoding='utf-8') as f:
+        return lyrics_structure(f.read())
+
+def assign_sections(timeline, structure=None):
+    """Определя секциите на записите въз основа на позицията им"""
+    if structure is None:
+        structure = SONG_STRUCTURE
+    
+    line_idx = 0
+    for section in structure:
+        for _ in range(section['lines']):
+            if line_idx < len(timeline):
+                timeline[line_idx]['section'] = section['type']
+                line_idx += 1
     
     return timeline
 
-def main():
-    audio_file = 'FakeNews.wav'
-    lyrics_file = 'Lyrics.md'
-    output_file = 'Timeline.md'
+@profiled('write_timeline')
+def write_timeline(timeline, output_file, duration, title="FAKE NEWS - Таймлайн с таймкодове (Прецизна синхронизация)",
+                   overwrite_edits=False):
+    """Записва таймлайна (Timeline.json до output_file и Markdown изгледа в output_file)
     
+    Връща промените по записи (виж timeline_writer.write_timeline).
+    """
+    from timeline_writer import write_timeline as write_timeline_files
+    return write_timeline_files(timeline, output_file, duration, title, overwrite_edits=overwrite_edits)
+
+def main(argv=None):
+    import argparse
     import os
-    if not os.path.exists(audio_file):
+    parser = argparse.ArgumentParser(description='Прецизна синхронизация на текстове с аудио')
+    parser.add_argument('--audio', default='FakeNews.wav', help='аудио файл (по подразбиране FakeNews.wav/.mp3)')
+    parser.add_argument('--lyrics', default='Lyrics.md', help='файл с текстовете')
+    parser.add_argument('--output', default='Timeline.md', help='изходен таймлайн')
+    parser.add_argument('--stream', action='store_true',
+                        help='поточен анализ на блокове (за дълги записи, паметта не расте с дължината)')
+    parser.add_argument('--no-cache', action='store_true', help='анализ наново, без кеша на характеристиките')
+    add_profile_argument(parser)
+    parser.add_argument('--beat-snap', type=float, default=0.1, metavar='SECONDS',
+                        help='прилепване към удар в рамките на SECONDS (0 изключва, по подразбиране 0.1)')
+    add_timeline_arguments(parser)
+    add_validation_arguments(parser)
+    add_daemon_argument(parser)
+    add_timing_arguments(parser)
+    args = parser.parse_args(argv)
+    configure(args)
+    
+    audio_file = args.audio
+    lyrics_file = args.lyrics
+    output_file = args.output
+    
+    if not os.path.exists(audio_file) and audio_file == 'FakeNews.wav':
         audio_file = 'FakeNews.mp3'
     
     if not os.path.exists(audio_file):
         print(f"ГРЕШКА: Не е намерен аудио файл")
-        return
+        return 1
+    
+    if args.daemon:
+        # Анализът и синхронизацията се изпълняват от analysis_daemon.py (всичко е в паметта му)
+        try:
+            result = request('/sync', {
+                'audio': os.path.abspath(audio_file),
+                'lyrics': os.path.abspath(lyrics_file),
+                'output': os.path.abspath(output_file),
+                'profile': args.analysis_profile,
+                'stream': args.stream,
+                'beat_snap': args.beat_snap,
+                'overwrite_edits': args.overwrite_edits,
+                'repair': args.repair,
+                'min_duration': args.min_duration
+            }, url=args.daemon)
+        except DaemonError as e:
+            print(f"ГРЕШКА: {e}")
+            return 1
+        print(f"Записан таймлайн: {result['output']} ({len(result['timeline'])} записа, {result['seconds'] * 1000:.0f} ms)")
+        return 0
     
     print("=" * 60)
     print("ПРЕЦИЗНА СИНХРОНИЗАЦИЯ НА ТЕКСТОВЕ С АУДИО")
@@ -184,7 +323,8 @@ def main():
     print()
     
     # Анализ на вокалната активност
-    analysis = analyze_vocal_activity(audio_file)
+    analysis = analyze_vocal_activity(audio_file, streaming=args.stream, use_cache=not args.no_cache,
+                                      profile=args.analysis_profile)
     
     print()
     print("=" * 60)
@@ -192,74 +332,41 @@ def main():
     print("=" * 60)
     print()
     
-    # Синхронизация
-    timeline = sync_lyrics_with_audio(analysis, lyrics_file)
-    
-    # Определяне на секциите (за по-добра организация)
-    section_names = {
-        'intro': 'Встъп',
-        'verse1': 'Верс 1',
-        'chorus1': 'Припев 1',
-        'interlude': 'Интерлюд',
-        'verse2': 'Верс 2',
-        'chorus2': 'Припев 2',
-        'chorus3': 'Припев 3',
-        'outro': 'Финал'
-    }
+    # Граници на секциите от структурната сегментация (по една секция за всяка строфа)
+    from analyze_audio import analyze_audio_structure
+    structure_analysis = analyze_audio_structure(audio_file, streaming=args.stream, use_cache=not args.no_cache,
+                                                 profile=args.analysis_profile)
+    section_boundaries = lyrics_section_boundaries(structure_analysis, lyrics_file)
     
-    # Определяне на секциите въз основа на позицията
-    structure = [
-        {'type': 'intro', 'lines': 1},
-        {'type': 'verse1', 'lines': 16},
-        {'type': 'chorus1', 'lines': 2},
-        {'type': 'interlude', 'lines': 1},
-        {'type': 'verse2', 'lines': 8},
-        {'type': 'chorus2', 'lines': 2},
-        {'type': 'chorus3', 'lines': 2},
-        {'type': 'outro', 'lines': 1},
-    ]
+    # Синхронизация и определяне на секциите (за по-добра организация)
+    timeline = sync_lyrics_with_audio(analysis, lyrics_file, section_boundaries,
+                                      load_beat_grid(audio_file, args.analysis_profile), args.beat_snap)
+    assign_sections(timeline, lyrics_file_structure(lyrics_file))
     
-    line_idx = 0
-    for section in structure:
-        for _ in range(section['lines']):
-            if line_idx < len(timeline):
-                timeline[line_idx]['section'] = section['type']
-                line_idx += 1
+    # Проверка за застъпвания и твърде кратки записи (и поправка при --repair)
+    from cue_index import CueIndex
+    timeline = apply_validation(timeline, analysis['duration'], args, CueIndex.from_analysis(analysis))
     
     # Записване на резултатите
     print(f"Записване на таймлайн в: {output_file}")
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write("# FAKE NEWS - Таймлайн с таймкодове (Прецизна синхронизация)\n\n")
-        f.write(f"**Обща продължителност:** {format_time(analysis['duration'])}\n\n")
-        f.write("---\n\n")
-        
-        current_section = None
-        for i, entry in enumerate(timeline, 1):
-            start_time = format_time(entry['start'])
-            end_time = format_time(entry['end'])
-            duration = format_time(entry['end'] - entry['start'])
-            
-            # Показване на секцията само при промяна
-            section_type = entry.get('section', 'unknown')
-            if section_type != current_section:
-                current_section = section_type
-                section_name = section_names.get(section_type, section_type)
-                f.write(f"\n### {section_name.upper()}\n\n")
-            
-            f.write(f"## {i}. {start_time} - {end_time} ({duration})\n")
-            f.write(f"**Текст:** {entry['line']}\n\n")
+    # Записаният таймлайн (със запазените ръчни редакции)
+    timeline = write_timeline(timeline, output_file, analysis['duration'], overwrite_edits=args.overwrite_edits)['timeline']
     
     print(f"\nГотово! Създадени са {len(timeline)} синхронизирани записа.")
     print("\nПървите 5 записа:")
     print("-" * 60)
     for i, entry in enumerate(timeline[:5], 1):
         print(f"{i}. {format_time(entry['start'])} - {format_time(entry['end'])}: {entry['line'][:50]}...")
+    
+    report(args)
+    return 0
 
 if __name__ == '__main__':
     try:
-        main()
+        sys.exit(main())
     except Exception as e:
         print(f"ГРЕШКА: {e}")
         import traceback
         traceback.print_exc()
+        sys.exit(1)
 
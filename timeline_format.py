@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Каноничен формат на таймлайна (Timeline.json)
+Началата и краищата се пазят като float64 (без закръгляне до MM:SS.mmm), секциите и текстовете
+са в отделни таблици, а всеки запис е [start, end, section_id, text_id]. Производителите
+(analyze_audio, sync_lyrics, manual_sync) записват JSON файла, а Timeline.md се генерира от него
+като изглед за хора (инкрементално, виж timeline_writer.py). Рендерите четат JSON директно,
+без regex парсване.
+"""
+
+import json
+import os
+import numpy as np
+
+TIMELINE_FORMAT = 'fakenews-timeline'
+TIMELINE_VERSION = 1
+
+# Записите като NumPy структуриран масив
+TIMELINE_DTYPE = np.dtype([
+    ('start', np.float64),
+    ('end', np.float64),
+    ('section', np.int32),
+    ('text', np.int32)
+])
+
+# Имена на секциите за таймлайна
+SECTION_NAMES = {
+    'intro': 'Встъп',
+    'verse1': 'Верс 1',
+    'chorus1': 'Припев 1',
+    'interlude': 'Интерлюд',
+    'verse2': 'Верс 2',
+    'chorus2': 'Припев 2',
+    'chorus3': 'Припев 3',
+    'outro': 'Финал'
+}
+
+STANZA_PREFIX = 'stanza'          # секции по строфите на текста: stanza1, stanza2, ...
+
+def section_name(section):
+    """Показваното име на секция (за stanzaN - 'Строфа N')"""
+    if section in SECTION_NAMES:
+        return SECTION_NAMES[section]
+    number = section[len(STANZA_PREFIX):] if section.startswith(STANZA_PREFIX) else ''
+    return f"Строфа {number}" if number.isdigit() else section
+
+def section_id(name):
+    """Идентификаторът на секция по показваното ѝ име (без значение от регистъра) или None"""
+    for section, section_label in SECTION_NAMES.items():
+        if section_label.upper() == name.upper():
+            return section
+    words = name.split()
+    if len(words) == 2 and words[0].upper() == 'СТРОФА' and words[1].isdigit():
+        return f"{STANZA_PREFIX}{words[1]}"
+    return None
+
+def format_time(seconds):
+    """Форматира секунди в MM:SS.mmm формат"""
+    total_ms = int(round(seconds * 1000))
+    minutes, rest = divmod(total_ms, 60000)
+    return f"{minutes:02d}:{rest // 1000:02d}.{rest % 1000:03d}"
+
+def json_path_for(timeline_file):
+    """Timeline.md -> Timeline.json"""
+    return os.path.splitext(timeline_file)[0] + '.json'
+
+def build_document(timeline, duration=None, title=None, tempo=None):
+    """Създава документа на таймлайна от списък с {'start', 'end', 'line'/'text', 'section'}"""
+    sections = []
+    section_ids = {}
+    texts = []
+    text_ids = {}
+    entries = []
+    for entry in timeline:
+        section = entry.get('section') or 'unknown'
+        if section not in section_ids:
+            section_ids[section] = len(sections)
+            sections.append({'id': section, 'name': section_name(section)})
+        text = entry['line'] if 'line' in entry else entry['text']
+        if text not in text_ids:
+            text_ids[text] = len(texts)
+            texts.append(text)
+        entries.append([float(entry['start']), float(entry['end']), section_ids[section], text_ids[text]])
+    
+    return {
+        'format': TIMELINE_FORMAT,
+        'version': TIMELINE_VERSION,
+        'title': title,
+        'duration': None if duration is None else float(duration),
+        'tempo': None if tempo is None else float(tempo),
+        'sections': sections,
+        'texts': texts,
+        'entries': entries
+    }
+
+def to_array(document):
+    """Записите на документа като структуриран масив с TIMELINE_DTYPE"""
+    array = np.zeros(len(document['entries']), dtype=TIMELINE_DTYPE)
+    if document['entries']:
+        values = np.asarray(document['entries'], dtype=np.float64)
+        array['start'] = values[:, 0]
+        array['end'] = values[:, 1]
+        array['section'] = values[:, 2].astype(np.int32)
+        array['text'] = values[:, 3].astype(np.int32)
+    return array
+
+def entries(document):
+    """Записите като речници за рендерите ('section' е името на секцията с главни букви)"""
+    result = []
+    for start, end, section_id, text_id in document['entries']:
+        section = document['sections'][section_id]
+        text = document['texts'][text_id]
+        result.append({
+            'start': start,
+            'end': end,
+            'text': text,
+            'line': text,
+            'section': section['name'].upper(),
+            'section_id': section['id']
+        })
+    return result
+
+def save_timeline(path, document):
+    """Записва документа атомарно като компактен JSON"""
+    tmp_path = path + f'.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+def load_timeline(path):
+    """Зарежда и проверява Timeline.json"""
+    with open(path, 'r', encoding='utf-8') as f:
+        document = json.load(f)
+    if document.get('format') != TIMELINE_FORMAT:
+        raise ValueError(f"{path}: не е таймлайн във формат {TIMELINE_FORMAT}")
+    if document.get('version') != TIMELINE_VERSION:
+        raise ValueError(f"{path}: неподдържана версия {document.get('version')} (очаква се {TIMELINE_VERSION})")
+    return document
+
+def render_markdown(document):
+    """Генерира Timeline.md (изглед за хора) от документа"""
+    parts = [f"# {document.get('title') or 'FAKE NEWS - Таймлайн с таймкодове'}\n\n"]
+    if document.get('duration') is not None:
+        parts.append(f"**Обща продължителност:** {format_time(document['duration'])}\n")
+    if document.get('tempo') is not None:
+        parts.append(f"**Темпо (BPM):** {document['tempo']:.2f}\n")
+    parts.append("\n---\n\n")
+    
+    current_section = None
+    for i, (start, end, section_id, text_id) in enumerate(document['entries'], 1):
+        # Показване на секцията само при промяна
+        if section_id != current_section:
+            current_section = section_id
+            parts.append(f"\n### {document['sections'][section_id]['name'].upper()}\n\n")
+        parts.append(f"## {i}. {format_time(start)} - {format_time(end)} ({format_time(end - start)})\n")
+        parts.append(f"**Текст:** {document['texts'][text_id]}\n\n")
+    return ''.join(parts)
+
+def read_timeline(timeline_file, parse_markdown=None):
+    """Чете таймлайна за рендиране - от Timeline.json, ако е наличен и не е по-стар от Markdown файла
+    
+    Ако Timeline.md е редактиран на ръка след последното записване, се парсва Markdown файлът
+    (с timeline_parser.parse_timeline, ако не е подаден друг парсер).
+    """
+    json_file = json_path_for(timeline_file)
+    if timeline_file.endswith('.json'):
+        return entries(load_timeline(timeline_file))
+    if os.path.exists(json_file) and (not os.path.exists(timeline_file)
+                                      or os.path.getmtime(json_file) >= os.path.getmtime(timeline_file)):
+        return entries(load_timeline(json_file))
+    if os.path.exists(json_file):
+        print(f"ВНИМАНИЕ: {timeline_file} е по-нов от {json_file} - използва се Markdown файлът")
+    if parse_markdown is None:
+        from timeline_parser import parse_timeline as parse_markdown
+    return parse_markdown(timeline_file)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Интервален индекс на таймлайна
+Отговаря за O(log n) на въпросите "кой ред е активен в момент t" и "кога е следващата смяна",
+върху сортирани масиви със searchsorted. Използва се от генерирането на кадри, live прегледа
+в manual_sync.py и експорта.
+"""
+
+import numpy as np
+
+class TimelineIndex:
+    """Сортирани начала/краища на записите и всички граници (начала и краища)"""
+    
+    def __init__(self, timeline):
+        self.entries = list(timeline)
+        starts = np.array([entry['start'] for entry in self.entries], dtype=float)
+        ends = np.array([entry['end'] for entry in self.entries], dtype=float)
+        self.order = np.argsort(starts, kind='stable')
+        self.starts = starts[self.order]
+        self.ends = ends[self.order]
+        # Максималният край до всяка позиция - за ранно спиране при застъпващи се записи
+        self.max_end = np.maximum.accumulate(self.ends) if len(self.ends) else self.ends
+        self.boundaries = np.unique(np.concatenate([starts, ends]))
+    
+    @classmethod
+    def from_document(cls, document):
+        """Създава индекс от документ на Timeline.json (виж timeline_format.py)"""
+        from timeline_format import entries
+        return cls(entries(document))
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def active_index(self, t):
+        """Индексът (в подадения таймлайн) на активния запис в момент t или -1
+        
+        При застъпване печели записът, започнал последен.
+        """
+        pos = int(np.searchsorted(self.starts, t, side='right')) - 1
+        while pos >= 0 and self.max_end[pos] > t:
+            if self.ends[pos] > t:
+                return int(self.order[pos])
+            pos -= 1
+        return -1
+    
+    def active(self, t):
+        """Активният запис в момент t или None"""
+        index = self.active_index(t)
+        return None if index < 0 else self.entries[index]
+    
+    def active_indices(self, times):
+        """Векторно active_index за масив от моменти (напр. времената на всички кадри)
+        
+        Приема, че записите не се застъпват (както след timeline_validation); при застъпване
+        резултатът е записът, започнал последен, ако все още е активен.
+        """
+        times = np.asarray(times, dtype=float)
+        pos = np.searchsorted(self.starts, times, side='right') - 1
+        valid = pos >= 0
+        safe = np.maximum(pos, 0)
+        valid &= self.ends[safe] > times
+        return np.where(valid, self.order[safe], -1)
+    
+    def next_boundary(self, t):
+        """Първата граница (начало или край на запис) след t или None"""
+        pos = int(np.searchsorted(self.boundaries, t, side='right'))
+        return float(self.boundaries[pos]) if pos < len(self.boundaries) else None
+    
+    def range(self, start, end):
+        """Индексите на записите, които се виждат в интервала [start, end)
+        
+        O(log n + k): преди първата позиция, в която max_end > start, всички записи вече са
+        свършили, а след последното начало преди end още не са започнали.
+        """
+        lo = int(np.searchsorted(self.max_end, start, side='right'))
+        hi = int(np.searchsorted(self.starts, end, side='left'))
+        if lo >= hi:
+            return []
+        visible = lo + np.flatnonzero(self.ends[lo:hi] > start)
+        return [int(i) for i in self.order[visible]]
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Парсер на Timeline.md (човешкия изглед на таймлайна)
+Чете файла ред по ред в един проход и връща записите заедно със секцията им, докато чете.
+Форматът се проверява строго - всяко отклонение е TimelineFormatError с номера на реда.
+
+Очакван формат (виж timeline_format.render_markdown):
+    # Заглавие
+    **Обща продължителност:** MM:SS.mmm
+    **Темпо (BPM):** 120.00
+    ---
+    ### СЕКЦИЯ
+    ## 1. MM:SS.mmm - MM:SS.mmm (MM:SS.mmm)
+    **Текст:** ред от текста
+Продължителността в скобите е само за четене и не се проверява (времената може да са
+редактирани на ръка).
+"""
+
+import re
+from profiling import profiled
+from timeline_format import section_id as find_section_id
+
+TIME_RE = re.compile(r'^(\d{2,}):([0-5]\d)\.(\d{3})$')
+ENTRY_RE = re.compile(r'^##\s+(\d+)\.\s+(\S+)\s+-\s+(\S+)(?:\s+\((\S+)\))?$')
+TEXT_PREFIX = '**Текст:**'
+METADATA_FIELDS = {
+    '**Обща продължителност:**': 'duration',
+    '**Темпо (BPM):**': 'tempo'
+}
+
+class TimelineFormatError(ValueError):
+    """Невалиден Timeline.md (с файла и номера на реда)"""
+    
+    def __init__(self, message, source=None, line_number=None):
+        self.source = source
+        self.line_number = line_number
+        location = f"{source or 'Timeline.md'}:{line_number}" if line_number is not None else (source or 'Timeline.md')
+        super().__init__(f"{location}: {message}")
+
+def parse_time(time_str):
+    """Парсва време от формат MM:SS.mmm в секунди (ValueError при друг формат)"""
+    match = TIME_RE.match(time_str.strip())
+    if not match:
+        raise ValueError(f"невалидно време '{time_str}' (очаква се MM:SS.mmm)")
+    minutes, seconds, milliseconds = (int(group) for group in match.groups())
+    return minutes * 60 + seconds + milliseconds / 1000.0
+
+def iter_timeline(lines, source=None, metadata=None):
+    """Генератор на записите от редовете на Timeline.md (например отворен файл)
+    
+    Всеки запис е {'start', 'end', 'text', 'line', 'section', 'section_id', 'number', 'line_number',
+    'text_line_number'} (номерата на редовете са на заглавието и на текста на записа).
+    Ако е подаден речник metadata, в него се попълват 'title', 'duration' и 'tempo' от заглавната част.
+    """
+    if metadata is None:
+        metadata = {}
+    section = 'Unknown'
+    section_id = None
+    pending = None
+    expected_number = 1
+    in_body = False
+    line_number = 0
+    
+    def error(message):
+        return TimelineFormatError(message, source, line_number)
+    
+    for line_number, raw in enumerate(lines, 1):
+        line = raw.rstrip('\r\n').strip()
+        if not line:
+            continue
+        
+        if pending is not None:
+            # След заглавието на запис следва задължително редът с текста
+            if not line.startswith(TEXT_PREFIX):
+                raise error(f"очаква се '{TEXT_PREFIX}' за запис {pending['number']} (ред {pending['line_number']})")
+            text = line[len(TEXT_PREFIX):].strip()
+            if not text:
+                raise error(f"празен текст на запис {pending['number']}")
+            pending['text'] = text
+            pending['line'] = text
+            pending['text_line_number'] = line_number
+            yield pending
+            pending = None
+            continue
+        
+        if line.startswith('### '):
+            section = line[4:].strip()
+            if not section:
+                raise error("празно име на секция")
+            section_id = find_section_id(section)
+            in_body = True
+        elif line.startswith('## '):
+            match = ENTRY_RE.match(line)
+            if not match:
+                raise error(f"невалиден запис '{line}' (очаква се '## N. MM:SS.mmm - MM:SS.mmm (MM:SS.mmm)')")
+            number = int(match.group(1))
+            if number != expected_number:
+                raise error(f"запис {number} вместо очаквания {expected_number}")
+            try:
+                start = parse_time(match.group(2))
+                end = parse_time(match.group(3))
+                if match.group(4) is not None:
+                    parse_time(match.group(4))
+            except ValueError as e:
+                raise error(str(e))
+            if end < start:
+                raise error(f"краят {match.group(3)} е преди началото {match.group(2)}")
+            pending = {
+                'start': start,
+                'end': end,
+                'section': section,
+                'section_id': section_id,
+                'number': number,
+                'line_number': line_number
+            }
+            expected_number += 1
+            in_body = True
+        elif line.startswith(TEXT_PREFIX):
+            raise error(f"'{TEXT_PREFIX}' без запис преди него")
+        elif in_body:
+            raise error(f"неочакван ред '{line}'")
+        elif line.startswith('# '):
+            metadata['title'] = line[2:].strip()
+        elif line == '---':
+            continue
+        else:
+            for prefix, field in METADATA_FIELDS.items():
+                if line.startswith(prefix):
+                    value = line[len(prefix):].strip()
+                    try:
+                        metadata[field] = parse_time(value) if field == 'duration' else float(value)
+                    except ValueError as e:
+                        raise error(str(e))
+                    break
+            else:
+                raise error(f"неочакван ред '{line}'")
+    
+    if pending is not None:
+        raise error(f"запис {pending['number']} (ред {pending['line_number']}) няма '{TEXT_PREFIX}'")
+
+@profiled('parse_timeline')
+def parse_timeline(timeline_file, metadata=None):
+    """Парсва Timeline.md файла и връща списък със записите"""
+    with open(timeline_file, 'r', encoding='utf-8') as f:
+        return list(iter_timeline(f, timeline_file, metadata))
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Проверка и поправка на таймлайна
+Всички проверки вървят векторно върху масивите с началата и краищата: застъпвания, дупки,
+прекалено кратки записи, ненарастващи начала, излизане извън песента и редове, които трябва да
+се изпеят неестествено бързо (срички в секунда спрямо медианата). Рендерите отпечатват
+проблемите преди кодирането (и спират при грешка само със --strict), а синхронизацията може да
+поправи таймлайна (--repair), като преразпредели времето между засегнатите редове и ги прилепи
+към cue точките от анализа.
+"""
+
+import numpy as np
+from lyrics_alignment import count_syllables
+from timeline_format import format_time
+
+VALIDATION_PARAMS = {
+    'min_duration': 0.3,           # секунди - по-кратък запис не може да бъде прочетен
+    'max_gap': 20.0,               # секунди без текст (предупреждение - може да е инструментал)
+    'max_syllables_per_second': 25.0,  # по-бързо не може да се изпее
+    'outlier_z': 3.5,              # робастен z-score (медиана/MAD) на сричките в секунда
+    'tolerance': 0.001,            # секунди - разминаване, което се пренебрегва
+    'snap_tolerance': 0.15         # секунди - прилепване на преразпределените граници към cue
+}
+
+class TimelineValidationError(ValueError):
+    """Таймлайн с грешки (рендирането не започва)"""
+
+def timeline_arrays(timeline):
+    """Началата, краищата и броя срички на записите като масиви"""
+    starts = np.array([entry['start'] for entry in timeline], dtype=float)
+    ends = np.array([entry['end'] for entry in timeline], dtype=float)
+    syllables = np.array([count_syllables(entry.get('text', entry.get('line', ''))) for entry in timeline],
+                         dtype=float)
+    return starts, ends, syllables
+
+def issue(kind, severity, indices, message):
+    return [{'index': int(i), 'kind': kind, 'severity': severity, 'message': message(int(i))} for i in indices]
+
+def validate_timeline(timeline, duration=None, params=None):
+    """Проверява таймлайна и връща списък с проблеми (първо грешките, по номер на запис)
+    
+    Всеки проблем е {'index', 'kind', 'severity' ('error' или 'warning'), 'message'}.
+    """
+    params = dict(VALIDATION_PARAMS, **(params or {}))
+    if not timeline:
+        return [{'index': -1, 'kind': 'empty', 'severity': 'error', 'message': 'таймлайнът е празен'}]
+    
+    tol = params['tolerance']
+    starts, ends, syllables = timeline_arrays(timeline)
+    lengths = ends - starts
+    issues = []
+    
+    negative = np.flatnonzero(lengths < -tol)
+    issues += issue('negative', 'error', negative,
+                    lambda i: f"краят {format_time(ends[i])} е преди началото {format_time(starts[i])}")
+    
+    short = np.flatnonzero((lengths >= -tol) & (lengths < params['min_duration'] - tol))
+    issues += issue('short', 'error', short,
+                    lambda i: f"продължава {lengths[i] * 1000:.0f} ms (минимум {params['min_duration'] * 1000:.0f} ms)")
+    
+    backwards = np.flatnonzero(np.diff(starts) < -tol) + 1
+    issues += issue('order', 'error', backwards,
+                    lambda i: f"започва в {format_time(starts[i])}, преди предходния запис ({format_time(starts[i - 1])})")
+    
+    overlap = np.flatnonzero(ends[:-1] - starts[1:] > tol)
+    overlap = overlap[~np.isin(overlap + 1, backwards)]
+    issues += issue('overlap', 'error', overlap,
+                    lambda i: f"застъпва се със следващия запис с {(ends[i] - starts[i + 1]) * 1000:.0f} ms")
+    
+    outside = starts < -tol
+    if duration is not None:
+        outside |= ends > duration + tol
+    issues += issue('range', 'error', np.flatnonzero(outside),
+                    lambda i: f"{format_time(starts[i])} - {format_time(ends[i])} е извън песента")
+    
+    gaps = np.flatnonzero(starts[1:] - ends[:-1] > params['max_gap']) + 1
+    issues += issue('gap', 'warning', gaps,
+                    lambda i: f"{starts[i] - ends[i - 1]:.1f} s без текст преди записа")
+    
+    # Срички в секунда - кратките записи вече са грешка, затова не се броят
+    valid = lengths >= params['min_duration'] - tol
+    rate = np.where(valid, syllables / np.maximum(lengths, 1e-6), 0.0)
+    if valid.any():
+        median = np.median(rate[valid])
+        mad = np.median(np.abs(rate[valid] - median)) * 1.4826
+        z = (rate - median) / mad if mad > 0 else np.zeros_like(rate)
+        outlier = (z > params['outlier_z']) & (rate > 2 * median)
+        fast = np.flatnonzero(valid & ((rate > params['max_syllables_per_second']) | outlier))
+        issues += issue('rate', 'warning', fast,
+                        lambda i: f"{rate[i]:.1f} срички/s (медиана {median:.1f})")
+    
+    return sorted(issues, key=lambda item: (item['severity'] != 'error', item['index']))
+
+def errors(issues):
+    """Само грешките от списъка с проблеми"""
+    return [item for item in issues if item['severity'] == 'error']
+
+def print_issues(issues, limit=10):
+    """Отпечатва проблемите (най-много limit на брой)"""
+    if not issues:
+        print("Таймлайнът е валиден")
+        return
+    error_count = len(errors(issues))
+    print(f"Проверка на таймлайна: {error_count} грешки, {len(issues) - error_count} предупреждения")
+    for item in issues[:limit]:
+        label = 'ГРЕШКА' if item['severity'] == 'error' else 'ВНИМАНИЕ'
+        print(f"  {label}: запис {item['index'] + 1}: {item['message']}")
+    if len(issues) > limit:
+        print(f"  ... и още {len(issues) - limit}")
+
+def check_timeline(timeline, duration=None, params=None):
+    """Хвърля TimelineValidationError, ако таймлайнът има грешки; връща предупрежденията"""
+    issues = validate_timeline(timeline, duration, params)
+    found = errors(issues)
+    if found:
+        details = '; '.join(f"запис {item['index'] + 1}: {item['message']}" for item in found[:3])
+        more = f" (и още {len(found) - 3})" if len(found) > 3 else ""
+        raise TimelineValidationError(f"Таймлайнът има {len(found)} грешки: {details}{more}. "
+                                      f"Поправи го с --repair при синхронизацията или на ръка")
+    return issues
+
+def check_render_timeline(timeline, duration=None, strict=False):
+    """Проверка преди рендиране (връща проблемите)
+    
+    strict=True спира рендирането с TimelineValidationError при грешка; иначе грешките се
+    отпечатват заедно с предупрежденията и рендирането продължава.
+    """
+    if strict:
+        issues = check_timeline(timeline, duration)
+    else:
+        issues = validate_timeline(timeline, duration)
+        if errors(issues):
+            print("ВНИМАНИЕ: Таймлайнът има грешки - рендиране въпреки тях "
+                  "(--strict спира рендирането, --repair при синхронизацията ги поправя)")
+    print_issues(issues)
+    return issues
+
+def redistribute(starts, ends, syllables, first, last, window_start, window_end, cue_index, params):
+    """Разпределя [window_start, window_end] между записите first..last
+    
+    Всеки запис получава min_duration, а остатъкът се дели според сричките (ако прозорецът е
+    твърде кратък дори за това - поравно).
+    """
+    weights = syllables[first:last + 1]
+    window = window_end - window_start
+    count = last - first + 1
+    if window >= params['min_duration'] * count:
+        lengths = params['min_duration'] + (window - params['min_duration'] * count) * weights / weights.sum()
+    else:
+        lengths = np.full(count, window / count)
+    bounds = window_start + np.concatenate([[0.0], np.cumsum(lengths)])
+    bounds[-1] = window_end
+    
+    if cue_index is not None and len(bounds) > 2:
+        # Вътрешните граници се прилепват към cue точки, ако това не прави запис твърде кратък
+        snapped = bounds.copy()
+        snapped[1:-1] = cue_index.within(bounds[1:-1], params['snap_tolerance'])
+        if np.all(np.diff(snapped) >= params['min_duration']):
+            bounds = snapped
+    
+    starts[first:last + 1] = bounds[:-1]
+    ends[first:last + 1] = bounds[1:]
+
+def repair_timeline(timeline, duration=None, cue_index=None, params=None):
+    """Поправя грешките в таймлайна и връща (нов таймлайн, индекси на променените записи)
+    
+    Началата стават нарастващи и в рамките на песента, застъпванията се отрязват до началото на
+    следващия запис, а поредиците от твърде кратки записи получават време от следващите записи
+    (в края на песента - от предходните), докато всеки стане поне min_duration. Времето се
+    разпределя по брой срички и се прилепва към cue_index, ако е подаден.
+    """
+    params = dict(VALIDATION_PARAMS, **(params or {}))
+    if not timeline:
+        return [], []
+    starts, ends, syllables = timeline_arrays(timeline)
+    original = np.stack([starts, ends])
+    limit = duration if duration is not None else max(float(ends.max()), float(starts.max()))
+    n = len(timeline)
+    
+    starts = np.maximum.accumulate(np.clip(starts, 0.0, limit))
+    ends = np.clip(ends, 0.0, limit)
+    next_starts = np.append(starts[1:], limit)
+    ends = np.minimum(np.maximum(ends, starts), next_starts)
+    
+    min_duration = params['min_duration']
+    i = 0
+    while i < n:
+        if ends[i] - starts[i] >= min_duration - params['tolerance']:
+            i += 1
+            continue
+        # Поредицата от кратки записи се разширява напред, докато прозорецът стигне за всички
+        last = i
+        while last + 1 < n and ends[last + 1] - starts[last + 1] < min_duration:
+            last += 1
+        window_end = starts[last + 1] if last + 1 < n else limit
+        while window_end - starts[i] < min_duration * (last - i + 1) and last + 1 < n:
+            last += 1
+            window_end = starts[last + 1] if last + 1 < n else limit
+        # В края на песента времето се взема от предходните записи
+        first = i
+        while window_end - starts[first] < min_duration * (last - first + 1) and first > 0:
+            first -= 1
+        window_start = starts[first]
+        if first == 0:
+            # Ако и това не стига, първият запис започва по-рано (не преди началото на песента)
+            window_start = max(0.0, min(window_start, window_end - min_duration * (last + 1)))
+        redistribute(starts, ends, syllables, first, last, window_start, window_end, cue_index, params)
+        i = last + 1
+    
+    changed = np.flatnonzero(np.any(np.abs(np.stack([starts, ends]) - original) > params['tolerance'], axis=0))
+    repaired = [dict(entry, start=float(start), end=float(end)) for entry, start, end in zip(timeline, starts, ends)]
+    return repaired, [int(i) for i in changed]
+
+def add_validation_arguments(parser):
+    """Добавя --repair и --min-duration към argparse парсер"""
+    parser.add_argument('--repair', action='store_true',
+                        help='автоматична поправка на застъпвания и твърде кратки записи в таймлайна')
+    parser.add_argument('--min-duration', type=float, default=VALIDATION_PARAMS['min_duration'], metavar='SECONDS',
+                        help=f"минимална продължителност на запис (по подразбиране {VALIDATION_PARAMS['min_duration']})")
+
+def apply_validation(timeline, duration, args, cue_index=None):
+    """Проверка на таймлайна от командния ред и поправка при --repair; връща (поправения) таймлайн"""
+    params = {'min_duration': args.min_duration}
+    issues = validate_timeline(timeline, duration, params)
+    if args.repair and errors(issues):
+        timeline, repaired = repair_timeline(timeline, duration, cue_index, params)
+        print(f"Поправени записи: {len(repaired)}")
+        issues = validate_timeline(timeline, duration, params)
+    print_issues(issues)
+    return timeline
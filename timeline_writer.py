@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Инкрементално записване на таймлайна
+Новият таймлайн се сравнява със съществуващия Timeline.md и в него се подменят само редовете
+на променените записи (атомарно, през временен файл). Ръчните редакции се пазят: запис, чийто
+Markdown се различава от последно записания Timeline.json (или вече отбелязан като редактиран),
+остава какъвто е, докато не се подаде --overwrite-edits; съседните генерирани записи се скъсяват
+така, че да не се застъпват с него, а слетият таймлайн се проверява наново. Резултатът е списък
+с промените по записи, по който кешовете надолу по веригата инвалидират само засегнатите интервали.
+"""
+
+import os
+import shutil
+from difflib import SequenceMatcher
+from timeline_format import (build_document, entries, format_time, json_path_for, load_timeline,
+                             render_markdown, save_timeline)
+from timeline_parser import TEXT_PREFIX, TimelineFormatError, parse_timeline
+from timeline_validation import print_issues, validate_timeline
+
+def entry_key(entry):
+    """Записът така, както се вижда в Markdown файла (времената до милисекунда)"""
+    return (format_time(entry['start']), format_time(entry['end']), entry['text'], entry['section'].upper())
+
+def entry_lines(number, entry):
+    """Двата реда на запис в Timeline.md"""
+    return [
+        f"## {number}. {format_time(entry['start'])} - {format_time(entry['end'])} "
+        f"({format_time(entry['end'] - entry['start'])})\n",
+        f"{TEXT_PREFIX} {entry['text']}\n"
+    ]
+
+def header_key(metadata):
+    """Заглавната част на Timeline.md (заглавие, продължителност, темпо)"""
+    return render_markdown({'title': metadata.get('title'), 'duration': metadata.get('duration'),
+                            'tempo': metadata.get('tempo'), 'sections': [], 'entries': []})
+
+def read_existing(output_file):
+    """Последно записаният Timeline.json и текущият Timeline.md (записи, заглавна част и редове)"""
+    base = None
+    json_file = json_path_for(output_file)
+    if os.path.exists(json_file):
+        try:
+            base = load_timeline(json_file)
+        except ValueError as e:
+            print(f"ВНИМАНИЕ: {e} - ръчните редакции не могат да бъдат открити")
+    
+    current = lines = None
+    metadata = {}
+    if os.path.exists(output_file):
+        with open(output_file, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        try:
+            current = parse_timeline(output_file, metadata)
+        except TimelineFormatError as e:
+            backup = output_file + '.bak'
+            shutil.copyfile(output_file, backup)
+            print(f"ВНИМАНИЕ: {e}")
+            print(f"ВНИМАНИЕ: Файлът ще бъде презаписан изцяло (старото съдържание е в {backup})")
+            lines = None
+    return base, current, metadata, lines
+
+def match_entries(old_rows, new_rows):
+    """Съответствие индекс в new_rows -> индекс в old_rows
+    
+    При еднакъв брой записи - по позиция; иначе по текста на редовете (добавен или премахнат ред
+    не измества съответствието на останалите), а заменени блокове с еднаква дължина - по позиция.
+    """
+    if len(old_rows) == len(new_rows):
+        return {i: i for i in range(len(new_rows))}
+    matcher = SequenceMatcher(None, [row['text'] for row in old_rows], [row['text'] for row in new_rows],
+                              autojunk=False)
+    matches = {}
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal' or (tag == 'replace' and i2 - i1 == j2 - j1):
+            matches.update({j1 + k: i1 + k for k in range(j2 - j1)})
+    return matches
+
+def merge_entries(new_rows, current, base, overwrite_edits=False):
+    """Тристранно сливане по записи: нов таймлайн, текущ Markdown и последно записан JSON
+    
+    Записите се съпоставят по текст (виж match_entries), така че ръчна редакция остава при своя
+    ред и когато синхронизацията добави или премахне други редове. Връща (слетите записи,
+    индексите на ръчно редактираните записи).
+    """
+    if current is None:
+        return list(new_rows), []
+    
+    # Ръчно редактирани текущи записи: различни от последно записания JSON или отбелязани в него
+    edited_current = set()
+    if base is not None:
+        base_rows = entries(base)
+        pinned = set(base.get('edited', []))
+        base_matches = match_entries(base_rows, current)
+        for cur_index, base_index in base_matches.items():
+            if base_index in pinned or entry_key(current[cur_index]) != entry_key(base_rows[base_index]):
+                edited_current.add(cur_index)
+        # Ред, който липсва в JSON файла, е добавен на ръка
+        edited_current |= set(range(len(current))) - set(base_matches)
+    
+    matches = match_entries(current, new_rows)
+    merged = []
+    edited = []
+    for i, new in enumerate(new_rows):
+        cur_index = matches.get(i)
+        if not overwrite_edits and cur_index in edited_current:
+            cur = current[cur_index]
+            merged.append(dict(cur, section_id=cur['section_id'] or cur['section']))
+            edited.append(i)
+        else:
+            merged.append(new)
+    
+    lost = sorted(edited_current - set(matches.values()))
+    if lost and not overwrite_edits:
+        for cur_index in lost:
+            print(f"ВНИМАНИЕ: ръчно редактираният запис {cur_index + 1} "
+                  f"(„{current[cur_index]['text'][:40]}“) липсва в новия таймлайн и се премахва")
+    return merged, edited
+
+def fit_around_edits(rows, edited):
+    """Скъсява генерираните записи, които се застъпват със запазена ръчна редакция (на място)
+    
+    Ръчната редакция печели: предишният запис свършва при началото ѝ, а следващият започва при
+    края ѝ. Застъпване между две ръчни редакции остава (то е на потребителя) и се вижда при
+    проверката. Връща индексите на скъсените записи.
+    """
+    edited = set(edited)
+    clamped = []
+    for i in sorted(edited):
+        if i > 0 and i - 1 not in edited and rows[i - 1]['end'] > rows[i]['start']:
+            rows[i - 1] = dict(rows[i - 1], end=rows[i]['start'])
+            clamped.append(i - 1)
+        if i + 1 < len(rows) and i + 1 not in edited and rows[i + 1]['start'] < rows[i]['end']:
+            rows[i + 1] = dict(rows[i + 1], start=rows[i]['end'])
+            clamped.append(i + 1)
+    for i in clamped:
+        print(f"ВНИМАНИЕ: запис {i + 1} е скъсен до {format_time(rows[i]['start'])} - "
+              f"{format_time(rows[i]['end'])}, за да не се застъпва с ръчно редактиран запис")
+    return clamped
+
+def write_timeline(timeline, output_file, duration=None, title=None, tempo=None, overwrite_edits=False):
+    """Записва Timeline.json и Timeline.md, като в Markdown файла подменя само променените записи
+    
+    Връща речник с промените: 'changed', 'added', 'removed' и 'edited' (запазени ръчни редакции)
+    са индекси на записи, 'dirty' е списък с интервали (start, end), чието съдържание се е
+    променило, 'rewritten' показва дали Markdown файлът е генериран наново, а 'timeline' са
+    записаните записи (със запазените ръчни редакции - различни от подадения timeline).
+    """
+    document = build_document(timeline, duration, title, tempo)
+    base, current, metadata, lines = read_existing(output_file)
+    new_rows = entries(document)
+    merged, edited = merge_entries(new_rows, current, base, overwrite_edits)
+    
+    if edited:
+        fit_around_edits(merged, edited)
+        # Ръчно редактираните записи влизат и в каноничния JSON
+        document = build_document([dict(row, section=row['section_id']) for row in merged], duration, title, tempo)
+        document['edited'] = edited
+        merged = entries(document)
+        # Подаденият таймлайн е проверен преди сливането - слетият се проверява наново
+        print("Проверка след сливането с ръчните редакции:")
+        print_issues(validate_timeline(merged, duration))
+    
+    previous = current if current is not None else (entries(base) if base is not None else [])
+    changed = [i for i in range(min(len(previous), len(merged)))
+               if entry_key(previous[i]) != entry_key(merged[i])]
+    added = list(range(len(previous), len(merged)))
+    removed = list(range(len(merged), len(previous)))
+    dirty = []
+    for i in changed:
+        dirty.append((min(previous[i]['start'], merged[i]['start']), max(previous[i]['end'], merged[i]['end'])))
+    dirty += [(merged[i]['start'], merged[i]['end']) for i in added]
+    dirty += [(previous[i]['start'], previous[i]['end']) for i in removed]
+    
+    # Подмяна на място е възможна, ако броят на записите и секциите им са същите
+    patchable = (lines is not None and current is not None and not added and not removed
+                 and all(previous[i]['section'].upper() == merged[i]['section'].upper() for i in changed)
+                 and header_key(document) == header_key(metadata))
+    if patchable:
+        for i in changed:
+            header_line = current[i]['line_number'] - 1
+            text_line = current[i]['text_line_number'] - 1
+            lines[header_line], lines[text_line] = entry_lines(i + 1, merged[i])
+        content = ''.join(lines)
+    else:
+        content = render_markdown(document)
+    
+    if not patchable or changed:
+        tmp_path = output_file + f'.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, output_file)
+    # JSON файлът се записва последен, така че не е по-стар от Markdown изгледа (виж read_timeline)
+    save_timeline(json_path_for(output_file), document)
+    
+    changes = {
+        'changed': changed,
+        'added': added,
+        'removed': removed,
+        'edited': edited,
+        'dirty': dirty,
+        'rewritten': not patchable,
+        'timeline': merged
+    }
+    print(f"Таймлайн {output_file}: {len(changed)} променени, {len(added)} добавени, "
+          f"{len(removed)} премахнати записа"
+          + (f", {len(edited)} запазени ръчни редакции" if edited else "")
+          + (" (файлът е генериран наново)" if not patchable and current is not None else ""))
+    return changes
+
+def add_timeline_arguments(parser):
+    """Добавя --overwrite-edits към argparse парсер"""
+    parser.add_argument('--overwrite-edits', action='store_true',
+                        help='презаписване и на ръчно редактираните записи в Timeline.md')